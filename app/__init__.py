@@ -123,6 +123,30 @@ def create_app():
     app.config['WTF_CSRF_ENABLED'] = True
     app.config['WTF_CSRF_TIME_LIMIT'] = 3600
 
+    from .upload_utils import MAX_ROWS, MAX_UPLOAD_SIZE
+
+    # Background imports run on a small in-process thread pool, so no broker is needed.
+    app.config['IMPORT_JOB_WORKERS'] = int(os.environ.get('IMPORT_JOB_WORKERS', '2'))
+    app.config['IMPORT_UPLOAD_FOLDER'] = os.environ.get('IMPORT_UPLOAD_FOLDER') or os.path.join(app.instance_path, 'imports')
+    # Queued or running imports with no progress for this long were lost with their worker.
+    app.config['IMPORT_STALE_JOB_SECONDS'] = int(os.environ.get('IMPORT_STALE_JOB_SECONDS', '1800'))
+    # Uploads are spooled to disk, so the byte cap can be raised without growing worker memory.
+    app.config['IMPORT_MAX_UPLOAD_SIZE'] = int(os.environ.get('IMPORT_MAX_UPLOAD_SIZE', str(MAX_UPLOAD_SIZE)))
+    app.config['IMPORT_MAX_ROWS'] = int(os.environ.get('IMPORT_MAX_ROWS', str(MAX_ROWS)))
+    # Report results are cached per worker and invalidated through the table_version table.
+    app.config['REPORT_CACHE_MAX_ENTRIES'] = int(os.environ.get('REPORT_CACHE_MAX_ENTRIES', '256'))
+    app.config['REPORT_CACHE_MAX_BYTES'] = int(os.environ.get('REPORT_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+    # Independent report queries run concurrently, each on its own pooled connection.
+    app.config['REPORT_QUERY_WORKERS'] = int(os.environ.get('REPORT_QUERY_WORKERS', '4'))
+    # Calling code given to phone numbers typed without an international prefix.
+    app.config['PHONE_COUNTRY_CODE'] = os.environ.get('PHONE_COUNTRY_CODE', '20')
+    # Spreadsheet exports over this many cells (rows x columns) are written by a background job.
+    app.config['XLSX_BACKGROUND_CELLS'] = int(os.environ.get('XLSX_BACKGROUND_CELLS', '100000'))
+    app.config['EXPORT_JOB_WORKERS'] = int(os.environ.get('EXPORT_JOB_WORKERS', '1'))
+    app.config['EXPORT_FOLDER'] = os.environ.get('EXPORT_FOLDER') or os.path.join(app.instance_path, 'exports')
+    # Written export files are deleted this long after they finish.
+    app.config['EXPORT_RETENTION_SECONDS'] = int(os.environ.get('EXPORT_RETENTION_SECONDS', str(24 * 60 * 60)))
+
     if not is_production:
         # --- Allow session cookies over local network (192.168.x.x) ---
           app.config['SESSION_COOKIE_DOMAIN'] = None
@@ -164,7 +188,13 @@ def create_app():
         from .routes.dashboard import dashboard_bp
         from .routes.reports import reports_bp
         from .routes.imports import imports_bp
+        from .routes.exports import exports_bp
         from .routes.settings import settings_bp  
+        from .services.revenue_summary import rebuild_revenue_summary, rebuild_revenue_summary_command
+        from .services.report_cache import ensure_table_versions, init_report_cache
+        from .services.dashboard_counters import reconcile_counters_command
+        from .services.customer_search import init_customer_search, rebuild_search_index_command
+        from .services.phone_keys import backfill_phone_keys_command
 
         # --- Register Blueprints ---
         app.register_blueprint(auth_bp)
@@ -172,13 +202,19 @@ def create_app():
         app.register_blueprint(dashboard_bp)
         app.register_blueprint(reports_bp)
         app.register_blueprint(imports_bp)
+        app.register_blueprint(exports_bp)
         app.register_blueprint(settings_bp)
+        app.cli.add_command(rebuild_revenue_summary_command)
+        app.cli.add_command(reconcile_counters_command)
+        app.cli.add_command(rebuild_search_index_command)
+        app.cli.add_command(backfill_phone_keys_command)
+        init_report_cache(app)
         
         @login_manager.user_loader
         def load_user(user_id):
             return models.User.query.get(int(user_id))
 
-        from .models import User, Currency, PaymentMethod
+        from .models import User, Currency, PaymentMethod, Payment, RevenueSummary, DashboardCounter, Customer
         db.create_all()
 
         if not Currency.query.first():
@@ -194,6 +230,18 @@ def create_app():
             ])
             db.session.commit()
 
+        ensure_table_versions()
+
+        # Backfill the revenue summary once for databases that predate it.
+        if RevenueSummary.query.first() is None and Payment.query.first() is not None:
+            rebuild_revenue_summary()
+
+        # Databases that predate the dashboard counters are counted once from the CLI.
+        if DashboardCounter.query.first() is None and Customer.query.first() is not None:
+            app.logger.warning("Dashboard counters are empty; run `flask reconcile-counters` to count existing rows.")
+
+        init_customer_search(app)
+
 
 
 
@@ -2,15 +2,42 @@ from flask import Blueprint, render_template, request, redirect, url_for, jsonif
 from flask_login import login_required, current_user
 from sqlalchemy import func
 from sqlalchemy.orm import joinedload
-import pandas as pd
-import io
-import csv
-from flask import Response
+from datetime import date
+from flask import Response, stream_with_context
 
 # Import models and db instance from the main application package
-from .models import Customer, University, College, Country, Subject, Instructor, Term, Module, Payment, CommunicationLog, Currency, PaymentMethod, CollegeYear
+from .models import Customer, University, College, Country, Subject, Instructor, Term, Module, Payment, CommunicationLog, Currency, PaymentMethod, CollegeYear, ImportJob
 from . import db
-from .upload_utils import parse_import_file, UploadError
+from .upload_utils import stream_import_file, UploadError
+from .services.analytics_snapshot import DEFAULT_PIVOT_LIMIT, DIMENSIONS, MAX_GROUP_BY, MAX_PIVOT_LIMIT, MEASURES, get_snapshot, pivot
+from .services.customer_list import DEFAULT_SORT, SORTS, SORT_ORDERS, list_customers
+from .services.import_jobs import create_import_job, fail_stale_jobs, find_duplicate_job, run_customer_import
+from .services.import_service import IMPORT_MODES
+from .services.query_fanout import gather
+from .services.report_cache import cached_report
+from .services.report_service import (
+    APPLICATION_REPORT_TABLES,
+    INSTRUCTOR_REPORT_TABLES,
+    REPORTS_HUB_TABLES,
+    InvalidCursor,
+    application_criteria,
+    application_structure_totals,
+    application_unique_students,
+    build_application_tree,
+    build_customer_history,
+    build_location_tree,
+    comm_log_page,
+    customer_payment_kpis,
+    customer_payment_page,
+    customer_subject_totals,
+    instructor_subject_totals,
+    instructor_unique_students,
+    page_size,
+    payment_page,
+    structure_criteria,
+    subject_total_page,
+)
+from .services.segment_export import SEGMENT_HEADER, csv_chunks, iter_segment_rows
 
 
 # Create the blueprint
@@ -38,16 +65,26 @@ def segmentation():
 @main_bp.route('/reports')
 @login_required
 def reports_hub():
-    # Fetch data for all report panels on the page
-    all_instructors = Instructor.query.order_by(Instructor.name).all()
-    all_universities = University.query.order_by(University.name).all()
-    # Eagerly load the university relationship to prevent extra queries in the template
-    all_colleges = College.query.options(joinedload(College.university)).order_by(College.name).all()
-    
-    return render_template('reports_hub.html', 
-                           instructors=all_instructors,
-                           all_universities=all_universities,
-                           all_colleges=all_colleges)
+    report_options = cached_report('reports_hub', REPORTS_HUB_TABLES, {}, _reports_hub_options)
+    return render_template('reports_hub.html', **report_options)
+
+
+def _reports_hub_options():
+    """Dropdown options for all report panels on the hub, as plain data for the report cache."""
+    return gather({
+        'instructors': lambda: [
+            {'id': instructor.id, 'name': instructor.name, 'email': instructor.email}
+            for instructor in Instructor.query.order_by(Instructor.name)
+        ],
+        'all_universities': lambda: [
+            {'id': university.id, 'name': university.name}
+            for university in University.query.order_by(University.name)
+        ],
+        'all_colleges': lambda: [
+            {'id': college.id, 'name': college.name, 'university': {'name': college.university.name}}
+            for college in College.query.options(joinedload(College.university)).order_by(College.name)
+        ],
+    })
 
 
 @main_bp.route('/add_country', methods=['POST'])
@@ -245,8 +282,13 @@ def import_customers():
         )
         return render_template('settings/import.html', active_tab='import'), 400
 
+    import_mode = request.form.get('import_mode', 'insert')
+    if import_mode not in IMPORT_MODES:
+        flash('Unknown import mode.', 'danger')
+        return render_template('settings/import.html', active_tab='import'), 400
+
     try:
-        parsed_upload = parse_import_file(file)
+        upload = stream_import_file(file)
     except UploadError as err:
         current_app.logger.warning(
             "Customer import rejected: user_id=%s filename=%s reason=%s",
@@ -257,97 +299,44 @@ def import_customers():
         flash(err.user_message, 'danger')
         return render_template('settings/import.html', active_tab='import'), err.status_code
 
-    df = parsed_upload.dataframe
-    sanitized_filename = parsed_upload.filename
-    file_size = parsed_upload.file_size
-    row_count = parsed_upload.row_count
-
-    if df.empty:
-        flash('Uploaded file does not contain any rows to import.', 'warning')
-        current_app.logger.info(
-            "Customer import empty: user_id=%s filename=%s size=%s bytes",
-            getattr(current_user, 'id', 'anonymous'),
-            sanitized_filename,
-            file_size,
-        )
-        return render_template('settings/import.html', active_tab='import'), 400
-
-    def normalise_text(value):
-        if value is None:
-            return ''
-        if isinstance(value, str):
-            return value.strip()
-        if pd.isna(value):
-            return ''
-        return str(value).strip()
-
-    def optional_value(value):
-        if value is None:
-            return None
-        if isinstance(value, str):
-            text = value.strip()
-            return text or None
-        if pd.isna(value):
-            return None
-        return value
-
-    new_customers = []
-    errors = []
-
-    all_colleges = College.query.options(
-        joinedload(College.university).joinedload(University.country)
-    ).all()
-
-    college_map = {
-        (c.university.country.name.lower(), c.university.name.lower(), c.name.lower()): c.id
-        for c in all_colleges
-    }
-    for index, row in df.iterrows():
-        country_name = normalise_text(row.get('country')).lower()
-        university_name = normalise_text(row.get('university')).lower()
-        college_name = normalise_text(row.get('college')).lower()
-        full_name = normalise_text(row.get('full_name'))
-
-        if not full_name:
-            errors.append(f"Row {index + 2}: Missing required full_name value.")
-            continue
-
-        college_id = college_map.get((country_name, university_name, college_name))
-
-        if not college_id:
-            errors.append(
-                f"Row {index + 2}: Could not find College '{row.get('college')}' in University '{row.get('university')}' / Country '{row.get('country')}'."
+    sanitized_filename = upload.filename
+    file_size = upload.file_size
+    if request.form.get('confirm_duplicate') != '1':
+        fail_stale_jobs()
+        earlier = find_duplicate_job('customers', upload.content_hash, current_user.id, import_mode)
+        if earlier is not None:
+            upload.close()
+            flash(
+                f"{sanitized_filename} was already imported (job #{earlier.id}, {earlier.status}); showing that result. "
+                "Tick \"Import again\" to import it a second time.",
+                'warning',
             )
-            continue
-
-        customer = Customer(
-            full_name=full_name,
-            email=optional_value(row.get('email')),
-            whatsapp_number=optional_value(row.get('whatsapp_number')),
-            year=optional_value(row.get('year')),
-            college_id=college_id
-        )
-        new_customers.append(customer)
+            current_app.logger.info(
+                "Customer import skipped as duplicate: user_id=%s filename=%s earlier_job=%s",
+                current_user.id,
+                sanitized_filename,
+                earlier.id,
+            )
+            return redirect(url_for('settings.import_settings', active_tab='import', job_id=earlier.id))
+
+    job_id = create_import_job(
+        'customers', sanitized_filename, file_size, current_user.id, mode=import_mode, content_hash=upload.content_hash
+    )
 
-    if not new_customers:
-        for error in errors:
-            flash(error, 'danger')
+    try:
+        # Each chunk is validated and committed before the next one is parsed;
+        # rejected rows go to the job's error report instead of the session.
+        result = run_customer_import(job_id, upload.chunks, import_mode)
+    except UploadError as err:
         current_app.logger.warning(
-            "Customer import rejected: user_id=%s filename=%s reason=no valid rows",
+            "Customer import rejected: user_id=%s filename=%s reason=%s",
             getattr(current_user, 'id', 'anonymous'),
             sanitized_filename,
+            err.log_message,
         )
-        return render_template('settings/import.html', active_tab='import'), 400
-
-    if errors:
-        for error in errors:
-            flash(error, 'warning')
-
-    try:
-        db.session.bulk_save_objects(new_customers)
-        db.session.commit()
+        flash(err.user_message, 'danger')
+        return render_template('settings/import.html', active_tab='import', last_job=db.session.get(ImportJob, job_id)), err.status_code
     except Exception as e:
-        db.session.rollback()
         current_app.logger.exception(
             "Customer import failed during database commit: user_id=%s filename=%s error=%s",
             getattr(current_user, 'id', 'anonymous'),
@@ -355,23 +344,42 @@ def import_customers():
              str(e)  # ADD THIS to see the actual error
         )
         flash(f'Database error: {str(e)}', 'danger')  # SHOW the error to help debug
-        return render_template('settings/import.html', active_tab='import'), 500
+        return render_template('settings/import.html', active_tab='import', last_job=db.session.get(ImportJob, job_id)), 500
+    finally:
+        upload.close()
+
+    if result.rows == 0:
+        flash('Uploaded file does not contain any rows to import.', 'warning')
+        current_app.logger.info(
+            "Customer import empty: user_id=%s filename=%s size=%s bytes",
+            getattr(current_user, 'id', 'anonymous'),
+            sanitized_filename,
+            file_size,
+        )
+        return render_template('settings/import.html', active_tab='import'), 400
 
-    success_message = f"Successfully imported {len(new_customers)} customers."
-    if errors:
-        success_message += f" Skipped {len(errors)} rows with validation errors."
+    if not (result.inserted or result.updated or result.existing):
+        flash(f"No customers were imported. All {result.skipped} rows had validation errors.", 'danger')
+        current_app.logger.warning(
+            "Customer import rejected: user_id=%s filename=%s reason=no valid rows",
+            getattr(current_user, 'id', 'anonymous'),
+            sanitized_filename,
+        )
+        return render_template('settings/import.html', active_tab='import', last_job=db.session.get(ImportJob, job_id)), 400
 
-    flash(success_message, 'success')
+    flash(result.summary, 'success')
     current_app.logger.info(
-        "Customer import succeeded: user_id=%s filename=%s size=%s bytes rows=%s inserted=%s skipped=%s",
+        "Customer import succeeded: user_id=%s filename=%s size=%s bytes mode=%s rows=%s inserted=%s updated=%s skipped=%s",
         getattr(current_user, 'id', 'anonymous'),
         sanitized_filename,
         file_size,
-        row_count,
-        len(new_customers),
-        len(errors),
+        import_mode,
+        result.rows,
+        result.inserted,
+        result.updated,
+        result.skipped,
     )
-    return redirect(url_for('settings.import_settings', active_tab='import'))
+    return redirect(url_for('settings.import_settings', active_tab='import', job_id=job_id))
 
 
 
@@ -457,7 +465,7 @@ def add_customer():
     new_customer = Customer(
         full_name=request.form['full_name'],
         email=request.form.get('email'),  # Use .get() for optional fields
-        whatsapp_number=request.form.get('whatsapp_number'),
+        whatsapp_number=request.form.get('whatsapp_number') or None,
         year=request.form.get('year', type=int), # Get year as an integer
         college_id=request.form['college_id']
     )
@@ -469,94 +477,75 @@ def add_customer():
 @main_bp.route('/view')
 @login_required
 def view_customers():
-    # This query joins all the tables to get all the data we need
-    all_customers = Customer.query.options(
-        joinedload(Customer.college)
-        .joinedload(College.university)
-        .joinedload(University.country)
-    ).all()
+    # Only the first page is rendered; the table asks /api/filter_customers for the
+    # next pages and for re-sorted or filtered results.
+    sort = request.args.get('sort', DEFAULT_SORT)
+    order = request.args.get('order', 'asc')
+    if sort not in SORTS or order not in SORT_ORDERS:
+        sort, order = DEFAULT_SORT, 'asc'
+    listing = list_customers(
+        {}, sort, order,
+        limit=page_size(request.args.get('limit', type=int)),
+        count=request.args.get('count', '1') != '0',
+    )
 
     # We also need to get all countries for the filter dropdown
     all_countries = Country.query.order_by(Country.name).all()
-    return render_template('view_customers.html', customers=all_customers, countries=all_countries)
+    return render_template('view_customers.html', **listing, order=order, countries=all_countries)
 
 
 @main_bp.route('/customer/<int:customer_id>')
 @login_required
 def customer_profile(customer_id):
-    customer = db.session.get(Customer, customer_id)
+    customer = db.session.get(
+        Customer, customer_id, options=[joinedload(Customer.college).joinedload(College.university)]
+    )
     if customer is None:
         abort(404)
-    
-    # Eagerly load all necessary related data in one go for performance
-    all_payments = customer.payments.options(
-        joinedload(Payment.subject).joinedload(Subject.term_info),
-        joinedload(Payment.subject).joinedload(Subject.module_info),
-        joinedload(Payment.subject)
-        .joinedload(Subject.college)
-        .joinedload(College.university)
-        .joinedload(University.country)
-    ).order_by(Payment.payment_date.desc()).all()
-    
-    # --- 1. Calculate KPI Stat Card data (this part remains the same) ---
-    total_paid = sum(p.course_price_paid + p.application_price_paid for p in all_payments)
-    total_payments_count = len(all_payments)
-    first_payment_date = min((p.payment_date for p in all_payments), default=None)
-
-    # --- 2. NEW: Organize Payment History by Year -> Term/Module -> Subject ---
-    # The new structure will be: { year: { 'terms': { term_name: { 'subjects': { ... } } }, 'modules': { ... } } }
-    payment_history = {}
-    for payment in all_payments:
-        subject = payment.subject
-        if not subject: continue
-
-        year = subject.year
-        structure_name = ""
-        structure_type = ""
-
-        if subject.term_info:
-            structure_name = subject.term_info.name
-            structure_type = 'terms'
-        elif subject.module_info:
-            structure_name = subject.module_info.name
-            structure_type = 'modules'
-        else:
-            structure_name = "General" # Fallback for older data
-            structure_type = 'terms'
 
-        # Create dictionaries if they don't exist
-        if year not in payment_history:
-            payment_history[year] = {'total': 0, 'terms': {}, 'modules': {}}
-        
-        if structure_name not in payment_history[year][structure_type]:
-            payment_history[year][structure_type][structure_name] = {'total': 0, 'subjects': {}}
-
-        if subject.id not in payment_history[year][structure_type][structure_name]['subjects']:
-            payment_history[year][structure_type][structure_name]['subjects'][subject.id] = {
-                'details': subject,
-                'total': 0,
-                'payments': []
-            }
-
-        # Add the payment and update totals
-        payment_amount = payment.course_price_paid + payment.application_price_paid
-        payment_history[year]['total'] += payment_amount
-        payment_history[year][structure_type][structure_name]['total'] += payment_amount
-        payment_history[year][structure_type][structure_name]['subjects'][subject.id]['total'] += payment_amount
-        payment_history[year][structure_type][structure_name]['subjects'][subject.id]['payments'].append(payment)
-
-    # Get the total number of unique subjects they've paid for
-    total_subjects_enrolled = len(set(p.subject_id for p in all_payments))
-
-    return render_template('customer_profile.html', 
+    # KPI cards come from one aggregate query and the Year -> Term/Module -> Subject
+    # timeline from per-subject totals; payments and notes are loaded a page at a time.
+    return render_template('customer_profile.html',
                            customer=customer,
-                           total_paid=total_paid,
-                           total_payments_count=total_payments_count,
-                           total_subjects_enrolled=total_subjects_enrolled,
-                           first_payment_date=first_payment_date,
-                           # Pass the NEW hierarchical history
-                           payment_history=payment_history,
-                           CommunicationLog=CommunicationLog)
+                           payment_history=build_customer_history(customer_subject_totals(customer_id)),
+                           **customer_payment_kpis(customer_id))
+
+
+@main_bp.route('/customer/<int:customer_id>/payments')
+@login_required
+def customer_payments(customer_id):
+    """One customer's payments, optionally for one ``subject_id``, one keyset page at a time."""
+    criteria = []
+    subject_id = request.args.get('subject_id', type=int)
+    if subject_id is not None:
+        criteria.append(Payment.subject_id == subject_id)
+    try:
+        payments, next_cursor = customer_payment_page(
+            customer_id,
+            *criteria,
+            cursor=request.args.get('cursor'),
+            limit=page_size(request.args.get('limit', type=int)),
+        )
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor.'}), 400
+    return jsonify({'items': payments, 'next_cursor': next_cursor})
+
+
+@main_bp.route('/customer/<int:customer_id>/notes')
+@login_required
+def customer_notes(customer_id):
+    """One customer's notes, newest first, one keyset page at a time."""
+    try:
+        notes, next_cursor = comm_log_page(
+            customer_id,
+            cursor=request.args.get('cursor'),
+            limit=page_size(request.args.get('limit', type=int)),
+        )
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor.'}), 400
+    for note in notes:
+        note['delete_url'] = url_for('main.delete_note', note_id=note['id'])
+    return jsonify({'items': notes, 'next_cursor': next_cursor})
 
 
 @main_bp.route('/customer/<int:customer_id>/add_note', methods=['POST'])
@@ -598,184 +587,166 @@ def delete_note(note_id):
 def instructor_report(instructor_id):
     instructor = Instructor.query.get_or_404(instructor_id)
 
-    subject_ids = [s.id for s in instructor.subjects]
+    report = cached_report(
+        'instructor_report', INSTRUCTOR_REPORT_TABLES, {'instructor_id': instructor_id},
+        lambda: _instructor_report_data(instructor_id),
+    )
+    return render_template('instructor_report.html', instructor=instructor, **report)
+
+
+def _instructor_report_data(instructor_id):
+    # Totals are grouped in SQL; payments are fetched per subject when a row is expanded.
+    subject_rows = instructor_subject_totals(instructor_id)
+    report_data = {
+        row['subject_id']: {
+            'subject_id': row['subject_id'],
+            'name': row['name'],
+            'year': row['year'],
+            'subject_revenue': row['revenue'],
+            'payment_count': row['payment_count'],
+        }
+        for row in subject_rows
+    }
+
+    return {
+        'report_data': report_data,
+        'total_instructor_revenue': sum(row['revenue'] for row in subject_rows),
+        'total_unique_students': instructor_unique_students(instructor_id) if subject_rows else 0,
+        'total_paid_subjects': len(subject_rows),
+        'location_revenue_data': build_location_tree(subject_rows),
+    }
+
+
+@main_bp.route('/instructor_report/<int:instructor_id>/payments')
+@login_required
+def instructor_subject_payments(instructor_id):
+    """Payments behind one subject node of the instructor report, one keyset page at a time."""
+    subject_ids = request.args.getlist('subject_id', type=int)
     if not subject_ids:
-        return render_template('instructor_report.html', instructor=instructor, report_data={}, location_revenue_data={}, total_instructor_revenue=0, total_unique_students=0, total_paid_subjects=0)
-
-    # --- UPDATED: Eagerly load all the new relationships ---
-    all_payments = Payment.query.filter(Payment.subject_id.in_(subject_ids)).options(
-        joinedload(Payment.subject).joinedload(Subject.college).joinedload(College.university).joinedload(University.country),
-        joinedload(Payment.subject).joinedload(Subject.term_info),
-        joinedload(Payment.subject).joinedload(Subject.module_info),
-        joinedload(Payment.customer)
-    ).all()
-
-    # --- 1. Calculate Overall Summary Stats (remains the same) ---
-    total_instructor_revenue = sum(p.course_price_paid for p in all_payments)
-    total_unique_students = len(set(p.customer_id for p in all_payments))
-    total_paid_subjects = len(set(p.subject_id for p in all_payments))
-
-    # --- 2. Build Data for "Revenue by Subject" Tab (remains the same) ---
-    report_data = {}
-    for payment in all_payments:
-        if not payment.subject: continue
-        if payment.subject_id not in report_data:
-            report_data[payment.subject_id] = {'subject_details': payment.subject, 'subject_revenue': 0, 'payments': []}
-        report_data[payment.subject_id]['subject_revenue'] += payment.course_price_paid
-        report_data[payment.subject_id]['payments'].append(payment)
-
-    # --- 3. NEW: Build Data for "Revenue by Location" with correct hierarchy ---
-    location_revenue_data = {}
-    for payment in all_payments:
-        subject = payment.subject
-        if not (subject and subject.college and subject.college.university and subject.college.university.country):
-            continue
-
-        price = payment.course_price_paid
-        country = subject.college.university.country.name
-        university = subject.college.university.name
-        college = subject.college.name
-        year = subject.year
-        
-        # Determine the structure (Term or Module)
-        structure_name = "General"
-        structure_type = 'terms'
-        if subject.term_info:
-            structure_name = subject.term_info.name
-            structure_type = 'terms'
-        elif subject.module_info:
-            structure_name = subject.module_info.name
-            structure_type = 'modules'
-
-        # Levels 1-3 (Country, University, College)
-        if country not in location_revenue_data: location_revenue_data[country] = {'total': 0, 'universities': {}}
-        location_revenue_data[country]['total'] += price
-        uni_dict = location_revenue_data[country]['universities']
-        if university not in uni_dict: uni_dict[university] = {'total': 0, 'colleges': {}}
-        uni_dict[university]['total'] += price
-        coll_dict = uni_dict[university]['colleges']
-        if college not in coll_dict: coll_dict[college] = {'total': 0, 'years': {}}
-        coll_dict[college]['total'] += price
-
-        # Level 4: Year
-        year_dict = coll_dict[college]['years']
-        if year not in year_dict: year_dict[year] = {'total': 0, 'terms': {}, 'modules': {}}
-        year_dict[year]['total'] += price
-
-        # Level 5: Term/Module
-        structure_dict = year_dict[year][structure_type]
-        if structure_name not in structure_dict: structure_dict[structure_name] = {'total': 0, 'subjects': {}}
-        structure_dict[structure_name]['total'] += price
-
-        # Level 6: Subject
-        subj_dict = structure_dict[structure_name]['subjects']
-        if subject.name not in subj_dict: subj_dict[subject.name] = {'total': 0, 'payments': []}
-        subj_dict[subject.name]['total'] += price
-        subj_dict[subject.name]['payments'].append(payment)
-
-    return render_template('instructor_report.html',
-                           instructor=instructor,
-                           report_data=report_data,
-                           total_instructor_revenue=total_instructor_revenue,
-                           total_unique_students=total_unique_students,
-                           total_paid_subjects=total_paid_subjects,
-                           location_revenue_data=location_revenue_data)
+        return jsonify({'error': 'subject_id is required.'}), 400
+    return _payment_drilldown(Subject.instructor_id == instructor_id, Payment.subject_id.in_(subject_ids))
+
+
+def _payment_drilldown(*criteria, amount=Payment.course_price_paid):
+    """JSON page of payments for a report drill-down; ``cursor`` and ``limit`` come from the query string."""
+    try:
+        payments, next_cursor = payment_page(
+            *criteria,
+            amount=amount,
+            cursor=request.args.get('cursor'),
+            limit=page_size(request.args.get('limit', type=int)),
+        )
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor.'}), 400
+    for payment in payments:
+        payment['customer_url'] = url_for('main.customer_profile', customer_id=payment['customer_id'])
+    return jsonify({'items': payments, 'next_cursor': next_cursor})
 
 
 @main_bp.route('/application_report')
 @login_required
 def application_report():
-    # --- 1. Start with a base query for all payments with an application fee ---
-    query = Payment.query.filter(Payment.application_price_paid > 0).options(
-        joinedload(Payment.subject).joinedload(Subject.college).joinedload(College.university),
-        joinedload(Payment.subject).joinedload(Subject.term_info),
-        joinedload(Payment.subject).joinedload(Subject.module_info),
-        joinedload(Payment.customer)
-    )
-
-    # --- 2. Get and Apply Filters from the URL ---
     year_filter = request.args.get('year', type=int)
     university_id_filter = request.args.get('university_id', type=int)
     college_id_filter = request.args.get('college_id', type=int)
+    filters = (year_filter, university_id_filter, college_id_filter)
 
-    if college_id_filter:
-        query = query.join(Subject).filter(Subject.college_id == college_id_filter)
-    elif university_id_filter:
-        query = query.join(Subject).join(College).filter(College.university_id == university_id_filter)
-    
-    if year_filter:
-        query = query.join(Subject).filter(Subject.year == year_filter)
-
-    all_payments = query.all()
-
-    # --- 3. Calculate Overall Summary Stats ---
-    total_app_revenue = sum(p.application_price_paid for p in all_payments)
-    total_applications = len(all_payments)
-    total_unique_students = len(set(p.customer_id for p in all_payments))
-
-    # --- 4. NEW: Build Hierarchical Data with correct structure ---
-    report_data = {}
-    for payment in all_payments:
-        subject = payment.subject
-        if not (subject and subject.college and subject.college.university):
-            continue
-
-        price = payment.application_price_paid
-        pay_year = subject.year
-        uni_name = subject.college.university.name
-        coll_name = subject.college.name
-        
-        structure_name = "General"
-        structure_type = 'terms'
-        if subject.term_info:
-            structure_name = subject.term_info.name
-            structure_type = 'terms'
-        elif subject.module_info:
-            structure_name = subject.module_info.name
-            structure_type = 'modules'
-
-        # Level 1: Year
-        if pay_year not in report_data:
-            report_data[pay_year] = {'total': 0, 'universities': {}}
-        report_data[pay_year]['total'] += price
-        
-        # Level 2: University
-        uni_dict = report_data[pay_year]['universities']
-        if uni_name not in uni_dict:
-            uni_dict[uni_name] = {'total': 0, 'colleges': {}}
-        uni_dict[uni_name]['total'] += price
-        
-        # Level 3: College
-        coll_dict = uni_dict[uni_name]['colleges']
-        if coll_name not in coll_dict:
-            coll_dict[coll_name] = {'total': 0, 'terms': {}, 'modules': {}}
-        coll_dict[coll_name]['total'] += price
-        
-        # Level 4: Term/Module
-        structure_dict = coll_dict[coll_name][structure_type]
-        if structure_name not in structure_dict:
-            structure_dict[structure_name] = {'total': 0, 'subjects': {}}
-        structure_dict[structure_name]['total'] += price
-        
-        # Level 5: Subject
-        subj_dict = structure_dict[structure_name]['subjects']
-        if subject.name not in subj_dict:
-            subj_dict[subject.name] = {'total': 0, 'payments': []}
-        subj_dict[subject.name]['total'] += price
-        
-        # Level 6: Individual Payment
-        subj_dict[subject.name]['payments'].append(payment)
-
-    # --- 5. Pass all the processed data to the template ---
+    report = cached_report(
+        'application_report', APPLICATION_REPORT_TABLES,
+        {'year': year_filter, 'university_id': university_id_filter, 'college_id': college_id_filter},
+        lambda: _application_report_data(*filters),
+    )
     return render_template('application_report.html',
-                           report_data=report_data,
-                           total_app_revenue=total_app_revenue,
-                           total_applications=total_applications,
-                           total_unique_students=total_unique_students,
+                           **report,
                            year_filter=year_filter,
                            university_id_filter=university_id_filter,
                            college_id_filter=college_id_filter)
 
+
+def _application_report_data(year, university_id, college_id):
+    # Totals are grouped in SQL down to Term/Module; subjects and payments are drilled into on demand.
+    structure_rows = application_structure_totals(year, university_id, college_id)
+    return {
+        'report_data': build_application_tree(structure_rows),
+        'total_app_revenue': sum(row['total'] for row in structure_rows),
+        'total_applications': sum(row['payment_count'] for row in structure_rows),
+        'total_unique_students': application_unique_students(year, university_id, college_id) if structure_rows else 0,
+    }
+
+
+@main_bp.route('/application_report/subjects')
+@login_required
+def application_report_subjects():
+    """Subject totals under one College → Year → Term/Module node of the application report."""
+    college_ids = request.args.getlist('college_id', type=int)
+    year = request.args.get('year', type=int)
+    if not college_ids or year is None:
+        return jsonify({'error': 'college_id and year are required.'}), 400
+
+    criteria = application_criteria() + structure_criteria(
+        college_ids, year, request.args.getlist('term_id', type=int), request.args.getlist('module_id', type=int)
+    )
+    try:
+        subjects, next_cursor = subject_total_page(
+            *criteria,
+            amount=Payment.application_price_paid,
+            cursor=request.args.get('cursor'),
+            limit=page_size(request.args.get('limit', type=int)),
+        )
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor.'}), 400
+    for subject in subjects:
+        subject['payments_url'] = url_for('main.application_report_payments', subject_id=subject['subject_id'])
+    return jsonify({'items': subjects, 'next_cursor': next_cursor})
+
+
+@main_bp.route('/application_report/payments')
+@login_required
+def application_report_payments():
+    """Application fee payments for one subject of the application report."""
+    subject_id = request.args.get('subject_id', type=int)
+    if subject_id is None:
+        return jsonify({'error': 'subject_id is required.'}), 400
+    return _payment_drilldown(*application_criteria(), Payment.subject_id == subject_id, amount=Payment.application_price_paid)
+
+
+@main_bp.route('/api/analytics/pivot')
+@login_required
+def analytics_pivot():
+    """Group-by/filter pivot over this worker's in-memory payments snapshot.
+
+    ``group_by`` (up to ``MAX_GROUP_BY``) and ``measures`` are comma-separated names
+    from ``DIMENSIONS`` and ``MEASURES``. Any dimension may also be passed as a filter,
+    repeated for several labels, and ``start``/``end`` bound the payment date.
+    """
+    group_by = [name for name in request.args.get('group_by', '').split(',') if name]
+    measures = [name for name in request.args.get('measures', 'total').split(',') if name]
+    unknown = [name for name in group_by if name not in DIMENSIONS] + [name for name in measures if name not in MEASURES]
+    if unknown:
+        return jsonify({'error': f"Unknown dimension or measure: {', '.join(unknown)}."}), 400
+    if len(group_by) > MAX_GROUP_BY or len(set(group_by)) < len(group_by):
+        return jsonify({'error': f"group_by takes up to {MAX_GROUP_BY} distinct dimensions."}), 400
+    if not measures:
+        return jsonify({'error': 'At least one measure is required.'}), 400
+    try:
+        start = date.fromisoformat(request.args['start']) if request.args.get('start') else None
+        end = date.fromisoformat(request.args['end']) if request.args.get('end') else None
+    except ValueError:
+        return jsonify({'error': 'start and end must be dates like 2024-09-01.'}), 400
+    limit = min(max(request.args.get('limit', DEFAULT_PIVOT_LIMIT, type=int), 1), MAX_PIVOT_LIMIT)
+    filters = {name: request.args.getlist(name) for name in DIMENSIONS if name in request.args}
+
+    snapshot = get_snapshot(current_app._get_current_object())
+    frame = snapshot.refresh()
+    result = pivot(frame, group_by, measures, filters, start, end, limit)
+    return jsonify({
+        'group_by': group_by,
+        'measures': measures,
+        **result,
+        'snapshot': {'payments': len(frame), 'loaded_at': snapshot.loaded_at.isoformat()},
+    })
+
+
 @main_bp.route('/delete_customer/<int:customer_id>', methods=['POST'])
 @login_required
 def delete_customer(customer_id):
@@ -794,7 +765,7 @@ def edit_customer(customer_id):
         # This is the logic to UPDATE the customer in the database
         customer_to_edit.full_name = request.form['full_name']
         customer_to_edit.email = request.form.get('email')
-        customer_to_edit.whatsapp_number = request.form.get('whatsapp_number')
+        customer_to_edit.whatsapp_number = request.form.get('whatsapp_number') or None
         customer_to_edit.year = request.form.get('year', type=int)
         customer_to_edit.college_id = request.form['college_id']
         db.session.commit()
@@ -1000,50 +971,31 @@ def get_subjects():
 @main_bp.route('/api/filter_customers')
 @login_required
 def filter_customers():
-    # Start with a query for all customers
-    query = Customer.query.join(College).join(University).join(Country)
-
-    # Get filter values from the request arguments
-    country_id = request.args.get('country_id')
-    university_id = request.args.get('university_id')
-    college_id = request.args.get('college_id')
-    name_search = request.args.get('name')
-    email_search = request.args.get('email')
-    phone_search = request.args.get('phone')
-
-    # Apply filters to the query if they exist
-    if country_id:
-        query = query.filter(Country.id == country_id)
-    if university_id:
-        query = query.filter(University.id == university_id)
-    if college_id:
-        query = query.filter(College.id == college_id)
-    
-    # Apply search filters using 'ilike' for case-insensitive partial matching
-    if name_search:
-        query = query.filter(Customer.full_name.ilike(f'%{name_search}%'))
-    if email_search:
-        query = query.filter(Customer.email.ilike(f'%{email_search}%'))
-    if phone_search:
-        query = query.filter(Customer.whatsapp_number.ilike(f'%{phone_search}%'))
-
-    # Execute the final query
-    filtered_customers = query.all()
+    """One page of customers matching the location and search filters.
+
+    ``sort`` is one of ``SORTS`` and ``order`` asc or desc; searches default to
+    ``relevance``, best matches first, unless they match too many customers to rank
+    (the returned ``sort`` says which order was used). Pass the returned
+    ``next_cursor`` as ``cursor`` for the following page. ``total`` counts every
+    match unless ``count=0``, which skips the count query (e.g. for later pages).
+    """
+    sort = request.args.get('sort')
+    order = request.args.get('order', 'asc')
+    if sort is not None and sort not in SORTS:
+        return jsonify({'error': f"sort must be one of {', '.join(SORTS)}."}), 400
+    if order not in SORT_ORDERS:
+        return jsonify({'error': 'order must be asc or desc.'}), 400
 
-    # Convert the results into a list of dictionaries to send as JSON
-    customer_list = []
-    for customer in filtered_customers:
-        customer_list.append({
-            'id': customer.id,
-            'full_name': customer.full_name,
-            'email': customer.email or 'N/A',
-            'whatsapp_number': customer.whatsapp_number or 'N/A',
-            'year': customer.year or 'N/A',
-            'college_name': customer.college.name,
-            'university_name': customer.college.university.name
-        })
-    
-    return jsonify({'customers': customer_list})
+    try:
+        listing = list_customers(
+            request.args, sort, order,
+            cursor=request.args.get('cursor'),
+            limit=page_size(request.args.get('limit', type=int)),
+            count=request.args.get('count', '1') != '0',
+        )
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor.'}), 400
+    return jsonify(listing)
 
 @main_bp.route('/api/segment_students', methods=['POST'])
 @login_required
@@ -1153,65 +1105,9 @@ def edit_subject(subject_id):
 @main_bp.route('/api/export_segment_csv')
 @login_required
 def export_segment_csv():
-    query = Customer.query.join(College).join(University).join(Country)
-    # --- Apply Location Filters ---
-    if request.args.get('college_id'):
-        query = query.filter(Customer.college_id == request.args.get('college_id'))
-    elif request.args.get('university_id'):
-        query = query.filter(College.university_id == request.args.get('university_id'))
-    elif request.args.get('country_id'):
-        query = query.filter(University.country_id == request.args.get('country_id'))
-
-    # --- Apply Academic Filters ---
-    if request.args.get('year'):
-        query = query.filter(Customer.year == request.args.get('year'))
-    
-    if request.args.get('subject_id'):
-        query = query.filter(Customer.payments.any(Payment.subject_id == request.args.get('subject_id')))
-    
-    if request.args.get('instructor_id'):
-        instructor_subject_ids = [s.id for s in Subject.query.filter_by(instructor_id=request.args.get('instructor_id')).all()]
-        if instructor_subject_ids:
-            query = query.filter(Customer.payments.any(Payment.subject_id.in_(instructor_subject_ids)))
-        else:
-            query = query.filter(False)
-
-    # --- Apply Payment Filters ---
-    if request.args.get('payment_status') == 'has_paid':
-        query = query.filter(Customer.payments.any())
-    elif request.args.get('payment_status') == 'no_payment':
-        query = query.filter(~Customer.payments.any())
-
-    students = query.all()
-
-    # --- CSV Generation Logic ---
-    output = io.StringIO()
-    output.write('\ufeff') # This writes the BOM hint for Excel
-    writer = csv.writer(output)
-
-
-    # Write the header row
-    header = ['ID', 'Full Name', 'WhatsApp Number', 'Email', 'Year', 'College', 'University', 'Country']
-    writer.writerow(header)
-
-    # Write data rows
-    for student in students:
-        row = [
-            student.id,
-            student.full_name,
-            student.whatsapp_number,
-            student.email,
-            student.year,
-            student.college.name,
-            student.college.university.name,
-            student.college.university.country.name
-        ]
-        writer.writerow(row)
-
-    output.seek(0)
-    
+    rows = iter_segment_rows(request.args)
     return Response(
-        output,
+        stream_with_context(csv_chunks(SEGMENT_HEADER, rows)),
         mimetype="text/csv",
         headers={"Content-Disposition": "attachment;filename=student_segment.csv"}
     )
@@ -59,12 +59,24 @@ class Customer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     full_name = db.Column(db.String(200), nullable=False)
     whatsapp_number = db.Column(db.String(20), nullable=True)
+    # WhatsApp number normalised to '+<digits>' (see services/phone_keys.py).
+    phone_key = db.Column(db.String(24), nullable=True)
     email = db.Column(db.String(120), nullable=True)  # <-- FIXED: Now optional
     year = db.Column(db.Integer, nullable=True)      # <-- NEW: Year added
     college_id = db.Column(db.Integer, db.ForeignKey('college.id'), nullable=False)
     creation_date = db.Column(db.DateTime, nullable=False, default=datetime.now(UTC))
     last_updated = db.Column(db.DateTime, nullable=False, default=datetime.now(UTC), onupdate=datetime.now(UTC))
 
+    # Imports in skip/update mode look existing customers up by phone key or email
+    # within a college, and the phone filter is a phone key range; the new-customers
+    # time series filters by creation date and the customer list pages by name by default.
+    __table_args__ = (
+        db.Index('ix_customer_phone_key', 'phone_key', 'college_id'),
+        db.Index('ix_customer_email_lower', db.func.lower(email)),
+        db.Index('ix_customer_creation_date', 'creation_date'),
+        db.Index('ix_customer_full_name_id', 'full_name', 'id'),
+    )
+
 # In app.py, add this new model class after the Payment class definition
 
 class CommunicationLog(db.Model):
@@ -80,6 +92,9 @@ class CommunicationLog(db.Model):
     # This allows us to easily access the customer from a log entry, e.g., my_log.customer
     customer = db.relationship('Customer', backref=db.backref('comm_logs', lazy='dynamic', cascade="all, delete-orphan"))
 
+    # The customer profile pages one customer's notes newest first.
+    __table_args__ = (db.Index('ix_comm_log_customer_date', 'customer_id', 'creation_date'),)
+
 
 # =====================================================================
 # NEW MODELS FOR FINANCIALS AND ACADEMICS
@@ -168,4 +183,156 @@ class Payment(db.Model):
     payment_method_id = db.Column(db.Integer, db.ForeignKey('payment_method.id'), nullable=False)
 
     # --- Relationships ---
-    customer = db.relationship('Customer', backref=db.backref('payments', lazy='dynamic'))
\ No newline at end of file
+    customer = db.relationship('Customer', backref=db.backref('payments', lazy='dynamic'))
+
+    # Time-series reports filter payments by date range; the customer profile pages
+    # one customer's payments newest first.
+    __table_args__ = (
+        db.Index('ix_payment_payment_date', 'payment_date'),
+        db.Index('ix_payment_customer_date', 'customer_id', 'payment_date'),
+    )
+
+class RevenueSummary(db.Model):
+    """Course and application revenue per subject and month, kept in step with Payment writes.
+
+    Instructor, college and year are copied from the subject so reports can filter
+    and group without joining payments. See app/services/revenue_summary.py.
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), nullable=False)
+    instructor_id = db.Column(db.Integer, db.ForeignKey('instructor.id'), nullable=True)
+    college_id = db.Column(db.Integer, db.ForeignKey('college.id'), nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.String(7), nullable=False)  # 'YYYY-MM' of the payment date
+
+    course_revenue = db.Column(db.Float, nullable=False, default=0)
+    application_revenue = db.Column(db.Float, nullable=False, default=0)  # Positive application fees only
+    payment_count = db.Column(db.Integer, nullable=False, default=0)
+    application_payment_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('subject_id', 'month', name='_revenue_summary_subject_month_uc'),
+        db.Index('ix_revenue_summary_instructor', 'instructor_id'),
+        db.Index('ix_revenue_summary_college_year', 'college_id', 'year'),
+    )
+
+class TableVersion(db.Model):
+    """Write counter per table, bumped in the same transaction as the write.
+
+    Cached report results are keyed by the versions of the tables they read, so
+    every worker stops serving them once a write commits. See app/services/report_cache.py.
+    """
+
+    table_name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class DashboardCounter(db.Model):
+    """Running count per (kind, key), kept in step with inserts and deletes.
+
+    Holds entity totals (kind ``total``, keyed by table name), customers per country,
+    university, year and creation month, and payments per month, so the dashboard
+    reads a few rows instead of counting whole tables. See app/services/dashboard_counters.py.
+    """
+
+    kind = db.Column(db.String(32), primary_key=True)
+    key = db.Column(db.String(64), primary_key=True)  # Table name, parent id, year or 'YYYY-MM'
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+class ImportJob(db.Model):
+    """A queued or finished file import, polled by the import page for progress."""
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False, default='customers')
+    mode = db.Column(db.String(20), nullable=False, default='insert')  # insert, skip_existing, update_existing
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, completed, failed
+    filename = db.Column(db.String(255), nullable=False)
+    file_size = db.Column(db.Integer, nullable=False, default=0)
+    stored_path = db.Column(db.String(500), nullable=True)  # Cleared once the staged file is removed
+    content_hash = db.Column(db.String(64), nullable=True)  # SHA-256 of the uploaded file
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+
+    rows_processed = db.Column(db.Integer, nullable=False, default=0)
+    inserted = db.Column(db.Integer, nullable=False, default=0)
+    updated = db.Column(db.Integer, nullable=False, default=0)
+    existing = db.Column(db.Integer, nullable=False, default=0)
+    skipped = db.Column(db.Integer, nullable=False, default=0)
+    message = db.Column(db.Text, nullable=True)
+
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(UTC))
+    started_at = db.Column(db.DateTime, nullable=True)
+    progress_at = db.Column(db.DateTime, nullable=True)  # Last chunk committed; a dead worker stops advancing it
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    # Re-uploads are matched against the same user's earlier jobs by content hash.
+    __table_args__ = (db.Index('ix_import_job_user_hash', 'user_id', 'content_hash'),)
+
+    @property
+    def is_finished(self):
+        return self.status in ('completed', 'failed')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'mode': self.mode,
+            'filename': self.filename,
+            'content_hash': self.content_hash,
+            'rows_processed': self.rows_processed,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'existing': self.existing,
+            'skipped': self.skipped,
+            'message': self.message,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class ImportRowError(db.Model):
+    """A rejected import row, stored server-side instead of flashed into the session."""
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('import_job.id'), nullable=False)
+    row_number = db.Column(db.Integer, nullable=False)
+    message = db.Column(db.Text, nullable=False)
+
+    job = db.relationship('ImportJob', backref=db.backref('row_errors', lazy='dynamic', cascade="all, delete-orphan"))
+
+    # Report pages read one job's errors in row order.
+    __table_args__ = (db.Index('ix_import_row_error_job_row', 'job_id', 'row_number'),)
+
+
+class ExportJob(db.Model):
+    """A spreadsheet export too large to build within a request, written in the background."""
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(40), nullable=False)  # Key of xlsx_export.EXPORTS
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, completed, failed
+    filename = db.Column(db.String(255), nullable=False)
+    params = db.Column(db.Text, nullable=False, default='{}')  # JSON of the export's filters
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    stored_path = db.Column(db.String(500), nullable=True)  # Set once the file is written
+    rows_written = db.Column(db.Integer, nullable=False, default=0)
+    message = db.Column(db.Text, nullable=True)
+
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(UTC))
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    @property
+    def is_finished(self):
+        return self.status in ('completed', 'failed')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'filename': self.filename,
+            'rows_written': self.rows_written,
+            'message': self.message,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
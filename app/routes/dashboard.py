@@ -1,89 +1,137 @@
-from flask import Blueprint, render_template
+from datetime import date
+
+from flask import Blueprint, jsonify, render_template, request
 from flask_login import login_required
 from sqlalchemy import func
+from sqlalchemy.orm import joinedload
 from .. import db
-from ..models import Customer, University, College, Country, Subject, Instructor
+from ..models import Customer, University, College, Country, DashboardCounter, RevenueSummary
+from ..services.dashboard_counters import (
+    CUSTOMERS_BY_COUNTRY, CUSTOMERS_BY_MONTH, CUSTOMERS_BY_UNIVERSITY, CUSTOMERS_BY_YEAR, TOTAL,
+)
+from ..services.date_buckets import BUCKETS, MAX_BUCKETS, bucket_count, default_start, fill_buckets
+from ..services.query_fanout import gather
+from ..services.report_cache import cached_report
+from ..services.report_service import customer_series, payment_series, revenue_series
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
+# الجداول التي تُقرأ في لوحة التحكم (لإبطال النتائج المخزنة مؤقتاً)
+DASHBOARD_TABLES = ('customer', 'country', 'university', 'college', 'subject', 'instructor', 'payment')
+
+# السلاسل الزمنية المتاحة: الدالة والجداول التي تقرؤها
+TIMESERIES = {
+    'payments': (payment_series, ('payment',)),
+    'revenue': (revenue_series, ('payment',)),
+    'customers': (customer_series, ('customer',)),
+}
+
+
 @dashboard_bp.route('/')
 @login_required
 def index():
-    # إجماليات سريعة
-    total_customers = db.session.query(func.count(Customer.id)).scalar() or 0
-    total_universities = db.session.query(func.count(University.id)).scalar() or 0
-    total_colleges = db.session.query(func.count(College.id)).scalar() or 0
-    total_countries = db.session.query(func.count(Country.id)).scalar() or 0
-    total_subjects = db.session.query(func.count(Subject.id)).scalar() or 0
-    total_instructors = db.session.query(func.count(Instructor.id)).scalar() or 0
-
-    # ✅ تجميع شهري متوافق مع Postgres (بدلاً من SQLite strftime)
-    customers_over_time = (
-        db.session.query(
-            func.strftime('%Y-%m', Customer.creation_date).label('month'),
-            func.count(Customer.id)
-        )
-        .filter(Customer.creation_date.isnot(None))
-        .group_by('month')
-        .order_by('month')
-        .all()
-    )
-    time_labels = [row[0] for row in customers_over_time]  # 'YYYY-MM'
-    time_data   = [row[1] for row in customers_over_time]
+    dashboard_data = cached_report('dashboard', DASHBOARD_TABLES, {}, _dashboard_data)
+    return render_template('dashboard.html', **dashboard_data)
 
-    # توزيعات حسب الدولة
-    customers_by_country = (
-        db.session.query(
-            Country.name,
-            func.count(Customer.id)
-        )
-        .join(University, Country.id == University.country_id)
-        .join(College, University.id == College.university_id)
-        .join(Customer, College.id == Customer.college_id)
-        .group_by(Country.name)
-        .order_by(func.count(Customer.id).desc())
-        .all()
-    )
 
-    # توزيعات حسب الجامعة
-    customers_by_uni = (
+def _counters():
+    # العدادات تُحدَّث مع كل إضافة وحذف، فلا حاجة لعدّ الجداول كاملة في كل زيارة
+    counters = {}
+    for kind, key, value in db.session.query(DashboardCounter.kind, DashboardCounter.key, DashboardCounter.value):
+        counters.setdefault(kind, {})[key] = value
+    return counters
+
+
+def _names(model):
+    return lambda: dict(db.session.query(model.id, model.name).all())
+
+
+def _named_counts(counts, names):
+    # توزيعات حسب الاسم، مرتبة تنازلياً
+    totals = {}
+    for key, value in counts.items():
+        name = names.get(int(key))
+        if name is not None and value > 0:
+            totals[name] = totals.get(name, 0) + value
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+# الإيرادات من جدول الملخص المجمّع مسبقاً (صف لكل مادة وشهر)
+_revenue = RevenueSummary.course_revenue + RevenueSummary.application_revenue
+
+
+def _total_revenue():
+    return db.session.query(func.coalesce(func.sum(_revenue), 0.0)).scalar()
+
+
+def _revenue_by_uni():
+    return (
         db.session.query(
             University.name,
-            func.count(Customer.id)
+            func.sum(_revenue)
         )
         .join(College, University.id == College.university_id)
-        .join(Customer, College.id == Customer.college_id)
+        .join(RevenueSummary, College.id == RevenueSummary.college_id)
         .group_by(University.name)
-        .order_by(func.count(Customer.id).desc())
+        .order_by(func.sum(_revenue).desc())
         .all()
     )
 
-    # توزيعات حسب السنة
-    customers_by_year = (
-        db.session.query(
-            Customer.year,
-            func.count(Customer.id)
-        )
-        .group_by(Customer.year)
-        .order_by(Customer.year)
+
+def _recent_customers():
+    # أحدث العملاء
+    recent_customers = (
+        Customer.query
+        .options(joinedload(Customer.college).joinedload(College.university))
+        .order_by(Customer.creation_date.desc())
+        .limit(5)
         .all()
     )
-    customers_by_year = [(f"Year {y}" if y else "N/A", count) for y, count in customers_by_year]
+    return [
+        {
+            'id': customer.id,
+            'full_name': customer.full_name,
+            'email': customer.email,
+            'college': {'name': customer.college.name, 'university': {'name': customer.college.university.name}},
+        }
+        for customer in recent_customers
+    ]
 
-    # أحدث العملاء
-    recent_customers = Customer.query.order_by(Customer.creation_date.desc()).limit(5).all()
-
-    return render_template(
-        'dashboard.html',
-        total_customers=total_customers,
-        total_universities=total_universities,
-        total_colleges=total_colleges,
-        total_countries=total_countries,
-        total_subjects=total_subjects,
-        total_instructors=total_instructors,
+
+def _dashboard_data():
+    # الاستعلامات مستقلة وللقراءة فقط، لذا تُنفَّذ بالتوازي على اتصالات منفصلة
+    results = gather({
+        'counters': _counters,
+        'country_names': _names(Country),
+        'university_names': _names(University),
+        'total_revenue': _total_revenue,
+        'revenue_by_uni': _revenue_by_uni,
+        'recent_customers': _recent_customers,
+    })
+    counters = results['counters']
+    totals = counters.get(TOTAL, {})
+
+    # ✅ الأشهر الفارغة تُملأ بالأصفار
+    month_starts, series = fill_buckets(sorted(counters.get(CUSTOMERS_BY_MONTH, {}).items()), 'month', ['customers'])
+    time_labels = [label[:7] for label in month_starts]  # 'YYYY-MM'
+    time_data   = series['customers']
+    customers_by_country = _named_counts(counters.get(CUSTOMERS_BY_COUNTRY, {}), results['country_names'])
+    customers_by_uni = _named_counts(counters.get(CUSTOMERS_BY_UNIVERSITY, {}), results['university_names'])
+    years = sorted(counters.get(CUSTOMERS_BY_YEAR, {}).items(), key=lambda item: (item[0] != '', int(item[0] or 0)))
+    customers_by_year = [(f"Year {y}" if y else "N/A", count) for y, count in years if count > 0]
+    revenue_by_uni = results['revenue_by_uni']
+
+    return dict(
+        total_customers=totals.get('customer', 0),
+        total_universities=totals.get('university', 0),
+        total_colleges=totals.get('college', 0),
+        total_countries=totals.get('country', 0),
+        total_subjects=totals.get('subject', 0),
+        total_instructors=totals.get('instructor', 0),
+        total_revenue=results['total_revenue'],
         time_labels=time_labels,
         time_data=time_data,
-        recent_customers=recent_customers,
+        recent_customers=results['recent_customers'],
         chart_data={
             'customers_by_country': {
                 'labels': [i[0] for i in customers_by_country],
@@ -97,6 +145,10 @@ def index():
                 'labels': [i[0] for i in customers_by_year],
                 'data':   [i[1] for i in customers_by_year],
             },
+            'revenue_by_uni': {
+                'labels': [i[0] for i in revenue_by_uni],
+                'data':   [round(i[1], 2) for i in revenue_by_uni],
+            },
         }
     )
 
@@ -104,3 +156,35 @@ def index():
 @login_required
 def dashboard():
     return index()
+
+
+@dashboard_bp.route('/api/timeseries/<metric>')
+@login_required
+def timeseries(metric):
+    """Per-bucket series for payments, revenue or new customers, with empty buckets filled with 0.
+
+    ``bucket`` is day, week, month (default) or quarter; ``start`` and ``end`` are ISO
+    dates whose whole buckets are included. ``end`` defaults to today and ``start``
+    to a window of ``DEFAULT_SPANS[bucket]`` buckets.
+    """
+    if metric not in TIMESERIES:
+        return jsonify({'error': f"Unknown series '{metric}'."}), 404
+    bucket = request.args.get('bucket', 'month')
+    if bucket not in BUCKETS:
+        return jsonify({'error': f"bucket must be one of {', '.join(BUCKETS)}."}), 400
+    try:
+        end = date.fromisoformat(request.args['end']) if request.args.get('end') else date.today()
+        start = date.fromisoformat(request.args['start']) if request.args.get('start') else default_start(bucket, end).date()
+    except ValueError:
+        return jsonify({'error': 'start and end must be dates like 2024-09-01.'}), 400
+    if start > end:
+        return jsonify({'error': 'start must not be after end.'}), 400
+    if bucket_count(bucket, start, end) > MAX_BUCKETS:
+        return jsonify({'error': f"At most {MAX_BUCKETS} {bucket} buckets can be requested at once."}), 400
+
+    build, tables = TIMESERIES[metric]
+    labels, series = cached_report(
+        f'timeseries:{metric}', tables, {'bucket': bucket, 'start': start.isoformat(), 'end': end.isoformat()},
+        lambda: build(bucket, start, end),
+    )
+    return jsonify({'metric': metric, 'bucket': bucket, 'labels': labels, 'series': series})
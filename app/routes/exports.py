@@ -0,0 +1,65 @@
+import tempfile
+
+from flask import Blueprint, render_template, request, jsonify, url_for, abort, current_app, redirect, send_file
+from flask_login import login_required, current_user
+
+from ..services.export_jobs import submit_export, load_visible_export
+from ..services.xlsx_export import EXPORTS, XLSX_MIMETYPE, estimated_cells, export_params, write_xlsx
+
+exports_bp = Blueprint('exports', __name__)
+
+
+@exports_bp.route('/exports/<kind>.xlsx')
+@login_required
+def export_xlsx(kind):
+    """Download an export as .xlsx, or queue it and show its job page when it is too large to build now."""
+    export = EXPORTS.get(kind)
+    if export is None:
+        abort(404)
+    try:
+        params = export_params(export, request.args)
+    except ValueError as err:
+        return jsonify({'error': str(err)}), 400
+
+    limit = current_app.config['XLSX_BACKGROUND_CELLS']
+    if estimated_cells(export, params, limit) > limit:
+        job_id = submit_export(kind, params, current_user.id)
+        current_app.logger.info("Export job %s queued: kind=%s user_id=%s", job_id, kind, current_user.id)
+        return redirect(url_for('exports.export_job_page', job_id=job_id))
+
+    # The workbook is spooled to disk and sent from there, so the response holds no rows in memory.
+    output = tempfile.TemporaryFile()
+    write_xlsx(export, params, output)
+    output.seek(0)
+    return send_file(output, mimetype=XLSX_MIMETYPE, as_attachment=True, download_name=export.filename())
+
+
+@exports_bp.route('/exports/jobs/<int:job_id>')
+@login_required
+def export_job_status(job_id):
+    job = _get_job_or_404(job_id)
+    status = job.to_dict()
+    status['download_url'] = url_for('exports.export_download', job_id=job.id) if job.stored_path else None
+    return jsonify(status)
+
+
+@exports_bp.route('/exports/<int:job_id>')
+@login_required
+def export_job_page(job_id):
+    return render_template('export_job.html', job=_get_job_or_404(job_id))
+
+
+@exports_bp.route('/exports/<int:job_id>/download')
+@login_required
+def export_download(job_id):
+    job = _get_job_or_404(job_id)
+    if not job.stored_path:
+        abort(404)
+    return send_file(job.stored_path, mimetype=XLSX_MIMETYPE, as_attachment=True, download_name=job.filename)
+
+
+def _get_job_or_404(job_id):
+    job = load_visible_export(job_id)
+    if job is None:
+        abort(404)
+    return job
@@ -1,7 +1,138 @@
-from flask import Blueprint, render_template
+import csv
+import io
+
+from flask import Blueprint, render_template, request, jsonify, url_for, abort, current_app, Response, stream_with_context
+from flask_login import login_required, current_user
+
+from ..models import ImportRowError
+from ..upload_utils import UploadError
+from ..services.import_jobs import submit_import, load_visible_job
+from ..services.import_service import IMPORT_MODES
 
 imports_bp = Blueprint('imports', __name__)
 
+ERRORS_PER_PAGE = 50
+
 @imports_bp.route('/imports')
 def imports_page():
     return "<h1>Imports page works!</h1>"
+
+
+@imports_bp.route('/imports/customers', methods=['POST'])
+@login_required
+def start_customer_import():
+    """Queue a customer import and return its job id without waiting for it to run."""
+    import_mode = request.form.get('import_mode', 'insert')
+    if import_mode not in IMPORT_MODES:
+        return jsonify({'error': 'Unknown import mode.'}), 400
+    return _queue_import('customers', import_mode)
+
+
+@imports_bp.route('/imports/payments', methods=['POST'])
+@login_required
+def start_payment_import():
+    """Queue a payment import and return its job id without waiting for it to run."""
+    return _queue_import('payments')
+
+
+@imports_bp.route('/imports/catalogue', methods=['POST'])
+@login_required
+def start_catalogue_import():
+    """Queue an academic catalogue import and return its job id without waiting for it to run."""
+    return _queue_import('catalogue')
+
+
+def _queue_import(kind, mode='insert'):
+    file = request.files.get('import_file')
+    if not file or file.filename == '':
+        return jsonify({'error': 'No file selected for uploading.'}), 400
+
+    allow_duplicate = request.form.get('confirm_duplicate') == '1'
+    try:
+        job_id, duplicate = submit_import(kind, file, current_user.id, mode, allow_duplicate=allow_duplicate)
+    except UploadError as err:
+        current_app.logger.warning(
+            "Import job rejected: kind=%s user_id=%s filename=%s reason=%s",
+            kind,
+            current_user.id,
+            err.filename or file.filename,
+            err.log_message,
+        )
+        return jsonify({'error': err.user_message}), err.status_code
+
+    status_url = url_for('imports.import_job_status', job_id=job_id)
+    if duplicate:
+        # Same file as an earlier job: point at that job instead of importing it twice.
+        current_app.logger.info(
+            "Import job skipped as duplicate: kind=%s user_id=%s filename=%s earlier_job=%s",
+            kind,
+            current_user.id,
+            file.filename,
+            job_id,
+        )
+        return jsonify({'job_id': job_id, 'status_url': status_url, 'duplicate': True}), 200
+
+    return jsonify({'job_id': job_id, 'status_url': status_url, 'duplicate': False}), 202
+
+
+@imports_bp.route('/imports/jobs/<int:job_id>')
+@login_required
+def import_job_status(job_id):
+    job = _get_job_or_404(job_id)
+    status = job.to_dict()
+    status['report_url'] = url_for('imports.import_report', job_id=job.id)
+    return jsonify(status)
+
+
+@imports_bp.route('/imports/<int:job_id>/report')
+@login_required
+def import_report(job_id):
+    job = _get_job_or_404(job_id)
+    page = request.args.get('page', 1, type=int)
+    row_errors = (
+        ImportRowError.query
+        .filter_by(job_id=job.id)
+        .order_by(ImportRowError.row_number, ImportRowError.id)
+        .paginate(page=page, per_page=ERRORS_PER_PAGE, error_out=False)
+    )
+    return render_template('import_report.html', job=job, row_errors=row_errors)
+
+
+@imports_bp.route('/imports/<int:job_id>/errors.csv')
+@login_required
+def import_errors_csv(job_id):
+    job = _get_job_or_404(job_id)
+    query = (
+        ImportRowError.query
+        .with_entities(ImportRowError.row_number, ImportRowError.message)
+        .filter_by(job_id=job.id)
+        .order_by(ImportRowError.row_number, ImportRowError.id)
+        .yield_per(1000)
+    )
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        buffer.write('\ufeff')  # BOM hint for Excel
+        writer.writerow(['Row', 'Error'])
+        for row_number, message in query:
+            writer.writerow([row_number, message])
+            if buffer.tell() > 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    filename = f"import_{job.id}_errors.csv"
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment;filename={filename}"}
+    )
+
+
+def _get_job_or_404(job_id):
+    job = load_visible_job(job_id)
+    if job is None:
+        abort(404)
+    return job
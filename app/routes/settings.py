@@ -96,8 +96,12 @@ def instructors_settings():
 @settings_bp.route('/settings/import')
 @login_required
 def import_settings():
+    from app.services.import_jobs import load_visible_job
+    job_id = request.args.get('job_id', type=int)
+    last_job = load_visible_job(job_id) if job_id else None
     return render_template(
         'settings/import.html',
-        active_tab='import'
+        active_tab='import',
+        last_job=last_job
     )
 
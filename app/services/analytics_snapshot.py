@@ -0,0 +1,223 @@
+"""In-memory columnar snapshot of payments for ad-hoc group-by/filter pivots.
+
+Every payment is loaded once per worker, joined with its subject, college,
+university, country, instructor and payment method names and its customer id,
+into a pandas frame whose dimension columns are categoricals. Filters compare
+integer category codes and group-bys aggregate whole columns, so a pivot over a
+million payments costs tens of milliseconds and no database round trip.
+
+Before each pivot the snapshot appends payments above its id high-water mark.
+It reloads in full only when a dimension table changes or existing payments are
+edited or deleted (see ``report_cache.rewrite_version_name``).
+"""
+
+import threading
+from datetime import date, datetime
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from sqlalchemy import select
+
+from .. import db
+from ..models import College, Country, Instructor, Payment, PaymentMethod, Subject, University
+from .report_cache import rewrite_version_name, table_versions
+
+# Dimension columns, all categoricals of text labels; missing names read '(none)'.
+DIMENSIONS = (
+    'country', 'university', 'college', 'subject', 'instructor', 'academic_year',
+    'payment_method', 'payment_year', 'payment_month',
+)
+# Measure name -> (column, aggregation).
+MEASURES = {
+    'total': ('total', 'sum'),
+    'course': ('course', 'sum'),
+    'application': ('application', 'sum'),
+    'payments': ('payment_id', 'count'),
+    'customers': ('customer_id', 'nunique'),
+}
+MAX_GROUP_BY = 3
+DEFAULT_PIVOT_LIMIT = 100
+MAX_PIVOT_LIMIT = 1_000
+LOAD_BATCH_SIZE = 50_000
+MISSING_LABEL = '(none)'
+
+# A change to any of these forces a full reload instead of an append.
+RELOAD_TABLES = (
+    'subject', 'college', 'university', 'country', 'instructor', 'payment_method', rewrite_version_name('payment'),
+)
+
+_EXTENSION_KEY = 'analytics_snapshot'
+_snapshot_lock = threading.Lock()
+
+_COLUMNS = (
+    Payment.id.label('payment_id'),
+    Payment.payment_date,
+    Payment.course_price_paid.label('course'),
+    Payment.application_price_paid.label('application'),
+    Payment.customer_id,
+    Country.name.label('country'),
+    University.name.label('university'),
+    College.name.label('college'),
+    Subject.name.label('subject'),
+    Instructor.name.label('instructor'),
+    Subject.year.label('academic_year'),
+    PaymentMethod.name.label('payment_method'),
+)
+
+
+def _payment_query():
+    return (
+        select(*_COLUMNS)
+        .join(Subject, Subject.id == Payment.subject_id)
+        .join(College, College.id == Subject.college_id)
+        .join(University, University.id == College.university_id)
+        .join(Country, Country.id == University.country_id)
+        .join(PaymentMethod, PaymentMethod.id == Payment.payment_method_id)
+        .outerjoin(Instructor, Instructor.id == Subject.instructor_id)
+        .order_by(Payment.id)
+    )
+
+
+def _frame(rows: Sequence) -> pd.DataFrame:
+    """Columnar frame for one batch of ``_payment_query`` rows."""
+
+    raw = pd.DataFrame(list(rows), columns=[column.key for column in _COLUMNS])
+    payment_date = pd.to_datetime(raw['payment_date'])
+    frame = pd.DataFrame({
+        'payment_id': raw['payment_id'].astype('int64'),
+        'customer_id': raw['customer_id'].astype('int64'),
+        'payment_date': payment_date,
+        'course': raw['course'].astype('float64').fillna(0.0),
+        'application': raw['application'].astype('float64').fillna(0.0),
+    })
+    frame['total'] = frame['course'] + frame['application']
+    number = lambda value: str(int(value))
+    labelled = {
+        'payment_year': (payment_date.dt.year, number),
+        'payment_month': (payment_date.dt.to_period('M'), lambda period: period.strftime('%Y-%m')),
+        'academic_year': (raw['academic_year'], number),
+    }
+    for dimension in DIMENSIONS:
+        values, label = labelled[dimension] if dimension in labelled else (raw[dimension], str)
+        frame[dimension] = _categorical(values, label)
+    return frame
+
+
+def _categorical(values: pd.Series, label) -> pd.Categorical:
+    """Categorical of text labels, with missing values labelled ``MISSING_LABEL``.
+
+    Only the distinct values are formatted, which is what keeps month and year labels
+    cheap over a million rows.
+    """
+
+    categorical = pd.Categorical(values)
+    categorical = categorical.rename_categories([label(value) for value in categorical.categories])
+    if categorical.isna().any():
+        if MISSING_LABEL not in categorical.categories:
+            categorical = categorical.add_categories([MISSING_LABEL])
+        categorical = categorical.fillna(MISSING_LABEL)
+    return categorical
+
+
+def _concat(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """Stack batches, merging their categories so dimension columns stay categorical."""
+
+    frames = [frame for frame in frames if not frame.empty] or frames[:1]
+    if len(frames) == 1:
+        return frames[0]
+    combined = pd.concat([frame.drop(columns=list(DIMENSIONS)) for frame in frames], ignore_index=True)
+    for dimension in DIMENSIONS:
+        combined[dimension] = union_categoricals([frame[dimension] for frame in frames])
+    return combined
+
+
+def _load(after_id: int = 0) -> pd.DataFrame:
+    result = db.session.execute(_payment_query().where(Payment.id > after_id).execution_options(yield_per=LOAD_BATCH_SIZE))
+    return _concat([_frame([])] + [_frame(rows) for rows in result.partitions()])
+
+
+class AnalyticsSnapshot:
+    """The payments frame of one worker, with the high-water mark and versions it was loaded at."""
+
+    def __init__(self):
+        self.frame = _frame([])
+        self.high_water = 0
+        self.versions: Optional[Tuple[int, ...]] = None
+        self.loaded_at: Optional[datetime] = None
+        self.full_loads = 0
+        self._lock = threading.Lock()
+
+    def refresh(self) -> pd.DataFrame:
+        """Bring the frame up to date and return it; readers keep whichever frame they were handed."""
+
+        with self._lock:
+            versions = table_versions(RELOAD_TABLES)
+            if versions != self.versions:
+                frame = _load()
+                self.full_loads += 1
+                self.loaded_at = datetime.now()
+            else:
+                frame = _concat([self.frame, _load(self.high_water)])
+            self.high_water = int(frame['payment_id'].iat[-1]) if len(frame) else 0
+            self.frame, self.versions = frame, versions
+            return frame
+
+
+def get_snapshot(app) -> AnalyticsSnapshot:
+    snapshot = app.extensions.get(_EXTENSION_KEY)
+    if snapshot is None:
+        with _snapshot_lock:
+            snapshot = app.extensions.setdefault(_EXTENSION_KEY, AnalyticsSnapshot())
+    return snapshot
+
+
+def pivot(
+    frame: pd.DataFrame,
+    group_by: Sequence[str],
+    measures: Sequence[str],
+    filters: Mapping[str, Sequence[str]],
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    limit: int = DEFAULT_PIVOT_LIMIT,
+) -> Dict:
+    """Aggregate ``measures`` per ``group_by`` combination over the payments matching ``filters``.
+
+    ``filters`` maps dimensions to accepted labels; ``start`` and ``end`` bound the
+    payment date (inclusive days). Groups are sorted by the first measure, largest
+    first, and cut to ``limit``; ``groups`` reports how many there were.
+    """
+
+    mask = np.ones(len(frame), dtype=bool)
+    for dimension, labels in filters.items():
+        column = frame[dimension].cat
+        codes = column.categories.get_indexer(list(labels))
+        mask &= np.isin(column.codes.to_numpy(), codes[codes >= 0])
+    dates = frame['payment_date'].to_numpy()
+    if start is not None:
+        mask &= dates >= np.datetime64(start)
+    if end is not None:
+        mask &= dates < np.datetime64(end) + np.timedelta64(1, 'D')
+    selected = frame[mask]
+
+    aggregations = {name: MEASURES[name] for name in measures}
+    if group_by:
+        grouped = selected.groupby(list(group_by), observed=True, sort=False).agg(**aggregations)
+        grouped = grouped.sort_values(measures[0], ascending=False)
+        groups = len(grouped)
+        table = grouped.head(limit).reset_index()
+    else:
+        table = pd.DataFrame([
+            {name: getattr(selected[column], aggregation)() for name, (column, aggregation) in aggregations.items()}
+        ])
+        groups = 1
+
+    rows = [
+        {
+            **{dimension: row[dimension] for dimension in group_by},
+            **{name: round(float(row[name]), 2) if MEASURES[name][1] == 'sum' else int(row[name]) for name in measures},
+        }
+        for row in table.to_dict('records')
+    ]
+    return {'rows': rows, 'groups': groups, 'payments': int(mask.sum())}
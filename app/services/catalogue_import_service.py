@@ -0,0 +1,246 @@
+"""Academic catalogue import: builds Country → University → College → Year → Term/Module → Subject.
+
+Each level is resolved for a whole chunk at once: one query loads the rows that
+already exist under the chunk's parents, missing rows are bulk-inserted and the
+level is re-read for their ids. Names match case-insensitively, which keeps the
+``_year_college_uc``, ``_term_college_year_uc`` and ``_module_college_year_uc``
+constraints satisfied without a per-row existence check.
+"""
+
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import pandas as pd
+from sqlalchemy import func, insert
+
+from .. import db
+from ..models import College, CollegeYear, Country, Currency, Module, Subject, Term, University
+from .dashboard_counters import count_inserted
+from .import_service import ImportResult, RowError, _text_column
+
+TEXT_COLUMNS = (
+    'country', 'university', 'college', 'structure_type', 'year', 'term', 'module',
+    'subject', 'course_price', 'application_price', 'currency',
+)
+STRUCTURE_TYPES = ('term', 'module')
+CATALOGUE_LEVELS = ('countries', 'universities', 'colleges', 'years', 'terms', 'modules', 'subjects')
+
+
+@dataclass
+class CatalogueImportResult(ImportResult):
+    """Totals for a catalogue import; ``created`` counts new rows per level."""
+
+    label: str = 'catalogue entries'
+    created: Dict[str, int] = field(default_factory=lambda: dict.fromkeys(CATALOGUE_LEVELS, 0))
+
+    @property
+    def summary(self) -> str:
+        parts = [f"{count} {level}" for level, count in self.created.items() if count]
+        message = f"Catalogue import created {', '.join(parts)}." if parts else "Catalogue import found nothing new to create."
+        if self.skipped:
+            message += f" Skipped {self.skipped} rows with validation errors."
+        return message
+
+
+def _python_value(value):
+    # Merges leave ids as floats (NaN for "none"); the database wants ints or NULL.
+    if isinstance(value, float):
+        if value != value:
+            return None
+        if value.is_integer():
+            return int(value)
+    return value
+
+
+def _existing_rows(model, wanted: pd.DataFrame, parent_columns: Sequence[str], name_column: Optional[str]) -> pd.DataFrame:
+    columns = ['id', *parent_columns] + ([name_column] if name_column else [])
+    query = db.session.query(*(getattr(model, column) for column in columns))
+    if parent_columns:
+        scope = parent_columns[0]
+        query = query.filter(getattr(model, scope).in_([_python_value(v) for v in wanted[scope].unique()]))
+    else:
+        query = query.filter(func.lower(getattr(model, name_column)).in_(wanted['_name_key'].unique().tolist()))
+    existing = pd.DataFrame(query.order_by(model.id).all(), columns=columns)
+    return _with_keys(existing, parent_columns, name_column)
+
+
+def _with_keys(frame: pd.DataFrame, parent_columns: Sequence[str], name_column: Optional[str]) -> pd.DataFrame:
+    for column in parent_columns:
+        frame[f'_key_{column}'] = frame[column].astype('float64')
+    if name_column:
+        frame['_name_key'] = frame[name_column].astype(str).str.lower()
+    return frame
+
+
+def _ensure(
+    model,
+    frame: pd.DataFrame,
+    parent_columns: Sequence[str],
+    name_column: Optional[str],
+) -> Tuple[pd.Series, int]:
+    """Return ids for every row of ``frame``, bulk-inserting the (parents, name) pairs that are missing.
+
+    ``frame`` columns are model attribute names; columns beyond the key are only
+    used when a row has to be created, taking the first value seen for each key.
+    """
+
+    if frame.empty:
+        return pd.Series(dtype='float64'), 0
+
+    key_columns = [f'_key_{column}' for column in parent_columns] + (['_name_key'] if name_column else [])
+    work = _with_keys(frame.copy(), parent_columns, name_column)
+    wanted = work.drop_duplicates(key_columns)
+
+    existing = _existing_rows(model, wanted, parent_columns, name_column)
+    known = wanted.merge(existing[key_columns].drop_duplicates(), how='left', on=key_columns, indicator=True)
+    missing = known[known['_merge'] == 'left_only'][list(frame.columns)]
+    if not missing.empty:
+        records = [
+            {column: _python_value(value) for column, value in zip(missing.columns, values)}
+            for values in missing.itertuples(index=False, name=None)
+        ]
+        db.session.execute(insert(model), records)
+        count_inserted(model, len(records))
+        existing = _existing_rows(model, wanted, parent_columns, name_column)
+
+    lookup = existing.drop_duplicates(key_columns)[key_columns + ['id']]
+    ids = work[key_columns].merge(lookup, how='left', on=key_columns)['id']
+    ids.index = frame.index
+    return ids, len(missing)
+
+
+def _parse_price(text: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    price = pd.to_numeric(text.where(text != ''), errors='coerce')
+    invalid = (price.isna() & (text != '')) | (price < 0)
+    return price.fillna(0.0), invalid
+
+
+def import_catalogue_chunk(df: pd.DataFrame, currencies: Dict[str, int], result: CatalogueImportResult) -> List[RowError]:
+    """Create the missing catalogue entries named by one chunk and return its row errors.
+
+    A row may stop at any level (a country on its own, a college with no subjects,
+    ...) but every level it names needs its parents. ``currencies`` maps lower-cased
+    codes to ids; the ``''`` key is the default for rows without a currency.
+    """
+
+    text = {name: _text_column(df, name) for name in TEXT_COLUMNS}
+    has = {name: text[name] != '' for name in TEXT_COLUMNS}
+
+    year = pd.to_numeric(text['year'].where(has['year']), errors='coerce')
+    course_price, bad_course_price = _parse_price(text['course_price'])
+    application_price, bad_application_price = _parse_price(text['application_price'])
+    structure_type = text['structure_type'].str.lower()
+    structure_type = structure_type.where(has['structure_type'], has['module'].map({True: 'module', False: 'term'}))
+    currency_id = text['currency'].str.lower().map(currencies)
+
+    needs_college = has['year'] | has['term'] | has['module'] | has['subject']
+    needs_university = has['college'] | needs_college
+    needs_country = has['university'] | needs_university
+
+    messages = pd.Series(None, index=df.index, dtype=object)
+
+    def reject(mask: pd.Series, message) -> None:
+        mask = mask & messages.isna()
+        messages[mask] = message if isinstance(message, str) else message[mask]
+
+    reject(~has['country'], 'Missing required country value.')
+    reject(needs_university & ~has['university'], 'Missing university value.')
+    reject(needs_college & ~has['college'], 'Missing college value.')
+    reject(~structure_type.isin(STRUCTURE_TYPES), "Invalid structure_type '" + text['structure_type'] + "'.")
+    reject((has['term'] | has['module'] | has['subject']) & ~has['year'], 'Missing year value.')
+    reject(has['year'] & (year.isna() | (year % 1 != 0) | (year < 1)), "Invalid year '" + text['year'] + "'.")
+    reject(has['term'] & has['module'], 'Give either a term or a module, not both.')
+    reject(has['subject'] & currency_id.isna(), "Could not find currency '" + text['currency'] + "'.")
+    reject(has['subject'] & bad_course_price, "Invalid course_price '" + text['course_price'] + "'.")
+    reject(has['subject'] & bad_application_price, "Invalid application_price '" + text['application_price'] + "'.")
+
+    valid = messages.isna()
+
+    def ensure(level: str, rows: pd.Series, model, columns: Dict[str, pd.Series], parent_columns, name_column) -> pd.Series:
+        frame = pd.DataFrame({column: values[rows] for column, values in columns.items()})
+        ids, created = _ensure(model, frame, parent_columns, name_column)
+        result.created[level] += created
+        if level == 'subjects':
+            result.existing += len(frame) - created
+        return ids.reindex(df.index)
+
+    rows = valid & has['country']
+    country_id = ensure('countries', rows, Country, {'name': text['country']}, [], 'name')
+
+    rows &= needs_country
+    university_id = ensure('universities', rows, University, {
+        'country_id': country_id,
+        'name': text['university'],
+    }, ['country_id'], 'name')
+
+    rows &= needs_university
+    college_id = ensure('colleges', rows, College, {
+        'university_id': university_id,
+        'name': text['college'],
+        'structure_type': structure_type,
+    }, ['university_id'], 'name')
+
+    rows &= has['year']
+    ensure('years', rows, CollegeYear, {'college_id': college_id, 'year_number': year}, ['college_id', 'year_number'], None)
+    term_id = ensure('terms', rows & has['term'], Term, {
+        'college_id': college_id,
+        'year': year,
+        'name': text['term'],
+    }, ['college_id', 'year'], 'name')
+    module_id = ensure('modules', rows & has['module'], Module, {
+        'college_id': college_id,
+        'year': year,
+        'name': text['module'],
+    }, ['college_id', 'year'], 'name')
+    ensure('subjects', rows & has['subject'], Subject, {
+        'college_id': college_id,
+        'year': year,
+        'term_id': term_id,
+        'module_id': module_id,
+        'name': text['subject'],
+        'default_course_price': course_price,
+        'default_application_price': application_price,
+        'currency_id': currency_id,
+    }, ['college_id', 'year', 'term_id', 'module_id'], 'name')
+
+    rejected = messages[~valid]
+    return list(zip((rejected.index + 2).tolist(), rejected.tolist()))
+
+
+def build_currency_map() -> Dict[str, int]:
+    """Map lower-cased currency codes to ids; ``''`` maps to the first currency defined."""
+
+    currencies = db.session.query(Currency.id, Currency.code).order_by(Currency.id).all()
+    mapping = {code.lower(): currency_id for currency_id, code in currencies}
+    if currencies:
+        mapping[''] = currencies[0].id
+    return mapping
+
+
+def import_catalogue_chunks(
+    chunks: Iterable[pd.DataFrame],
+    on_chunk: Optional[Callable[[ImportResult, List[RowError]], None]] = None,
+) -> CatalogueImportResult:
+    """Create catalogue entries chunk by chunk, committing each chunk as one batch.
+
+    ``inserted`` totals the new rows across all levels and ``existing`` counts subject
+    rows that were already in the catalogue; ``on_chunk`` behaves as in
+    ``import_customer_chunks``.
+    """
+
+    currencies = build_currency_map()
+    result = CatalogueImportResult()
+    for chunk in chunks:
+        result.rows += len(chunk)
+        try:
+            errors = import_catalogue_chunk(chunk, currencies, result)
+            result.skipped += len(errors)
+            result.inserted = sum(result.created.values())
+            if on_chunk is not None:
+                on_chunk(result, errors)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    return result
@@ -0,0 +1,161 @@
+"""Server-side filtering, sorting and keyset pagination for the customer list.
+
+The list page and ``/api/filter_customers`` read the same pages: flat rows of the
+displayed columns, ordered by one sortable column with the customer id as a tie
+breaker, so deep pages cost the same as the first and no ORM objects are built.
+Name and email searches go through ``customer_search`` and are listed by relevance
+unless another sort is asked for; phone searches are prefix ranges on the phone key.
+"""
+
+from typing import List, Mapping, Optional, Tuple
+
+from sqlalchemy import func, select
+
+from .. import db
+from ..models import College, Customer, University
+from .customer_search import SEARCH_FIELDS, ilike_criteria, search_customers
+from .phone_keys import phone_prefix_criteria
+from .report_service import keyset_page
+
+# Sort key -> expression; nullable columns are coalesced so the row-value seek
+# in ``keyset_page`` never compares against NULL.
+SORT_COLUMNS = {
+    'name': Customer.full_name,
+    'email': func.coalesce(func.lower(Customer.email), ''),
+    'whatsapp': func.coalesce(Customer.whatsapp_number, ''),
+    'year': func.coalesce(Customer.year, 0),
+    'college': College.name,
+    'university': University.name,
+    'created': Customer.creation_date,
+    'updated': Customer.last_updated,
+}
+DEFAULT_SORT = 'name'
+# Orders search matches best first. Scoring costs a few microseconds per match, so
+# a search matching more than RANKED_MATCH_LIMIT customers (a short, common term)
+# is listed in DEFAULT_SORT order instead, as is a list without a search.
+RELEVANCE = 'relevance'
+RANKED_MATCH_LIMIT = 5_000
+SORTS = (*SORT_COLUMNS, RELEVANCE)
+SORT_ORDERS = ('asc', 'desc')
+
+
+def location_criteria(args: Mapping) -> list:
+    """Filter for the most specific of the college, university and country ids in ``args``."""
+
+    if args.get('college_id'):
+        return [Customer.college_id == args['college_id']]
+    if args.get('university_id'):
+        return [College.university_id == args['university_id']]
+    if args.get('country_id'):
+        return [University.country_id == args['country_id']]
+    return []
+
+
+def _base_query(matches, *columns):
+    query = (
+        db.session.query(*columns)
+        .select_from(Customer)
+        .join(College, Customer.college_id == College.id)
+        .join(University, College.university_id == University.id)
+    )
+    if matches is not None:
+        query = query.join(matches, matches.c.customer_id == Customer.id)
+    return query
+
+
+def _too_many_to_rank(matches) -> bool:
+    probe = select(matches.c.customer_id).limit(RANKED_MATCH_LIMIT + 1).subquery()
+    return db.session.execute(select(func.count()).select_from(probe)).scalar() > RANKED_MATCH_LIMIT
+
+
+def count_customers(criteria: list, matches=None) -> int:
+    if matches is not None and not criteria:
+        # Every match is a customer with a college, so the index alone has the count.
+        return db.session.execute(select(func.count()).select_from(matches)).scalar()
+    return _base_query(matches, func.count(Customer.id)).filter(*criteria).scalar()
+
+
+def customer_page(
+    criteria: list,
+    sort: str = DEFAULT_SORT,
+    order: str = 'asc',
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    matches=None,
+) -> Tuple[List[dict], Optional[str]]:
+    """Return one page of customers matching ``criteria`` and ``matches`` in ``sort``/``order`` plus the next cursor.
+
+    ``RELEVANCE`` orders by ``matches.c.rank``. Raises ``KeyError`` for an unknown
+    ``sort`` and ``InvalidCursor`` for a cursor from another ordering.
+    """
+
+    if sort == RELEVANCE:
+        sort_column = matches.c.rank if matches is not None else SORT_COLUMNS[DEFAULT_SORT]
+    else:
+        sort_column = SORT_COLUMNS[sort]
+    sort_columns = [sort_column, Customer.id]
+    query = _base_query(
+        matches,
+        *sort_columns,
+        Customer.full_name,
+        Customer.email,
+        Customer.whatsapp_number,
+        Customer.year,
+        College.name,
+        University.name,
+        Customer.creation_date,
+        Customer.last_updated,
+    ).filter(*criteria)
+    rows, next_cursor = keyset_page(query, sort_columns, cursor, limit, descending=order == 'desc')
+    customers = [
+        {
+            'id': customer_id,
+            'full_name': full_name,
+            'email': email,
+            'whatsapp_number': whatsapp_number,
+            'year': year,
+            'college_name': college,
+            'university_name': university,
+            'creation_date': created.strftime('%Y-%m-%d %H:%M'),
+            'last_updated': updated.strftime('%Y-%m-%d %H:%M'),
+        }
+        for _, customer_id, full_name, email, whatsapp_number, year, college, university, created, updated in rows
+    ]
+    return customers, next_cursor
+
+
+def list_customers(
+    args: Mapping,
+    sort: Optional[str] = None,
+    order: str = 'asc',
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    count: bool = True,
+) -> dict:
+    """One page of the customers matching the location ids, phone prefix and searches in ``args``.
+
+    ``sort`` defaults to ``RELEVANCE`` for searches and ``DEFAULT_SORT`` otherwise.
+    Returns the page's ``customers``, ``next_cursor``, the ``total`` number of matches
+    (``None`` unless ``count``) and the ``sort`` actually used.
+    """
+
+    terms = {field: args.get(field) for field in SEARCH_FIELDS}
+    filters = location_criteria(args) + phone_prefix_criteria(args.get('phone'))
+    matches, search_criteria = search_customers(terms)
+    criteria = filters + search_criteria
+
+    page_criteria, page_matches = criteria, matches
+    if matches is not None:
+        broad = _too_many_to_rank(matches)
+        if sort in (None, RELEVANCE):
+            sort = DEFAULT_SORT if broad else RELEVANCE
+        if broad and sort == DEFAULT_SORT and not filters:
+            # Common terms match densely, so walking the name index with ilike fills
+            # a page long before joining and sorting every match would.
+            page_criteria, page_matches = ilike_criteria(terms), None
+    elif sort in (None, RELEVANCE):
+        sort = DEFAULT_SORT
+
+    customers, next_cursor = customer_page(page_criteria, sort, order, cursor, limit, page_matches)
+    total = count_customers(criteria, matches) if count else None
+    return {'customers': customers, 'next_cursor': next_cursor, 'total': total, 'sort': sort}
@@ -0,0 +1,205 @@
+"""Indexed substring search over customer name and email.
+
+Phone numbers are matched by prefix on their normalised key instead (see
+``phone_keys``).
+
+The backend depends on the database:
+
+* SQLite: an FTS5 table ``customer_search`` with the trigram tokenizer, one row per
+  customer keyed by its id. ``after_flush`` re-indexes customers whose searchable
+  columns were written; bulk imports that bypass the unit of work call
+  ``reindex_customers`` themselves. ``flask rebuild-search-index`` rebuilds it.
+* Postgres: ``pg_trgm`` GIN indexes on the columns themselves, which ``ilike``
+  uses directly, so there is nothing to keep in sync.
+* Anything else, or a database where neither is available: plain ``ilike`` scans.
+
+Trigram indexes need at least ``MIN_INDEXED_LENGTH`` characters; shorter terms
+fall back to ``ilike``. Matches are ranked (lower ``rank`` first): bm25 on SQLite,
+trigram similarity on Postgres.
+"""
+
+from typing import Iterable, List, Mapping, Optional, Tuple
+
+import click
+from flask import current_app, has_app_context
+from flask.cli import with_appcontext
+from sqlalchemy import column, event, func, inspect, literal_column, select, table, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from .. import db
+from ..models import Customer
+
+FTS5 = 'fts5'
+PG_TRGM = 'pg_trgm'
+MIN_INDEXED_LENGTH = 3
+ID_BATCH_SIZE = 500
+
+# Search field -> indexed customer column.
+SEARCH_FIELDS = {
+    'name': Customer.full_name,
+    'email': Customer.email,
+}
+SEARCH_TABLE = 'customer_search'
+_INDEXED_COLUMNS = tuple(attribute.key for attribute in SEARCH_FIELDS.values())
+
+_search_table = table(SEARCH_TABLE, column('rowid'), *(column(name) for name in _INDEXED_COLUMNS))
+_EXTENSION_KEY = 'customer_search'
+
+
+def _create_fts5(connection) -> None:
+    connection.execute(text(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+        f"USING fts5({', '.join(_INDEXED_COLUMNS)}, tokenize='trigram')"
+    ))
+
+
+def _create_pg_trgm(connection) -> None:
+    connection.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+    for name in _INDEXED_COLUMNS:
+        connection.execute(text(
+            f'CREATE INDEX IF NOT EXISTS ix_customer_{name}_trgm ON customer USING gin ({name} gin_trgm_ops)'
+        ))
+
+
+def init_customer_search(app) -> Optional[str]:
+    """Create the search index for the app's database and record which backend it uses.
+
+    Falls back to ``ilike`` (backend ``None``) when the database lacks FTS5 trigrams
+    or the ``pg_trgm`` extension cannot be created.
+    """
+
+    dialect = db.engine.dialect.name
+    create = {'sqlite': _create_fts5, 'postgresql': _create_pg_trgm}.get(dialect)
+    backend = None
+    if create is not None:
+        try:
+            with db.engine.begin() as connection:
+                create(connection)
+            backend = FTS5 if dialect == 'sqlite' else PG_TRGM
+        except SQLAlchemyError as exc:
+            app.logger.warning('Customer search index unavailable, using ilike: %s', exc)
+    app.extensions[_EXTENSION_KEY] = backend
+
+    # Index existing customers once for databases that predate the search table.
+    if backend == FTS5:
+        indexed = db.session.execute(select(_search_table.c.rowid).limit(1)).first()
+        if indexed is None and db.session.query(Customer.id).first() is not None:
+            rebuild_search_index()
+    return backend
+
+
+def search_backend() -> Optional[str]:
+    return current_app.extensions.get(_EXTENSION_KEY) if has_app_context() else None
+
+
+def _fts_phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _clean(terms: Mapping[str, str]) -> dict:
+    return {field: term.strip() for field, term in terms.items() if term and term.strip()}
+
+
+def ilike_criteria(terms: Mapping[str, str]) -> list:
+    """Unindexed ``ilike`` substring filters for ``terms`` (``SEARCH_FIELDS`` -> text)."""
+
+    return [SEARCH_FIELDS[field].ilike(f'%{term}%') for field, term in _clean(terms).items()]
+
+
+def search_customers(terms: Mapping[str, str]) -> Tuple[Optional[object], list]:
+    """Split ``terms`` (``SEARCH_FIELDS`` -> text) into an index lookup and ``ilike`` filters.
+
+    Returns ``(matches, criteria)``: ``matches`` is a subquery of ``customer_id`` and
+    ``rank`` for the indexed terms, or ``None`` if none could use the index, and
+    ``criteria`` are ``ilike`` filters on ``Customer`` for the rest.
+    """
+
+    backend = search_backend()
+    indexed, unindexed = {}, {}
+    for field, term in _clean(terms).items():
+        if backend is not None and len(term) >= MIN_INDEXED_LENGTH:
+            indexed[field] = term
+        else:
+            unindexed[field] = term
+    criteria = ilike_criteria(unindexed)
+    if not indexed:
+        return None, criteria
+
+    if backend == FTS5:
+        query = ' AND '.join(f'{SEARCH_FIELDS[field].key} : {_fts_phrase(term)}' for field, term in indexed.items())
+        search_table = literal_column(SEARCH_TABLE)
+        matches = (
+            select(_search_table.c.rowid.label('customer_id'), func.bm25(search_table).label('rank'))
+            .select_from(_search_table)
+            .where(search_table.op('MATCH')(query))
+        )
+    else:
+        similarity = sum(
+            func.coalesce(func.similarity(SEARCH_FIELDS[field], term), 0.0) for field, term in indexed.items()
+        )
+        matches = (
+            select(Customer.id.label('customer_id'), (-similarity).label('rank'))
+            .where(*(SEARCH_FIELDS[field].ilike(f'%{term}%') for field, term in indexed.items()))
+        )
+    return matches.subquery('matches'), criteria
+
+
+def reindex_customers(customer_ids: Iterable[int], connection=None) -> None:
+    """Replace the search rows of ``customer_ids`` with their stored values (deleted ones drop out)."""
+
+    if search_backend() != FTS5:
+        return
+    connection = connection if connection is not None else db.session.connection()
+    customer_ids = list(customer_ids)
+    columns = [getattr(Customer, name) for name in _INDEXED_COLUMNS]
+    for start in range(0, len(customer_ids), ID_BATCH_SIZE):
+        batch = customer_ids[start:start + ID_BATCH_SIZE]
+        connection.execute(_search_table.delete().where(_search_table.c.rowid.in_(batch)))
+        connection.execute(
+            _search_table.insert().from_select(
+                ['rowid', *_INDEXED_COLUMNS], select(Customer.id, *columns).where(Customer.id.in_(batch))
+            )
+        )
+
+
+def rebuild_search_index() -> int:
+    """Re-index every customer, commit, and return how many were indexed."""
+
+    if search_backend() != FTS5:
+        return 0
+    connection = db.session.connection()
+    connection.execute(_search_table.delete())
+    columns = [getattr(Customer, name) for name in _INDEXED_COLUMNS]
+    connection.execute(_search_table.insert().from_select(['rowid', *_INDEXED_COLUMNS], select(Customer.id, *columns)))
+    db.session.commit()
+    return db.session.query(func.count(Customer.id)).scalar()
+
+
+def _written_customers(session) -> List[int]:
+    ids = [obj.id for obj in session.new if isinstance(obj, Customer)]
+    for obj in session.dirty:
+        if isinstance(obj, Customer):
+            state = inspect(obj)
+            if any(state.attrs[name].history.has_changes() for name in _INDEXED_COLUMNS):
+                ids.append(obj.id)
+    ids += [inspect(obj).identity[0] for obj in session.deleted if isinstance(obj, Customer) and inspect(obj).identity]
+    return ids
+
+
+@event.listens_for(Session, 'after_flush')
+def _reindex_written_customers(session, flush_context):
+    if search_backend() != FTS5:
+        return
+    customer_ids = _written_customers(session)
+    if customer_ids:
+        reindex_customers(customer_ids, session.connection())
+
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    """Rebuild the customer search index from the customer table."""
+
+    indexed = rebuild_search_index()
+    click.echo(f"Customer search index rebuilt: {indexed} customers.")
@@ -0,0 +1,322 @@
+"""Dashboard counters: entity totals and grouped customer/payment counts, maintained incrementally.
+
+``DashboardCounter`` holds one row per (kind, key). Session events keep it in step
+with ORM writes the same way as the revenue summary: ``before_flush`` subtracts the
+stored state of customers and payments about to change or be deleted, ``after_flush``
+adds back the inserted and changed ones, and the difference is upserted in the same
+transaction. Moving a college to another university, or a university to another
+country, moves its customers between those counters too. Bulk imports that bypass
+the unit of work call ``count_inserted``, ``count_new_customers``,
+``recount_customers`` and ``count_payment_rows`` themselves. ``flask
+reconcile-counters`` recounts everything and replaces the stored counters; run it
+once on a database that predates them.
+"""
+
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Mapping, Tuple
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import delete, event, func, inspect, or_, select, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from .. import db
+from ..models import College, Country, Customer, DashboardCounter, Instructor, Payment, Subject, University
+from .date_buckets import date_bucket
+from .report_cache import bump_table_versions
+
+TOTAL = 'total'
+CUSTOMERS_BY_COUNTRY = 'customers_by_country'
+CUSTOMERS_BY_UNIVERSITY = 'customers_by_university'
+CUSTOMERS_BY_YEAR = 'customers_by_year'
+CUSTOMERS_BY_MONTH = 'customers_by_month'
+PAYMENTS_BY_MONTH = 'payments_by_month'
+
+# Models whose row count is kept under kind ``total``, keyed by table name.
+TOTAL_MODELS = {model.__table__.name: model for model in (Customer, University, College, Country, Subject, Instructor)}
+COUNTED_TABLES = (*TOTAL_MODELS, 'payment')
+ID_BATCH_SIZE = 500
+
+# session.info key for the deltas and ids collected in before_flush.
+_PENDING_KEY = 'dashboard_counters_pending'
+
+Deltas = Dict[Tuple[str, str], int]
+
+_CUSTOMER_COLUMNS = (Customer.year, Customer.creation_date, College.university_id, University.country_id)
+
+
+def _month_key(value) -> str:
+    # Grouped queries return date_bucket text ('YYYY-MM-01'), row reads return datetimes.
+    return value[:7] if isinstance(value, str) else value.strftime('%Y-%m')
+
+
+def _add(deltas: Deltas, kind: str, key, amount: int) -> None:
+    counter = (kind, '' if key is None else str(key))
+    deltas[counter] = deltas.get(counter, 0) + amount
+
+
+def _accumulate_customers(deltas: Deltas, rows: Iterable[Mapping], sign: int) -> None:
+    """Add (``sign=1``) or remove (``sign=-1``) customer rows; a ``customers`` column weights grouped rows."""
+
+    for row in rows:
+        amount = sign * row.get('customers', 1)
+        _add(deltas, CUSTOMERS_BY_COUNTRY, row['country_id'], amount)
+        _add(deltas, CUSTOMERS_BY_UNIVERSITY, row['university_id'], amount)
+        _add(deltas, CUSTOMERS_BY_YEAR, row['year'], amount)
+        if row['creation_date'] is not None:
+            _add(deltas, CUSTOMERS_BY_MONTH, _month_key(row['creation_date']), amount)
+
+
+def _accumulate_payments(deltas: Deltas, rows: Iterable[Mapping], sign: int) -> None:
+    for row in rows:
+        if row['payment_date'] is not None:
+            _add(deltas, PAYMENTS_BY_MONTH, _month_key(row['payment_date']), sign * row.get('payments', 1))
+
+
+def _customer_query(*columns):
+    return (
+        select(*columns)
+        .select_from(Customer)
+        .join(College, College.id == Customer.college_id)
+        .join(University, University.id == College.university_id)
+    )
+
+
+def _stored_customers(connection, customer_ids: List[int]):
+    for start in range(0, len(customer_ids), ID_BATCH_SIZE):
+        batch = customer_ids[start:start + ID_BATCH_SIZE]
+        yield from connection.execute(_customer_query(*_CUSTOMER_COLUMNS).where(Customer.id.in_(batch))).mappings()
+
+
+def _stored_payments(connection, payment_ids: List[int]):
+    for start in range(0, len(payment_ids), ID_BATCH_SIZE):
+        batch = payment_ids[start:start + ID_BATCH_SIZE]
+        yield from connection.execute(select(Payment.payment_date).where(Payment.id.in_(batch))).mappings()
+
+
+def _moved_customers(connection, college_ids: List[int], university_ids: List[int], excluded_ids: List[int]):
+    """Customers under edited colleges or universities, counted per university and country.
+
+    Customers that are themselves being written are excluded; their own rows already
+    move them.
+    """
+
+    criteria = [or_(College.id.in_(college_ids), University.id.in_(university_ids))]
+    if excluded_ids:
+        criteria.append(Customer.id.not_in(excluded_ids))
+    return connection.execute(
+        _customer_query(College.university_id, University.country_id, func.count(Customer.id).label('customers'))
+        .where(*criteria)
+        .group_by(College.university_id, University.country_id)
+    ).mappings()
+
+
+def _accumulate_moved(deltas: Deltas, rows: Iterable[Mapping], sign: int) -> None:
+    for row in rows:
+        _add(deltas, CUSTOMERS_BY_COUNTRY, row['country_id'], sign * row['customers'])
+        _add(deltas, CUSTOMERS_BY_UNIVERSITY, row['university_id'], sign * row['customers'])
+
+
+def _upsert(connection, rows: List[dict]) -> None:
+    table = DashboardCounter.__table__
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        statement = insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=['kind', 'key'],
+            set_={'value': table.c.value + statement.excluded.value},
+        )
+        connection.execute(statement, rows)
+        return
+
+    for row in rows:
+        result = connection.execute(
+            update(table)
+            .where(table.c.kind == row['kind'], table.c.key == row['key'])
+            .values(value=table.c.value + row['value'])
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert(), row)
+
+
+def _apply(connection, deltas: Deltas) -> None:
+    """Upsert ``deltas`` and drop grouped counters that reached zero (totals are kept)."""
+
+    rows = [{'kind': kind, 'key': key, 'value': amount} for (kind, key), amount in deltas.items() if amount]
+    if not rows:
+        return
+    _upsert(connection, rows)
+    if any(row['value'] < 0 for row in rows):
+        connection.execute(delete(DashboardCounter).where(DashboardCounter.kind != TOTAL, DashboardCounter.value <= 0))
+
+
+def count_inserted(model, count: int) -> None:
+    """Add ``count`` rows bulk-inserted into ``model`` to its total, if it has one."""
+
+    table_name = model.__table__.name
+    if table_name in TOTAL_MODELS and count:
+        _apply(db.session.connection(), {(TOTAL, table_name): count})
+
+
+def count_new_customers(rows: List[Mapping]) -> None:
+    """Count customers bulk-inserted outside the ORM unit of work.
+
+    Each row carries the customer's ``year`` and ``creation_date`` and its college's
+    ``university_id`` and ``country_id``.
+    """
+
+    deltas: Deltas = {(TOTAL, Customer.__table__.name): len(rows)}
+    _accumulate_customers(deltas, rows, 1)
+    _apply(db.session.connection(), deltas)
+
+
+@contextmanager
+def recount_customers(customer_ids: List[int]) -> Iterator[None]:
+    """Move ``customer_ids`` between counters around a bulk UPDATE that bypasses the session events."""
+
+    connection = db.session.connection()
+    deltas: Deltas = {}
+    _accumulate_customers(deltas, _stored_customers(connection, customer_ids), -1)
+    yield
+    _accumulate_customers(deltas, _stored_customers(connection, customer_ids), 1)
+    _apply(connection, deltas)
+
+
+def count_payment_rows(rows: Iterable[Mapping]) -> None:
+    """Count payments bulk-inserted outside the ORM unit of work."""
+
+    deltas: Deltas = {}
+    _accumulate_payments(deltas, rows, 1)
+    _apply(db.session.connection(), deltas)
+
+
+def current_counts() -> Deltas:
+    """Every counter as recounted from the tables themselves."""
+
+    counts: Deltas = {
+        (TOTAL, table_name): db.session.query(func.count(model.id)).scalar()
+        for table_name, model in TOTAL_MODELS.items()
+    }
+    month = date_bucket('month', Customer.creation_date).label('creation_date')
+    groups = (Customer.year, month, College.university_id, University.country_id)
+    customers = _customer_query(*groups, func.count(Customer.id).label('customers')).group_by(*groups)
+    _accumulate_customers(counts, db.session.execute(customers).mappings(), 1)
+
+    month = date_bucket('month', Payment.payment_date).label('payment_date')
+    payments = select(month, func.count(Payment.id).label('payments')).group_by(month)
+    _accumulate_payments(counts, db.session.execute(payments).mappings(), 1)
+    return counts
+
+
+def reconcile_counters() -> int:
+    """Recount every counter, store the recounted values, commit, and return how many had drifted.
+
+    The counters are replaced rather than adjusted, in one transaction that holds the
+    counter table from before the recount: writers counting new rows wait for it to
+    commit and then add to the recounted values, so nothing is lost or counted twice.
+    """
+
+    table = DashboardCounter.__table__
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text(f'LOCK TABLE {table.name} IN EXCLUSIVE MODE'))
+    stored = {(row.kind, row.key): row.value for row in connection.execute(select(table))}
+    # On SQLite the delete takes the database write lock, so the recount below is
+    # current as well.
+    connection.execute(delete(table))
+
+    expected = current_counts()
+    rows = [
+        {'kind': kind, 'key': key, 'value': value}
+        for (kind, key), value in expected.items()
+        if value or kind == TOTAL
+    ]
+    connection.execute(table.insert(), rows)
+
+    drift = [counter for counter in expected.keys() | stored.keys() if expected.get(counter, 0) != stored.get(counter, 0)]
+    if drift:
+        # The cached dashboard is keyed by the versions of the tables it counts.
+        bump_table_versions(connection, COUNTED_TABLES)
+    db.session.commit()
+    return len(drift)
+
+
+def _persistent_ids(objects, model) -> List[int]:
+    ids = []
+    for obj in objects:
+        if isinstance(obj, model):
+            identity = inspect(obj).identity
+            if identity:
+                ids.append(identity[0])
+    return ids
+
+
+def _modified(session, model):
+    return [obj for obj in session.dirty if isinstance(obj, model) and session.is_modified(obj, include_collections=False)]
+
+
+@event.listens_for(Session, 'before_flush')
+def _snapshot_counted_rows(session, flush_context, instances):
+    changed_customers = _persistent_ids(_modified(session, Customer), Customer)
+    deleted_customers = _persistent_ids(session.deleted, Customer)
+    changed_payments = _persistent_ids(_modified(session, Payment), Payment)
+    deleted_payments = _persistent_ids(session.deleted, Payment)
+    # An edited college or university may have moved to another university or country.
+    edited_colleges = _persistent_ids(_modified(session, College), College)
+    edited_universities = _persistent_ids(_modified(session, University), University)
+
+    deltas: Deltas = {}
+    written_customers = changed_customers + deleted_customers
+    if written_customers:
+        _accumulate_customers(deltas, _stored_customers(session.connection(), written_customers), -1)
+    if changed_payments or deleted_payments:
+        _accumulate_payments(deltas, _stored_payments(session.connection(), changed_payments + deleted_payments), -1)
+    if edited_colleges or edited_universities:
+        _accumulate_moved(
+            deltas, _moved_customers(session.connection(), edited_colleges, edited_universities, written_customers), -1
+        )
+    session.info[_PENDING_KEY] = (
+        deltas, changed_customers, written_customers, changed_payments, edited_colleges, edited_universities,
+    )
+
+
+@event.listens_for(Session, 'after_flush')
+def _apply_counted_changes(session, flush_context):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending is None:
+        return
+    deltas, changed_customers, written_customers, changed_payments, edited_colleges, edited_universities = pending
+
+    new_customers = [obj.id for obj in session.new if isinstance(obj, Customer)]
+    current_customers = changed_customers + new_customers
+    if current_customers:
+        _accumulate_customers(deltas, _stored_customers(session.connection(), current_customers), 1)
+    current_payments = changed_payments + [obj.id for obj in session.new if isinstance(obj, Payment)]
+    if current_payments:
+        _accumulate_payments(deltas, _stored_payments(session.connection(), current_payments), 1)
+    if edited_colleges or edited_universities:
+        _accumulate_moved(
+            deltas,
+            _moved_customers(session.connection(), edited_colleges, edited_universities, written_customers + new_customers),
+            1,
+        )
+
+    for objects, sign in ((session.new, 1), (session.deleted, -1)):
+        for obj in objects:
+            table_name = inspect(obj).mapper.local_table.name
+            if table_name in TOTAL_MODELS:
+                _add(deltas, TOTAL, table_name, sign)
+
+    if deltas:
+        _apply(session.connection(), deltas)
+
+
+@click.command('reconcile-counters')
+@with_appcontext
+def reconcile_counters_command():
+    """Recount the dashboard counters and repair any that drifted."""
+
+    repaired = reconcile_counters()
+    click.echo(f"Dashboard counters reconciled: {repaired} repaired.")
@@ -0,0 +1,118 @@
+"""Portable date bucketing for time-series queries.
+
+``date_bucket('month', column)`` renders as ``strftime`` on SQLite and ``date_trunc``
+on PostgreSQL and yields the first day of the bucket as ``'YYYY-MM-DD'`` text on
+both, so grouped rows look the same whatever the backend. Weeks start on Monday,
+as ISO weeks and ``date_trunc`` do. Empty buckets are filled with pandas, not
+Python loops.
+"""
+
+from datetime import date, datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+from sqlalchemy import String
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.sql.visitors import InternalTraversal
+
+BUCKETS = ('day', 'week', 'month', 'quarter')
+# Number of buckets shown when a series is requested without a start date.
+DEFAULT_SPANS = {'day': 30, 'week': 12, 'month': 12, 'quarter': 8}
+MAX_BUCKETS = 1_000
+
+# pandas period aliases whose periods start where our buckets do (W-SUN weeks run Monday to Sunday).
+_PERIODS = {'day': 'D', 'week': 'W-SUN', 'month': 'M', 'quarter': 'Q'}
+
+
+class date_bucket(FunctionElement):
+    """The first day of ``column``'s day/week/month/quarter as ``'YYYY-MM-DD'`` text."""
+
+    type = String()
+    inherit_cache = True
+    # The bucket is compiled into the SQL text, so it must be part of the cache key.
+    _traverse_internals = FunctionElement._traverse_internals + [('bucket', InternalTraversal.dp_string)]
+
+    def __init__(self, bucket: str, column):
+        if bucket not in BUCKETS:
+            raise ValueError(f"Unknown date bucket '{bucket}'.")
+        self.bucket = bucket
+        super().__init__(column)
+
+
+@compiles(date_bucket)
+def _compile_date_bucket(element, compiler, **kw):
+    raise NotImplementedError(f"date_bucket is not supported on {compiler.dialect.name}.")
+
+
+@compiles(date_bucket, 'sqlite')
+def _compile_date_bucket_sqlite(element, compiler, **kw):
+    column = compiler.process(element.clauses, **kw)
+    if element.bucket == 'day':
+        return f"strftime('%Y-%m-%d', {column})"
+    if element.bucket == 'week':
+        # 'weekday 0' moves forward to Sunday (or stays on it); six days back is that week's Monday.
+        return f"date({column}, 'weekday 0', '-6 days')"
+    if element.bucket == 'month':
+        return f"strftime('%Y-%m-01', {column})"
+    return (
+        f"strftime('%Y-', {column}) || "
+        f"printf('%02d', (CAST(strftime('%m', {column}) AS INTEGER) - 1) / 3 * 3 + 1) || '-01'"
+    )
+
+
+@compiles(date_bucket, 'postgresql')
+def _compile_date_bucket_postgresql(element, compiler, **kw):
+    column = compiler.process(element.clauses, **kw)
+    return f"to_char(date_trunc('{element.bucket}', {column}), 'YYYY-MM-DD')"
+
+
+def bucket_start(bucket: str, value) -> datetime:
+    """Start of the bucket containing ``value``."""
+    return pd.Timestamp(value).to_period(_PERIODS[bucket]).start_time.to_pydatetime()
+
+
+def next_bucket_start(bucket: str, value) -> datetime:
+    """Start of the bucket after the one containing ``value``; use as an exclusive upper bound."""
+    return (pd.Timestamp(value).to_period(_PERIODS[bucket]) + 1).start_time.to_pydatetime()
+
+
+def default_start(bucket: str, end: date) -> datetime:
+    """Start of the window of ``DEFAULT_SPANS[bucket]`` buckets ending with the one containing ``end``."""
+    return (pd.Timestamp(end).to_period(_PERIODS[bucket]) - (DEFAULT_SPANS[bucket] - 1)).start_time.to_pydatetime()
+
+
+def bucket_count(bucket: str, start: date, end: date) -> int:
+    """Number of buckets from the one containing ``start`` to the one containing ``end``."""
+    period = _PERIODS[bucket]
+    return (pd.Timestamp(end).to_period(period) - pd.Timestamp(start).to_period(period)).n + 1
+
+
+def fill_buckets(
+    rows: Sequence[Tuple],
+    bucket: str,
+    columns: Sequence[str],
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+) -> Tuple[List[str], Dict[str, list]]:
+    """Spread ``(label, value, ...)`` rows over every bucket from ``start`` to ``end``, filling gaps with 0.
+
+    Labels may be any date inside a bucket (finer-grained rows are summed into
+    their bucket). Without ``start``/``end`` the range spans the rows themselves.
+    Returns the bucket labels and one list of values per column.
+    """
+
+    frame = pd.DataFrame(list(rows), columns=['label', *columns])
+    periods = pd.to_datetime(frame['label']).dt.to_period(_PERIODS[bucket])
+    totals = frame[list(columns)].groupby(periods.values).sum()
+
+    if start is None or end is None:
+        if totals.empty:
+            return [], {column: [] for column in columns}
+        start = totals.index.min().start_time if start is None else start
+        end = totals.index.max().start_time if end is None else end
+    index = pd.period_range(pd.Timestamp(start).to_period(_PERIODS[bucket]), pd.Timestamp(end).to_period(_PERIODS[bucket]))
+    totals = totals.reindex(index, fill_value=0)
+
+    labels = index.start_time.strftime('%Y-%m-%d').tolist()
+    return labels, {column: totals[column].tolist() for column in columns}
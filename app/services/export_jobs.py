@@ -0,0 +1,131 @@
+"""Background generation of large spreadsheet exports.
+
+Exports over ``XLSX_BACKGROUND_CELLS`` are recorded as an ``ExportJob`` and written
+to ``EXPORT_FOLDER`` by a small in-process pool, like background imports. The
+requesting page polls the job and downloads the file once it is completed. Files
+are kept for ``EXPORT_RETENTION_SECONDS``; each new export sweeps away older ones.
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, UTC
+from typing import Mapping, Optional
+
+from flask import Flask, current_app
+from flask_login import current_user
+from sqlalchemy import select, update
+
+from .. import db
+from ..models import ExportJob
+from .xlsx_export import EXPORTS, write_xlsx
+
+_EXTENSION_KEY = 'export_jobs'
+_executor_lock = threading.Lock()
+
+
+def _get_executor(app: Flask) -> ThreadPoolExecutor:
+    executor = app.extensions.get(_EXTENSION_KEY)
+    if executor is None:
+        with _executor_lock:
+            executor = app.extensions.get(_EXTENSION_KEY)
+            if executor is None:
+                executor = ThreadPoolExecutor(
+                    max_workers=app.config['EXPORT_JOB_WORKERS'],
+                    thread_name_prefix='export-job',
+                )
+                app.extensions[_EXTENSION_KEY] = executor
+    return executor
+
+
+def submit_export(kind: str, params: Mapping, user_id) -> int:
+    """Record a queued export of ``kind`` with ``params``, hand it to the pool and return its id."""
+
+    expire_exports()
+    job = ExportJob(kind=kind, filename=EXPORTS[kind].filename(), params=json.dumps(params), user_id=user_id)
+    db.session.add(job)
+    db.session.flush()
+    job_id = job.id
+    db.session.commit()
+
+    app = current_app._get_current_object()
+    _get_executor(app).submit(_run_export, app, job_id)
+    return job_id
+
+
+def expire_exports() -> int:
+    """Delete export files older than ``EXPORT_RETENTION_SECONDS`` and return how many were removed.
+
+    The jobs stay listed without a file. Like ``fail_stale_jobs`` for imports, this
+    runs in its own transaction so the caller's session is left alone.
+    """
+
+    cutoff = datetime.now(UTC) - timedelta(seconds=current_app.config['EXPORT_RETENTION_SECONDS'])
+    with db.engine.begin() as connection:
+        expired = connection.execute(
+            select(ExportJob.id, ExportJob.stored_path)
+            .where(ExportJob.stored_path.is_not(None), ExportJob.finished_at < cutoff)
+        ).all()
+        for _, path in expired:
+            _remove_file(path)
+        if expired:
+            connection.execute(
+                update(ExportJob)
+                .where(ExportJob.id.in_([job_id for job_id, _ in expired]))
+                .values(stored_path=None, message='The export file has expired; run the export again.')
+            )
+    return len(expired)
+
+
+def load_visible_export(job_id: int) -> Optional[ExportJob]:
+    """Return an export the current user started; admins can see every export."""
+
+    job = db.session.get(ExportJob, job_id)
+    if job is None:
+        return None
+    if job.user_id != current_user.id and getattr(current_user, 'role', None) != 'admin':
+        return None
+    return job
+
+
+def _update_job(job_id: int, **values) -> None:
+    db.session.execute(update(ExportJob).where(ExportJob.id == job_id).values(**values))
+
+
+def _run_export(app: Flask, job_id: int) -> None:
+    with app.app_context():
+        job = db.session.get(ExportJob, job_id)
+        kind, params = job.kind, json.loads(job.params)
+        folder = app.config['EXPORT_FOLDER']
+        path = os.path.join(folder, f'export_{job_id}.xlsx')
+        _update_job(job_id, status='running', started_at=datetime.now(UTC))
+        db.session.commit()
+        try:
+            os.makedirs(folder, exist_ok=True)
+            rows = write_xlsx(EXPORTS[kind], params, path)
+        except Exception:
+            app.logger.exception("Export job %s failed: kind=%s params=%s", job_id, kind, params)
+            db.session.rollback()
+            _remove_file(path)
+            _update_job(job_id, status='failed', message='The export could not be completed.', finished_at=datetime.now(UTC))
+        else:
+            app.logger.info("Export job %s finished: kind=%s rows=%s", job_id, kind, rows)
+            _update_job(
+                job_id,
+                status='completed',
+                stored_path=path,
+                rows_written=rows,
+                message=f'{rows} rows exported.',
+                finished_at=datetime.now(UTC),
+            )
+        finally:
+            db.session.commit()
+            db.session.remove()
+
+
+def _remove_file(path) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
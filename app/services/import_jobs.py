@@ -0,0 +1,280 @@
+"""Import job bookkeeping and the bounded in-process pool that runs background imports.
+
+Job state, progress and rejected rows live in the ``ImportJob`` and
+``ImportRowError`` tables, so any worker process can answer a status poll or
+serve an error report, and no external broker is needed.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, UTC
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import pandas as pd
+from flask import Flask, current_app
+from flask_login import current_user
+from sqlalchemy import func, insert, update
+from werkzeug.datastructures import FileStorage
+
+from .. import db
+from ..models import ImportJob, ImportRowError
+from ..upload_utils import UploadError, stage_import_file, stream_staged_file
+from .import_service import ImportResult, RowError, import_customer_chunks
+from .catalogue_import_service import import_catalogue_chunks
+from .payment_import_service import import_payment_chunks
+
+_EXTENSION_KEY = 'import_jobs'
+ChunkCallback = Callable[[ImportResult, List[RowError]], None]
+_executor_lock = threading.Lock()
+
+
+def _get_executor(app: Flask) -> ThreadPoolExecutor:
+    executor = app.extensions.get(_EXTENSION_KEY)
+    if executor is None:
+        with _executor_lock:
+            executor = app.extensions.get(_EXTENSION_KEY)
+            if executor is None:
+                executor = ThreadPoolExecutor(
+                    max_workers=app.config['IMPORT_JOB_WORKERS'],
+                    thread_name_prefix='import-job',
+                )
+                app.extensions[_EXTENSION_KEY] = executor
+    return executor
+
+
+def create_import_job(
+    kind: str,
+    filename: str,
+    file_size: int,
+    user_id,
+    stored_path: Optional[str] = None,
+    mode: str = 'insert',
+    content_hash: Optional[str] = None,
+) -> int:
+    """Record a queued job and return its id."""
+
+    job = ImportJob(
+        kind=kind,
+        mode=mode,
+        filename=filename,
+        file_size=file_size,
+        stored_path=stored_path,
+        content_hash=content_hash,
+        user_id=user_id,
+    )
+    db.session.add(job)
+    db.session.flush()
+    job_id = job.id
+    db.session.commit()
+    return job_id
+
+
+def fail_stale_jobs() -> int:
+    """Mark queued or running jobs without progress for ``IMPORT_STALE_JOB_SECONDS`` as failed.
+
+    Jobs run in the worker process that queued them, so a restart leaves them
+    unfinished forever. A cutoff rather than a sweep at startup keeps other workers'
+    live jobs running. Returns the number of jobs marked failed.
+    """
+
+    cutoff = datetime.now(UTC) - timedelta(seconds=current_app.config['IMPORT_STALE_JOB_SECONDS'])
+    last_activity = func.coalesce(ImportJob.progress_at, ImportJob.started_at, ImportJob.created_at)
+    # Its own transaction, so the caller's session (and the loaded user) is not expired.
+    with db.engine.begin() as connection:
+        result = connection.execute(
+            update(ImportJob)
+            .where(ImportJob.status.in_(('queued', 'running')), last_activity < cutoff)
+            .values(status='failed', message='The import was interrupted before it finished.', finished_at=datetime.now(UTC))
+        )
+    return result.rowcount
+
+
+def find_duplicate_job(kind: str, content_hash: str, user_id, mode: str = 'insert') -> Optional[ImportJob]:
+    """Return the user's latest queued, running or completed job for the same file, kind and mode.
+
+    Failed jobs are ignored so a file can be retried after an error; callers run
+    ``fail_stale_jobs`` first so orphaned jobs count as failed.
+    """
+
+    if not content_hash:
+        return None
+    return (
+        ImportJob.query
+        .filter_by(user_id=user_id, kind=kind, mode=mode, content_hash=content_hash)
+        .filter(ImportJob.status != 'failed')
+        .order_by(ImportJob.id.desc())
+        .first()
+    )
+
+
+def load_visible_job(job_id: int) -> Optional[ImportJob]:
+    """Return a job the current user started; admins can see every job."""
+
+    job = db.session.get(ImportJob, job_id)
+    if job is None:
+        return None
+    if job.user_id != current_user.id and getattr(current_user, 'role', None) != 'admin':
+        return None
+    return job
+
+
+def run_customer_import(job_id: int, chunks: Iterable[pd.DataFrame], mode: str = 'insert') -> ImportResult:
+    """Run the chunked customer import for a job and mark it completed or failed."""
+
+    return _run_import(job_id, lambda on_chunk: import_customer_chunks(chunks, on_chunk=on_chunk, mode=mode))
+
+
+def run_payment_import(job_id: int, chunks: Iterable[pd.DataFrame], mode: str = 'insert') -> ImportResult:
+    """Run the chunked payment import for a job; payments only support ``insert``."""
+
+    return _run_import(job_id, lambda on_chunk: import_payment_chunks(chunks, on_chunk=on_chunk))
+
+
+def run_catalogue_import(job_id: int, chunks: Iterable[pd.DataFrame], mode: str = 'insert') -> ImportResult:
+    """Run the chunked academic catalogue import for a job; existing entries are always kept."""
+
+    return _run_import(job_id, lambda on_chunk: import_catalogue_chunks(chunks, on_chunk=on_chunk))
+
+
+def _run_import(job_id: int, importer: Callable[[ChunkCallback], ImportResult]) -> ImportResult:
+    """Drive ``importer`` with a progress callback and mark the job completed or failed.
+
+    Progress counters and the chunk's rejected rows are written in the same
+    transaction as its rows. Exceptions are recorded on the job and re-raised.
+    Job rows are only ever updated by id, so bookkeeping adds no SELECTs.
+    """
+
+    _update_job(job_id, status='running', started_at=datetime.now(UTC))
+    db.session.commit()
+
+    def record_chunk(result: ImportResult, errors: List[RowError]) -> None:
+        _update_job(
+            job_id,
+            progress_at=datetime.now(UTC),
+            rows_processed=result.rows,
+            inserted=result.inserted,
+            updated=result.updated,
+            existing=result.existing,
+            skipped=result.skipped,
+        )
+        if errors:
+            db.session.execute(
+                insert(ImportRowError),
+                [{'job_id': job_id, 'row_number': row, 'message': message} for row, message in errors],
+            )
+
+    try:
+        result = importer(record_chunk)
+    except UploadError as err:
+        _finish_job(job_id, 'failed', err.user_message)
+        raise
+    except Exception as exc:
+        _finish_job(job_id, 'failed', f'Database error: {exc}')
+        raise
+
+    if result.rows:
+        _finish_job(job_id, 'completed', result.summary)
+    else:
+        _finish_job(job_id, 'failed', 'Uploaded file does not contain any rows to import.')
+    return result
+
+
+def _update_job(job_id: int, **values) -> None:
+    db.session.execute(update(ImportJob).where(ImportJob.id == job_id).values(**values))
+
+
+def _finish_job(job_id: int, status: str, message: str) -> None:
+    _update_job(job_id, status=status, message=message, finished_at=datetime.now(UTC))
+    db.session.commit()
+
+
+def submit_import(
+    kind: str,
+    file_storage: FileStorage,
+    user_id,
+    mode: str = 'insert',
+    allow_duplicate: bool = False,
+) -> Tuple[int, bool]:
+    """Stage an upload, record a queued job of ``kind`` and hand it to the pool.
+
+    Returns ``(job_id, duplicate)``. Unless ``allow_duplicate`` is set, a file the
+    user already imported (see ``find_duplicate_job``) is not queued again; the
+    earlier job's id is returned with ``duplicate`` set instead. Raises
+    ``UploadError`` when the upload fails the synchronous checks.
+    """
+
+    staged = stage_import_file(file_storage, current_app.config['IMPORT_UPLOAD_FOLDER'])
+    if not allow_duplicate:
+        fail_stale_jobs()
+        earlier = find_duplicate_job(kind, staged.content_hash, user_id, mode)
+        if earlier is not None:
+            _remove_staged_file(staged.path)
+            return earlier.id, True
+
+    job_id = create_import_job(
+        kind,
+        staged.filename,
+        staged.file_size,
+        user_id,
+        stored_path=staged.path,
+        mode=mode,
+        content_hash=staged.content_hash,
+    )
+
+    app = current_app._get_current_object()
+    _get_executor(app).submit(_run_staged_import, app, job_id)
+    return job_id, False
+
+
+IMPORT_RUNNERS = {
+    'customers': run_customer_import,
+    'payments': run_payment_import,
+    'catalogue': run_catalogue_import,
+}
+
+
+def _run_staged_import(app: Flask, job_id: int) -> None:
+    with app.app_context():
+        job = db.session.get(ImportJob, job_id)
+        stored_path, filename, user_id, mode, kind = job.stored_path, job.filename, job.user_id, job.mode, job.kind
+        upload = None
+        try:
+            upload = stream_staged_file(stored_path, filename)
+            result = IMPORT_RUNNERS[kind](job_id, upload.chunks, mode)
+        except UploadError:
+            pass  # Already recorded on the job for the status poll.
+        except Exception:
+            app.logger.exception("Import job %s failed: kind=%s filename=%s", job_id, kind, filename)
+            db.session.rollback()
+            if not db.session.get(ImportJob, job_id).is_finished:
+                _finish_job(job_id, 'failed', 'The import could not be completed.')
+        else:
+            app.logger.info(
+                "Import job %s finished: kind=%s user_id=%s filename=%s mode=%s rows=%s inserted=%s updated=%s skipped=%s",
+                job_id,
+                kind,
+                user_id,
+                filename,
+                mode,
+                result.rows,
+                result.inserted,
+                result.updated,
+                result.skipped,
+            )
+        finally:
+            if upload is not None:
+                upload.close()
+            _remove_staged_file(stored_path)
+            _update_job(job_id, stored_path=None)
+            db.session.commit()
+            db.session.remove()
+
+
+def _remove_staged_file(path) -> None:
+    if not path:
+        return
+    try:
+        os.remove(path)
+    except OSError:
+        current_app.logger.warning("Could not remove staged import file %s", path)
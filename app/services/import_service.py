@@ -0,0 +1,286 @@
+"""Customer import pipeline that validates and persists uploads one chunk at a time."""
+
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import pandas as pd
+from sqlalchemy import func, insert, or_, update
+
+from .. import db
+from ..models import College, Country, Customer, University
+from .customer_search import reindex_customers
+from .dashboard_counters import count_new_customers, recount_customers
+from .phone_keys import phone_keys
+
+COLLEGE_KEY_COLUMNS = ['country_key', 'university_key', 'college_key']
+CUSTOMER_COLUMNS = ['full_name', 'email', 'whatsapp_number', 'phone_key', 'year', 'college_id']
+IMPORT_MODES = ('insert', 'skip_existing', 'update_existing')
+
+# (spreadsheet row number, message) for a row that failed validation.
+RowError = Tuple[int, str]
+
+
+@dataclass
+class ImportResult:
+    """Running totals for a customer import.
+
+    Row errors are not accumulated here; they are handed to ``on_chunk`` one chunk
+    at a time so callers can persist them without holding the whole set in memory.
+    """
+
+    label: str = 'customers'
+    rows: int = 0
+    inserted: int = 0
+    updated: int = 0
+    existing: int = 0  # Rows left alone because the customer already exists
+    skipped: int = 0
+
+    @property
+    def summary(self) -> str:
+        message = f"Successfully imported {self.inserted} {self.label}."
+        if self.updated:
+            message += f" Updated {self.updated} existing {self.label}."
+        if self.existing:
+            message += f" Skipped {self.existing} {self.label} that already exist."
+        if self.skipped:
+            message += f" Skipped {self.skipped} rows with validation errors."
+        return message
+
+
+def build_college_frame() -> pd.DataFrame:
+    """Load lower-cased (country, university, college) keys and college, university and country ids with one query."""
+
+    rows = (
+        db.session.query(Country.name, University.name, College.name, College.id, University.id, Country.id)
+        .join(University, University.country_id == Country.id)
+        .join(College, College.university_id == University.id)
+        .all()
+    )
+    frame = pd.DataFrame(rows, columns=['country', 'university', 'college', 'college_id', 'university_id', 'country_id'])
+    for column, key in zip(('country', 'university', 'college'), COLLEGE_KEY_COLUMNS):
+        frame[key] = frame[column].str.lower()
+    # Mirror the old dict lookup: a repeated name resolves to the last college loaded.
+    columns = COLLEGE_KEY_COLUMNS + ['college_id', 'university_id', 'country_id']
+    return frame.drop_duplicates(COLLEGE_KEY_COLUMNS, keep='last')[columns]
+
+
+def _text_column(df: pd.DataFrame, name: str) -> pd.Series:
+    """Return a whole column as stripped strings, with missing cells as ''."""
+
+    if name not in df.columns:
+        return pd.Series('', index=df.index, dtype=object)
+    column = df[name]
+    return column.where(column.notna(), '').astype(str).str.strip()
+
+
+def _blank_to_none(column: pd.Series) -> pd.Series:
+    return column.where(column != '', None)
+
+
+def validate_customer_chunk(df: pd.DataFrame, colleges: pd.DataFrame) -> Tuple[List[dict], List[RowError]]:
+    """Turn one parsed chunk into insertable customer rows plus (row number, message) errors.
+
+    Columns are normalised in bulk, colleges are resolved with a single merge against
+    ``colleges`` (see ``build_college_frame``) and errors are selected with boolean masks.
+    """
+
+    customers, errors = _validate_customer_frame(df, colleges)
+    return _frame_records(customers), errors
+
+
+def _validate_customer_frame(df: pd.DataFrame, colleges: pd.DataFrame) -> Tuple[pd.DataFrame, List[RowError]]:
+    text = {name: _text_column(df, name) for name in ('full_name', 'email', 'whatsapp_number', 'year', 'country', 'university', 'college')}
+
+    keys = pd.DataFrame({
+        'country_key': text['country'].str.lower(),
+        'university_key': text['university'].str.lower(),
+        'college_key': text['college'].str.lower(),
+    }, index=df.index)
+    college_id = keys.merge(colleges, how='left', on=COLLEGE_KEY_COLUMNS)['college_id']
+    college_id.index = df.index
+
+    year = pd.to_numeric(text['year'].where(text['year'] != ''), errors='coerce')
+
+    missing_name = text['full_name'] == ''
+    missing_college = ~missing_name & college_id.isna()
+    bad_year = ~missing_name & ~missing_college & (
+        (year.isna() & (text['year'] != '')) | (year.notna() & (year % 1 != 0))
+    )
+
+    messages = pd.Series(None, index=df.index, dtype=object)
+    messages[missing_name] = 'Missing required full_name value.'
+    messages[missing_college] = (
+        "Could not find College '" + text['college'][missing_college]
+        + "' in University '" + text['university'][missing_college]
+        + "' / Country '" + text['country'][missing_college] + "'."
+    )
+    messages[bad_year] = "Invalid year '" + text['year'][bad_year] + "'."
+
+    valid = messages.isna()
+    year = year[valid].astype('Int64').astype(object)
+    whatsapp_number = _blank_to_none(text['whatsapp_number'][valid])
+    customers = pd.DataFrame({
+        'full_name': text['full_name'][valid],
+        'email': _blank_to_none(text['email'][valid]),
+        'whatsapp_number': whatsapp_number,
+        # Bulk inserts skip the mapper events that key ORM-written numbers.
+        'phone_key': phone_keys(whatsapp_number),
+        'year': year.where(year.notna(), None),
+        'college_id': college_id[valid].astype('int64'),
+    }, columns=CUSTOMER_COLUMNS)
+
+    rejected = messages[~valid]
+    errors = list(zip((rejected.index + 2).tolist(), rejected.tolist()))
+
+    return customers, errors
+
+
+def _frame_records(frame: pd.DataFrame) -> List[dict]:
+    # Zipping plain lists is several times faster than DataFrame.to_dict('records').
+    columns = list(frame.columns)
+    return [dict(zip(columns, values)) for values in zip(*(frame[column].tolist() for column in columns))]
+
+
+def _email_key(emails: pd.Series) -> pd.Series:
+    return emails.str.lower()
+
+
+def _duplicate_rows(customers: pd.DataFrame, keep: str) -> pd.Series:
+    """Flag rows that repeat an earlier (or later) row's phone or email within the same college."""
+
+    duplicated = pd.Series(False, index=customers.index)
+    for key in (customers['phone_key'], _email_key(customers['email'])):
+        keyed = pd.DataFrame({'college_id': customers['college_id'], 'key': key})[key.notna()]
+        duplicated |= keyed.duplicated(keep=keep).reindex(customers.index, fill_value=False).astype(bool)
+    return duplicated
+
+
+def find_existing_customer_ids(customers: pd.DataFrame) -> pd.Series:
+    """Resolve validated rows to existing customer ids (NaN when new) with one query.
+
+    A row matches a customer in the same college with the same phone key, or
+    failing that the same case-insensitive email.
+    """
+
+    email_key = _email_key(customers['email'])
+    phone_key = customers['phone_key']
+    emails = email_key.dropna().unique().tolist()
+    phones = phone_key.dropna().unique().tolist()
+
+    matches = pd.Series(float('nan'), index=customers.index)
+    if not emails and not phones:
+        return matches
+
+    conditions = []
+    if emails:
+        conditions.append(func.lower(Customer.email).in_(emails))
+    if phones:
+        conditions.append(Customer.phone_key.in_(phones))
+    rows = (
+        db.session.query(Customer.id, Customer.college_id, Customer.email, Customer.phone_key)
+        .filter(Customer.college_id.in_(customers['college_id'].unique().tolist()), or_(*conditions))
+        .order_by(Customer.id)
+        .all()
+    )
+    if not rows:
+        return matches
+
+    existing = pd.DataFrame(rows, columns=['id', 'college_id', 'email', 'phone_key'])
+    by_phone = _match_on(customers['college_id'], phone_key, existing['college_id'], existing['phone_key'], existing['id'])
+    by_email = _match_on(customers['college_id'], email_key, existing['college_id'], _email_key(existing['email']), existing['id'])
+    return by_phone.fillna(by_email)
+
+
+def _match_on(college_id: pd.Series, key: pd.Series, existing_college_id: pd.Series, existing_key: pd.Series, existing_id: pd.Series) -> pd.Series:
+    table = (
+        pd.DataFrame({'college_id': existing_college_id, 'key': existing_key, 'id': existing_id})
+        .dropna(subset=['key'])
+        .drop_duplicates(['college_id', 'key'])
+    )
+    probe = pd.DataFrame({'college_id': college_id, 'key': key})
+    matched = probe.merge(table, how='left', on=['college_id', 'key'])['id']
+    matched.index = college_id.index
+    return matched
+
+
+def _update_records(customers: pd.DataFrame, customer_ids: pd.Series) -> List[dict]:
+    """Build primary-key update rows; blank cells leave the stored value untouched."""
+
+    updates = []
+    fields = [column for column in CUSTOMER_COLUMNS if column != 'college_id']
+    for customer_id, record in zip(customer_ids.astype('int64').tolist(), _frame_records(customers[fields])):
+        values = {column: value for column, value in record.items() if value is not None}
+        values['id'] = customer_id
+        updates.append(values)
+    return updates
+
+
+def import_customer_chunks(
+    chunks: Iterable[pd.DataFrame],
+    colleges: Optional[pd.DataFrame] = None,
+    on_chunk: Optional[Callable[[ImportResult, List[RowError]], None]] = None,
+    mode: str = 'insert',
+) -> ImportResult:
+    """Validate and insert each chunk as its own committed batch before reading the next.
+
+    ``mode`` is one of ``IMPORT_MODES``: ``insert`` always adds rows, ``skip_existing``
+    leaves customers that already exist alone and ``update_existing`` overwrites them
+    with the file's non-blank values. Existing customers are looked up once per chunk.
+
+    Only one chunk is held in memory at a time. ``on_chunk`` receives the running totals
+    and that chunk's row errors before each commit, so whatever it records lands in
+    the same transaction as the chunk's rows. Chunks committed before a database error
+    stay committed; the exception propagates after the session is rolled back.
+    """
+
+    if mode not in IMPORT_MODES:
+        raise ValueError(f"Unknown import mode: {mode}")
+    if colleges is None:
+        colleges = build_college_frame()
+
+    # College id -> its university and country ids, for the dashboard counters.
+    parents = colleges.set_index('college_id')[['university_id', 'country_id']].to_dict('index')
+
+    result = ImportResult()
+    for chunk in chunks:
+        customers, errors = _validate_customer_frame(chunk, colleges)
+        result.rows += len(chunk)
+        result.skipped += len(errors)
+        updates = []
+
+        try:
+            if mode != 'insert' and not customers.empty:
+                repeated = _duplicate_rows(customers, keep='last' if mode == 'update_existing' else 'first')
+                customers = customers[~repeated]
+                existing_ids = find_existing_customer_ids(customers)
+                matched = existing_ids.notna()
+                if mode == 'update_existing':
+                    updates = _update_records(customers[matched], existing_ids[matched])
+                result.existing += int(repeated.sum()) + (0 if mode == 'update_existing' else int(matched.sum()))
+                customers = customers[~matched]
+
+            records = _frame_records(customers)
+            if records:
+                inserted = db.session.execute(
+                    insert(Customer).returning(Customer.id, Customer.college_id, Customer.year, Customer.creation_date),
+                    records,
+                ).mappings().all()
+                # Bulk writes skip the session events that maintain the dashboard counters
+                # and the search index.
+                count_new_customers([{**row, **parents[row['college_id']]} for row in inserted])
+                reindex_customers(row['id'] for row in inserted)
+            if updates:
+                updated_ids = [values['id'] for values in updates]
+                with recount_customers(updated_ids):
+                    db.session.execute(update(Customer), updates)
+                reindex_customers(updated_ids)
+            result.inserted += len(records)
+            result.updated += len(updates)
+            if on_chunk is not None:
+                on_chunk(result, errors)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    return result
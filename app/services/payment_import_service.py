@@ -0,0 +1,221 @@
+"""Payment import pipeline: resolves customers, subjects and methods once per chunk."""
+
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+from sqlalchemy import insert, or_
+
+from .. import db
+from ..models import College, Country, Customer, Module, Payment, PaymentMethod, Subject, Term, University
+from .import_service import COLLEGE_KEY_COLUMNS, ImportResult, RowError, _frame_records, _text_column
+from .dashboard_counters import count_payment_rows
+from .phone_keys import phone_keys
+from .revenue_summary import add_payment_rows
+
+SUBJECT_KEY_COLUMNS = COLLEGE_KEY_COLUMNS + ['year', 'period_key', 'subject_key']
+PAYMENT_COLUMNS = [
+    'customer_id',
+    'subject_id',
+    'payment_method_id',
+    'course_price_paid',
+    'application_price_paid',
+    'payment_date',
+    'notes',
+]
+TEXT_COLUMNS = (
+    'customer_id', 'whatsapp_number', 'country', 'university', 'college', 'year', 'term', 'module',
+    'subject', 'payment_method', 'course_price_paid', 'application_price_paid', 'payment_date', 'notes',
+)
+
+
+def build_subject_frame() -> pd.DataFrame:
+    """Load lower-cased (college path, year, term or module, subject) keys and subject ids with one query."""
+
+    rows = (
+        db.session.query(
+            Country.name, University.name, College.name, Subject.year,
+            Term.name, Module.name, Subject.name, Subject.id,
+        )
+        .select_from(Subject)
+        .join(College, Subject.college_id == College.id)
+        .join(University, College.university_id == University.id)
+        .join(Country, University.country_id == Country.id)
+        .outerjoin(Term, Subject.term_id == Term.id)
+        .outerjoin(Module, Subject.module_id == Module.id)
+        .all()
+    )
+    frame = pd.DataFrame(rows, columns=['country', 'university', 'college', 'year', 'term', 'module', 'subject', 'subject_id'])
+    for column, key in zip(('country', 'university', 'college'), COLLEGE_KEY_COLUMNS):
+        frame[key] = frame[column].astype(str).str.lower()
+    frame['year'] = frame['year'].astype('float64')
+    frame['period_key'] = frame['term'].fillna(frame['module']).fillna('').astype(str).str.lower()
+    frame['subject_key'] = frame['subject'].astype(str).str.lower()
+    return frame.drop_duplicates(SUBJECT_KEY_COLUMNS, keep='last')[SUBJECT_KEY_COLUMNS + ['subject_id']]
+
+
+def build_payment_method_map() -> Dict[str, int]:
+    """Map lower-cased payment method names to ids."""
+
+    return {name.lower(): method_id for method_id, name in db.session.query(PaymentMethod.id, PaymentMethod.name)}
+
+
+def _resolve_customers(customer_id: pd.Series, phone: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """Resolve rows to customer ids by id, else WhatsApp number (by phone key), with one query.
+
+    Returns the resolved ids (NaN when unresolved) and a mask of rows whose number
+    belongs to more than one customer.
+    """
+
+    phone = phone_keys(phone.where(phone != ''))
+    ids = customer_id.dropna().astype('int64').unique().tolist()
+    phones = phone[customer_id.isna()].dropna().unique().tolist()
+    resolved = pd.Series(float('nan'), index=customer_id.index)
+    ambiguous = pd.Series(False, index=customer_id.index)
+    if not ids and not phones:
+        return resolved, ambiguous
+
+    conditions = []
+    if ids:
+        conditions.append(Customer.id.in_(ids))
+    if phones:
+        conditions.append(Customer.phone_key.in_(phones))
+    rows = db.session.query(Customer.id, Customer.phone_key).filter(or_(*conditions)).all()
+    found = pd.DataFrame(rows, columns=['id', 'phone_key'])
+
+    known_ids = customer_id.where(customer_id.isin(found['id']))
+    by_phone = found[found['phone_key'].isin(phones)]
+    counts = by_phone['phone_key'].value_counts()
+    unique_phones = by_phone[by_phone['phone_key'].map(counts) == 1].set_index('phone_key')['id']
+
+    from_phone = phone.map(unique_phones).where(customer_id.isna())
+    resolved = known_ids.fillna(from_phone)
+    ambiguous = customer_id.isna() & phone.isin(counts[counts > 1].index)
+    return resolved, ambiguous
+
+
+def _parse_amount(text: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    amount = pd.to_numeric(text.where(text != ''), errors='coerce')
+    invalid = (amount.isna() & (text != '')) | (amount < 0)
+    return amount.fillna(0.0), invalid
+
+
+def validate_payment_chunk(
+    df: pd.DataFrame,
+    subjects: pd.DataFrame,
+    payment_methods: Dict[str, int],
+) -> Tuple[List[dict], List[RowError]]:
+    """Turn one parsed chunk into insertable payment rows plus (row number, message) errors.
+
+    Subjects and payment methods come from ``build_subject_frame`` and
+    ``build_payment_method_map``; customers are looked up with one query per chunk.
+    A blank term falls back to the module column, and blank amounts are recorded as 0.
+    Payment dates are required and must be ISO dates (YYYY-MM-DD, optionally with a time).
+    """
+
+    text = {name: _text_column(df, name) for name in TEXT_COLUMNS}
+
+    customer_id = pd.to_numeric(text['customer_id'].where(text['customer_id'] != ''), errors='coerce')
+    bad_customer_id = (customer_id.isna() & (text['customer_id'] != '')) | (customer_id.notna() & (customer_id % 1 != 0))
+    customer_id = customer_id.where(~bad_customer_id)
+    resolved_customer, ambiguous_phone = _resolve_customers(customer_id, text['whatsapp_number'])
+
+    year = pd.to_numeric(text['year'].where(text['year'] != ''), errors='coerce')
+    period = text['term'].where(text['term'] != '', text['module'])
+    keys = pd.DataFrame({
+        'country_key': text['country'].str.lower(),
+        'university_key': text['university'].str.lower(),
+        'college_key': text['college'].str.lower(),
+        'year': year.astype('float64'),
+        'period_key': period.str.lower(),
+        'subject_key': text['subject'].str.lower(),
+    }, index=df.index)
+    subject_id = keys.merge(subjects, how='left', on=SUBJECT_KEY_COLUMNS)['subject_id']
+    subject_id.index = df.index
+
+    payment_method_id = text['payment_method'].str.lower().map(payment_methods)
+    course_price, bad_course_price = _parse_amount(text['course_price_paid'])
+    application_price, bad_application_price = _parse_amount(text['application_price_paid'])
+    # Only ISO dates are read: '03/09/2024' could be either day or month first.
+    payment_date = pd.to_datetime(text['payment_date'].where(text['payment_date'] != ''), errors='coerce', format='ISO8601', utc=True)
+    bad_date = payment_date.isna() & (text['payment_date'] != '')
+
+    messages = pd.Series(None, index=df.index, dtype=object)
+
+    def reject(mask: pd.Series, message) -> None:
+        # The first failing check wins, so each row reports a single problem.
+        mask = mask & messages.isna()
+        messages[mask] = message if isinstance(message, str) else message[mask]
+
+    reject(bad_customer_id, "Invalid customer_id '" + text['customer_id'] + "'.")
+    reject((text['customer_id'] == '') & (text['whatsapp_number'] == ''), 'Missing customer_id or whatsapp_number value.')
+    reject(ambiguous_phone, "WhatsApp number '" + text['whatsapp_number'] + "' matches more than one customer; use customer_id.")
+    reject(
+        resolved_customer.isna(),
+        "Could not find customer '" + text['customer_id'].where(text['customer_id'] != '', text['whatsapp_number']) + "'.",
+    )
+    reject(
+        subject_id.isna(),
+        "Could not find Subject '" + text['subject'] + "' for year '" + text['year'] + "' / '" + period
+        + "' in College '" + text['college'] + "' / University '" + text['university'] + "'.",
+    )
+    reject(payment_method_id.isna(), "Could not find payment method '" + text['payment_method'] + "'.")
+    reject(bad_course_price, "Invalid course_price_paid '" + text['course_price_paid'] + "'.")
+    reject(bad_application_price, "Invalid application_price_paid '" + text['application_price_paid'] + "'.")
+    reject(text['payment_date'] == '', 'Missing payment_date value.')
+    reject(bad_date, "Invalid payment_date '" + text['payment_date'] + "'; use YYYY-MM-DD.")
+
+    valid = messages.isna()
+    payments = pd.DataFrame({
+        'customer_id': resolved_customer[valid].astype('int64'),
+        'subject_id': subject_id[valid].astype('int64'),
+        'payment_method_id': payment_method_id[valid].astype('int64'),
+        'course_price_paid': course_price[valid],
+        'application_price_paid': application_price[valid],
+        'payment_date': payment_date[valid].astype(object),
+        'notes': text['notes'][valid].where(text['notes'][valid] != '', None),
+    }, columns=PAYMENT_COLUMNS)
+    records = _frame_records(payments)
+    for record in records:
+        # Timestamp -> datetime so every DBAPI driver accepts it.
+        if isinstance(record['payment_date'], pd.Timestamp):
+            record['payment_date'] = record['payment_date'].to_pydatetime()
+
+    rejected = messages[~valid]
+    errors = list(zip((rejected.index + 2).tolist(), rejected.tolist()))
+    return records, errors
+
+
+def import_payment_chunks(
+    chunks: Iterable[pd.DataFrame],
+    on_chunk: Optional[Callable[[ImportResult, List[RowError]], None]] = None,
+) -> ImportResult:
+    """Validate and bulk-insert each chunk of payments as its own committed batch.
+
+    The subject catalogue and payment methods are loaded once for the whole file;
+    ``on_chunk`` behaves as in ``import_customer_chunks``.
+    """
+
+    subjects = build_subject_frame()
+    payment_methods = build_payment_method_map()
+
+    result = ImportResult(label='payments')
+    for chunk in chunks:
+        records, errors = validate_payment_chunk(chunk, subjects, payment_methods)
+        result.rows += len(chunk)
+        result.skipped += len(errors)
+
+        try:
+            if records:
+                db.session.execute(insert(Payment), records)
+                # Bulk inserts skip the session events that maintain the summary and counters.
+                add_payment_rows(records)
+                count_payment_rows(records)
+            result.inserted += len(records)
+            if on_chunk is not None:
+                on_chunk(result, errors)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    return result
@@ -0,0 +1,135 @@
+"""Normalised phone keys for customer WhatsApp numbers.
+
+``Customer.phone_key`` holds the number in an E.164-like form ('+' and digits), so
+lookups, import de-duplication and prefix searches compare indexed keys instead
+of scanning numbers as typed. Mapper events fill it on ORM inserts and updates;
+bulk imports set it themselves and ``flask backfill-phone-keys`` fills existing
+rows in batches. Numbers without any digits ('N/A') keep a NULL key, so there is
+no cheap way to tell a keyed table from one still to backfill; the backfill is
+run once from the CLI after upgrading, never at startup.
+
+Numbers without an international prefix ('+' or '00') get the default calling
+code: a leading trunk '0' is dropped, and short numbers are taken as national.
+"""
+
+from typing import Optional
+
+import click
+import pandas as pd
+from flask import current_app, has_app_context
+from flask.cli import with_appcontext
+from sqlalchemy import event, select, update
+
+from .. import db
+from ..models import Customer
+
+DEFAULT_COUNTRY_CODE = '20'
+# Digit strings at least this long without a prefix already carry a calling code.
+INTERNATIONAL_MIN_DIGITS = 11
+BACKFILL_BATCH_SIZE = 5_000
+
+
+def _country_code() -> str:
+    if has_app_context():
+        return current_app.config.get('PHONE_COUNTRY_CODE', DEFAULT_COUNTRY_CODE)
+    return DEFAULT_COUNTRY_CODE
+
+
+def _digits(number: str) -> str:
+    return ''.join(character for character in number if character.isdigit())
+
+
+def phone_key(number: Optional[str], country_code: Optional[str] = None) -> Optional[str]:
+    """The normalised key of a full number as typed, or ``None`` if it has no digits."""
+
+    if not number:
+        return None
+    country_code = country_code or _country_code()
+    number = number.strip()
+    digits = _digits(number)
+    if not digits:
+        return None
+    if number.startswith('+'):
+        return '+' + digits
+    if digits.startswith('00'):
+        return '+' + digits[2:]
+    if digits.startswith('0'):
+        return '+' + country_code + digits[1:]
+    if len(digits) >= INTERNATIONAL_MIN_DIGITS:
+        return '+' + digits
+    return '+' + country_code + digits
+
+
+def phone_keys(numbers: pd.Series) -> pd.Series:
+    """``phone_key`` of each number in a column, with ``None`` for blanks."""
+
+    country_code = _country_code()
+    return numbers.map(lambda number: phone_key(number, country_code) if isinstance(number, str) else None)
+
+
+def phone_prefix(term: Optional[str]) -> Optional[str]:
+    """The key prefix of a partly typed number, or ``None`` if it has no digits.
+
+    A partial number's length says nothing, so unlike ``phone_key`` digits that
+    already start with the default calling code are taken as international.
+    """
+
+    if not term or not _digits(term):
+        return None
+    country_code = _country_code()
+    digits = _digits(term)
+    if term.strip().startswith('+') or digits.startswith('00') or digits.startswith('0'):
+        return phone_key(term, country_code)
+    return '+' + (digits if digits.startswith(country_code) else country_code + digits)
+
+
+def phone_prefix_criteria(term: Optional[str]) -> list:
+    """A range filter matching keys that start with the typed number; an index range scan, not a LIKE."""
+
+    prefix = phone_prefix(term)
+    if prefix is None:
+        return []
+    # Keys are '+' and digits, so every key with the prefix sorts below prefix + ':'.
+    return [Customer.phone_key >= prefix, Customer.phone_key < prefix + ':']
+
+
+def backfill_phone_keys(batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """Fill missing keys in id order, committing each batch, and return how many rows were keyed."""
+
+    country_code = _country_code()
+    keyed, last_id = 0, 0
+    while True:
+        rows = db.session.execute(
+            select(Customer.id, Customer.whatsapp_number)
+            .where(Customer.id > last_id, Customer.phone_key.is_(None), Customer.whatsapp_number.is_not(None))
+            .order_by(Customer.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return keyed
+        updates = [
+            {'id': customer_id, 'phone_key': key}
+            for customer_id, number in rows
+            if (key := phone_key(number, country_code)) is not None
+        ]
+        if updates:
+            db.session.execute(update(Customer), updates)
+        db.session.commit()
+        keyed += len(updates)
+        last_id = rows[-1][0]
+
+
+@event.listens_for(Customer, 'before_insert')
+@event.listens_for(Customer, 'before_update')
+def _set_phone_key(mapper, connection, target):
+    target.phone_key = phone_key(target.whatsapp_number)
+
+
+@click.command('backfill-phone-keys')
+@click.option('--batch-size', default=BACKFILL_BATCH_SIZE, show_default=True)
+@with_appcontext
+def backfill_phone_keys_command(batch_size):
+    """Fill the normalised phone key of customers that lack one."""
+
+    keyed = backfill_phone_keys(batch_size)
+    click.echo(f"Phone keys backfilled: {keyed} customers.")
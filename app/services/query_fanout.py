@@ -0,0 +1,71 @@
+"""Run independent read-only queries concurrently on a bounded in-process pool.
+
+``gather`` hands each callable to a worker thread that pushes its own app
+context, so ``db.session`` there is a separate scoped session checked out on its
+own pooled connection, and it is released when the context ends. Page latency
+then approaches the slowest query instead of the sum of all of them.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Mapping
+
+from flask import Flask, current_app
+from sqlalchemy.pool import SingletonThreadPool, StaticPool
+
+from .. import db
+
+_EXTENSION_KEY = 'query_fanout'
+_executor_lock = threading.Lock()
+_worker = threading.local()
+
+
+def _get_executor(app: Flask) -> ThreadPoolExecutor:
+    executor = app.extensions.get(_EXTENSION_KEY)
+    if executor is None:
+        with _executor_lock:
+            executor = app.extensions.get(_EXTENSION_KEY)
+            if executor is None:
+                executor = ThreadPoolExecutor(
+                    max_workers=app.config['REPORT_QUERY_WORKERS'],
+                    thread_name_prefix='report-query',
+                )
+                app.extensions[_EXTENSION_KEY] = executor
+    return executor
+
+
+def _runs_inline(app: Flask, query_count: int) -> bool:
+    # In-memory SQLite shares one connection, and a worker waiting on its own pool would deadlock.
+    return (
+        query_count < 2
+        or app.config['REPORT_QUERY_WORKERS'] < 2
+        or getattr(_worker, 'active', False)
+        or isinstance(db.engine.pool, (StaticPool, SingletonThreadPool))
+    )
+
+
+def _run_in_app_context(app: Flask, query: Callable[[], Any]) -> Any:
+    with app.app_context():
+        _worker.active = True
+        try:
+            return query()
+        finally:
+            _worker.active = False
+            db.session.rollback()
+
+
+def gather(queries: Mapping[str, Callable[[], Any]]) -> Dict[str, Any]:
+    """Run ``queries`` concurrently and return their results under the same names.
+
+    Each callable must only read, and should return plain values (numbers, rows,
+    dicts) rather than ORM instances, since its session closes when it returns.
+    The first exception raised by any query is re-raised here.
+    """
+
+    app = current_app._get_current_object()
+    if _runs_inline(app, len(queries)):
+        return {name: query() for name, query in queries.items()}
+
+    executor = _get_executor(app)
+    futures = {name: executor.submit(_run_in_app_context, app, query) for name, query in queries.items()}
+    return {name: future.result() for name, future in futures.items()}
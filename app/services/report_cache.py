@@ -0,0 +1,195 @@
+"""Cached report results, invalidated by per-table version counters.
+
+Report routes build plain data (rows, totals, trees) that is the same for every
+user. ``cached_report`` keys it by report name and filter args plus the current
+version of each table the report reads. Every transaction that writes a tracked
+table bumps that table's ``TableVersion`` row before it commits, so once the
+write is visible to any gunicorn worker the new version is too, and older entries
+are never served again; they age out of the LRU.
+"""
+
+import pickle
+import threading
+from collections import OrderedDict
+from itertools import chain
+from typing import Any, Callable, Iterable, Mapping, Tuple
+
+from flask import current_app
+from sqlalchemy import event, inspect, insert, select, update
+from sqlalchemy.orm import Session
+
+from .. import db
+from ..models import TableVersion
+
+
+def rewrite_version_name(table: str) -> str:
+    return f'{table}:rewrites'
+
+
+# Tables whose updates and deletes are also counted under ``rewrite_version_name(table)``,
+# for readers that append new rows by id and only reload when existing rows change.
+REWRITE_TRACKED_TABLES = frozenset({'payment'})
+TRACKED_TABLES = frozenset({
+    'payment', 'subject', 'customer', 'instructor', 'payment_method',
+    'country', 'university', 'college', 'college_year', 'term', 'module',
+}) | {rewrite_version_name(table) for table in REWRITE_TRACKED_TABLES}
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+# session.info key for the tables already bumped in the current transaction.
+_BUMPED_KEY = 'report_cache_bumped'
+_MISSING = object()
+
+
+class ReportCache:
+    """In-process LRU of pickled report results, bounded by entry count and total bytes.
+
+    Values are stored pickled, which both measures their size and hands every
+    caller its own copy.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[Tuple, bytes]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def get(self, key: Tuple, default=None):
+        with self._lock:
+            blob = self._entries.get(key)
+            if blob is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return pickle.loads(blob)
+
+    def put(self, key: Tuple, value: Any) -> None:
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = blob
+            self._bytes += len(blob)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+def init_report_cache(app) -> None:
+    """Attach a ``ReportCache`` sized from config; ``REPORT_CACHE_MAX_ENTRIES=0`` disables caching."""
+
+    max_entries = app.config.get('REPORT_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+    if max_entries > 0:
+        app.extensions['report_cache'] = ReportCache(max_entries, app.config.get('REPORT_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+
+
+def table_versions(tables: Iterable[str]) -> Tuple[int, ...]:
+    tables = tuple(tables)
+    stored = dict(
+        db.session.query(TableVersion.table_name, TableVersion.version)
+        .filter(TableVersion.table_name.in_(tables))
+        .all()
+    )
+    return tuple(stored.get(table, 0) for table in tables)
+
+
+def cached_report(name: str, tables: Iterable[str], params: Mapping[str, Any], build: Callable[[], Any]):
+    """Return ``build()`` for this report and ``params``, reusing it until one of ``tables`` is written.
+
+    ``build`` must return plain, picklable data (no ORM instances), since the result
+    is shared across requests and users.
+    """
+
+    cache = current_app.extensions.get('report_cache')
+    if cache is None:
+        return build()
+
+    tables = tuple(sorted(tables))
+    key = (name, tuple(sorted(params.items())), table_versions(tables))
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        value = build()
+        cache.put(key, value)
+    return value
+
+
+def bump_table_versions(connection, tables: Iterable[str]) -> None:
+    """Increment the version rows of ``tables`` on ``connection``, creating missing ones."""
+
+    tables = sorted(tables)
+    if not tables:
+        return
+    result = connection.execute(
+        update(TableVersion)
+        .where(TableVersion.table_name.in_(tables))
+        .values(version=TableVersion.version + 1)
+    )
+    if result.rowcount < len(tables):
+        existing = set(connection.execute(select(TableVersion.table_name).where(TableVersion.table_name.in_(tables))).scalars())
+        connection.execute(insert(TableVersion), [{'table_name': table, 'version': 1} for table in tables if table not in existing])
+
+
+def ensure_table_versions() -> None:
+    """Create the version rows up front so concurrent writers only ever UPDATE them."""
+
+    existing = set(db.session.scalars(select(TableVersion.table_name)))
+    missing = TRACKED_TABLES - existing
+    if missing:
+        db.session.add_all(TableVersion(table_name=table, version=0) for table in sorted(missing))
+        db.session.commit()
+
+
+def _bump_once(session, tables: Iterable[str]) -> None:
+    bumped = session.info.setdefault(_BUMPED_KEY, set())
+    pending = (set(tables) & TRACKED_TABLES) - bumped
+    if pending:
+        bump_table_versions(session.connection(), pending)
+        bumped.update(pending)
+
+
+def _table_name(obj) -> str:
+    return inspect(obj).mapper.local_table.name
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_flushed_tables(session, flush_context):
+    changed = [obj for obj in session.dirty if session.is_modified(obj, include_collections=False)]
+    rewritten = {_table_name(obj) for obj in chain(session.deleted, changed)}
+    written = rewritten | {_table_name(obj) for obj in session.new}
+    _bump_once(session, written | {rewrite_version_name(table) for table in rewritten & REWRITE_TRACKED_TABLES})
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _bump_bulk_tables(orm_execute_state):
+    # Bulk INSERT/UPDATE/DELETE statements (imports, query.delete()) skip the flush.
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None:
+            table = mapper.local_table.name
+            rewritten = not orm_execute_state.is_insert and table in REWRITE_TRACKED_TABLES
+            _bump_once(orm_execute_state.session, {table, rewrite_version_name(table)} if rewritten else {table})
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _reset_bumped_tables(session):
+    session.info.pop(_BUMPED_KEY, None)
@@ -0,0 +1,556 @@
+"""Report aggregates computed in SQL, so page cost follows the number of groups rather than payments.
+
+Report pages render grouped totals read from ``RevenueSummary``; the rows under a
+node (subjects, payments) are served by drill-down endpoints one keyset page at a time.
+"""
+
+import base64
+import json
+from datetime import date, datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import DateTime, case, func, literal, select, tuple_
+
+from .. import db
+from ..models import (
+    College, CommunicationLog, Country, Customer, DashboardCounter, Module, Payment, PaymentMethod, RevenueSummary, Subject,
+    Term, University,
+)
+from .dashboard_counters import CUSTOMERS_BY_MONTH, PAYMENTS_BY_MONTH
+from .date_buckets import bucket_start, date_bucket, fill_buckets, next_bucket_start
+from .rollup import RollupNode, build_rollup, structure_path
+
+DRILLDOWN_PAGE_SIZE = 50
+MAX_DRILLDOWN_PAGE_SIZE = 200
+
+# Tables each cached report reads (see report_cache.cached_report).
+REPORTS_HUB_TABLES = ('instructor', 'university', 'college')
+INSTRUCTOR_REPORT_TABLES = ('payment', 'subject', 'instructor', 'country', 'university', 'college', 'term', 'module')
+APPLICATION_REPORT_TABLES = ('payment', 'subject', 'university', 'college', 'term', 'module')
+
+
+class InvalidCursor(ValueError):
+    """A drill-down cursor that was not produced by ``encode_cursor`` for this ordering."""
+
+
+def encode_cursor(values: Sequence) -> str:
+    """Pack the sort key of the last row on a page into an opaque URL-safe token."""
+
+    plain = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(plain).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: str, sort_columns: Sequence) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        if not isinstance(values, list) or len(values) != len(sort_columns):
+            raise InvalidCursor(token)
+        return [
+            datetime.fromisoformat(value) if isinstance(column.type, DateTime) else value
+            for column, value in zip(sort_columns, values)
+        ]
+    except (ValueError, TypeError) as exc:
+        raise InvalidCursor(token) from exc
+
+
+def keyset_page(query, sort_columns: Sequence, cursor: Optional[str], limit: int, descending: bool = False) -> Tuple[list, Optional[str]]:
+    """Return one page of ``query`` after ``cursor`` plus the cursor for the next page.
+
+    ``query`` must select the ``sort_columns`` first, and together they must be
+    unique per row. Seeking on the row value instead of using OFFSET keeps every
+    page equally cheap however deep the reader scrolls.
+    """
+
+    key = tuple_(*sort_columns)
+    if cursor:
+        after = tuple_(*(literal(value, column.type) for column, value in zip(sort_columns, decode_cursor(cursor, sort_columns))))
+        query = query.filter(key < after if descending else key > after)
+    ordering = [column.desc() if descending else column.asc() for column in sort_columns]
+    rows = query.order_by(*ordering).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][:len(sort_columns)])
+    return rows, next_cursor
+
+
+def page_size(requested: Optional[int]) -> int:
+    if not requested or requested < 1:
+        return DRILLDOWN_PAGE_SIZE
+    return min(requested, MAX_DRILLDOWN_PAGE_SIZE)
+
+
+def instructor_subject_totals(instructor_id: int) -> List[dict]:
+    """Return one row per paid subject of an instructor with its location path and totals.
+
+    Reads the pre-aggregated ``RevenueSummary`` (one row per subject and month), so
+    the cost follows the number of groups rather than payments; rows come back
+    ordered by location so the tree built from them is stable.
+    """
+
+    rows = (
+        db.session.query(
+            Subject.id,
+            Subject.name,
+            Subject.year,
+            Country.name,
+            University.name,
+            College.name,
+            Term.name,
+            Module.name,
+            func.sum(RevenueSummary.course_revenue),
+            func.sum(RevenueSummary.payment_count),
+        )
+        .select_from(RevenueSummary)
+        .join(Subject, RevenueSummary.subject_id == Subject.id)
+        .join(College, Subject.college_id == College.id)
+        .outerjoin(University, College.university_id == University.id)
+        .outerjoin(Country, University.country_id == Country.id)
+        .outerjoin(Term, Subject.term_id == Term.id)
+        .outerjoin(Module, Subject.module_id == Module.id)
+        .filter(RevenueSummary.instructor_id == instructor_id)
+        .group_by(
+            Subject.id, Subject.name, Subject.year, Country.name, University.name,
+            College.name, Term.name, Module.name,
+        )
+        .order_by(Country.name, University.name, College.name, Subject.year, Term.name, Module.name, Subject.name)
+        .all()
+    )
+
+    return [
+        {
+            'subject_id': subject_id,
+            'name': name,
+            'year': year,
+            'country': country,
+            'university': university,
+            'college': college,
+            'term': term,
+            'module': module,
+            'revenue': float(total),
+            'payment_count': count,
+        }
+        for subject_id, name, year, country, university, college, term, module, total, count in rows
+    ]
+
+
+def instructor_unique_students(instructor_id: int) -> int:
+    """Count distinct paying customers across an instructor's subjects."""
+
+    return (
+        db.session.query(func.count(func.distinct(Payment.customer_id)))
+        .join(Subject, Payment.subject_id == Subject.id)
+        .filter(Subject.instructor_id == instructor_id)
+        .scalar()
+    ) or 0
+
+
+def build_location_tree(subject_rows: List[dict]) -> RollupNode:
+    """Nest subject totals as Country → University → College → Year → Term/Module → Subject.
+
+    Subjects with neither a term nor a module are grouped under a ``General`` term.
+    Rows missing part of the location path are left out, as before. Each subject
+    node keeps its rows as payloads, since subjects are keyed by name and may merge
+    several subject ids.
+    """
+
+    return build_rollup(
+        (
+            (
+                row['country'], row['university'], row['college'], row['year'],
+                *structure_path(row['term'], row['module']), row['name'],
+            ),
+            row['revenue'],
+            row,
+        )
+        for row in subject_rows
+        if row['country'] and row['university'] and row['college']
+    )
+
+
+def payment_page(
+    *criteria,
+    amount=Payment.course_price_paid,
+    cursor: Optional[str] = None,
+    limit: int = DRILLDOWN_PAGE_SIZE,
+) -> Tuple[List[dict], Optional[str]]:
+    """Return one page of payments matching ``criteria``, newest first.
+
+    ``criteria`` may refer to ``Payment``, ``Subject`` and ``Customer``; ``amount``
+    is the expression reported for each payment.
+    """
+
+    query = (
+        db.session.query(
+            Payment.payment_date, Payment.id, amount, Customer.id, Customer.full_name, PaymentMethod.name,
+        )
+        .select_from(Payment)
+        .join(Subject, Payment.subject_id == Subject.id)
+        .join(Customer, Payment.customer_id == Customer.id)
+        .outerjoin(PaymentMethod, Payment.payment_method_id == PaymentMethod.id)
+        .filter(*criteria)
+    )
+    rows, next_cursor = keyset_page(query, [Payment.payment_date, Payment.id], cursor, limit, descending=True)
+    payments = [
+        {
+            'id': payment_id,
+            'payment_date': payment_date.strftime('%Y-%m-%d'),
+            'amount': float(value or 0),
+            'customer_id': customer_id,
+            'customer_name': full_name,
+            'payment_method': method,
+        }
+        for payment_date, payment_id, value, customer_id, full_name, method in rows
+    ]
+    return payments, next_cursor
+
+
+def subject_total_page(
+    *criteria,
+    amount=Payment.course_price_paid,
+    cursor: Optional[str] = None,
+    limit: int = DRILLDOWN_PAGE_SIZE,
+) -> Tuple[List[dict], Optional[str]]:
+    """Return one page of per-subject totals for payments matching ``criteria``, by subject name."""
+
+    query = (
+        db.session.query(Subject.name, Subject.id, func.coalesce(func.sum(amount), 0.0), func.count(Payment.id))
+        .select_from(Payment)
+        .join(Subject, Payment.subject_id == Subject.id)
+        .filter(*criteria)
+        .group_by(Subject.name, Subject.id)
+    )
+    rows, next_cursor = keyset_page(query, [Subject.name, Subject.id], cursor, limit)
+    subjects = [
+        {'subject_id': subject_id, 'name': name, 'total': float(total), 'payment_count': count}
+        for name, subject_id, total, count in rows
+    ]
+    return subjects, next_cursor
+
+
+def customer_payment_kpis(customer_id: int) -> dict:
+    """Total paid, payment count, first payment date and distinct subjects of one customer, in one query."""
+
+    total_paid, payment_count, first_payment_date, subject_count = (
+        db.session.query(
+            func.coalesce(func.sum(Payment.course_price_paid + Payment.application_price_paid), 0.0),
+            func.count(Payment.id),
+            func.min(Payment.payment_date),
+            func.count(func.distinct(Payment.subject_id)),
+        )
+        .filter(Payment.customer_id == customer_id)
+        .one()
+    )
+    return {
+        'total_paid': float(total_paid),
+        'total_payments_count': payment_count,
+        'first_payment_date': first_payment_date,
+        'total_subjects_enrolled': subject_count,
+    }
+
+
+def customer_subject_totals(customer_id: int) -> List[dict]:
+    """One row per subject a customer paid for, with its year, term/module and totals."""
+
+    rows = (
+        db.session.query(
+            Subject.id,
+            Subject.name,
+            Subject.year,
+            Term.name,
+            Module.name,
+            func.sum(Payment.course_price_paid + Payment.application_price_paid),
+            func.count(Payment.id),
+        )
+        .select_from(Payment)
+        .join(Subject, Payment.subject_id == Subject.id)
+        .outerjoin(Term, Subject.term_id == Term.id)
+        .outerjoin(Module, Subject.module_id == Module.id)
+        .filter(Payment.customer_id == customer_id)
+        .group_by(Subject.id, Subject.name, Subject.year, Term.name, Module.name)
+        .order_by(Subject.year, Term.name, Module.name, Subject.name)
+        .all()
+    )
+    return [
+        {
+            'subject_id': subject_id,
+            'name': name,
+            'year': year,
+            'term': term,
+            'module': module,
+            'total': float(total or 0),
+            'payment_count': count,
+        }
+        for subject_id, name, year, term, module, total, count in rows
+    ]
+
+
+def build_customer_history(subject_rows: List[dict]) -> RollupNode:
+    """Year → terms/modules → Term/Module → subject tree of a customer's ``customer_subject_totals``."""
+
+    return build_rollup(
+        ((row['year'], *structure_path(row['term'], row['module']), row['subject_id']), row['total'], row)
+        for row in subject_rows
+    )
+
+
+def customer_payment_page(
+    customer_id: int,
+    *criteria,
+    cursor: Optional[str] = None,
+    limit: int = DRILLDOWN_PAGE_SIZE,
+) -> Tuple[List[dict], Optional[str]]:
+    """Return one page of a customer's payments, newest first, with their subject and term/module."""
+
+    query = (
+        db.session.query(
+            Payment.payment_date,
+            Payment.id,
+            Payment.course_price_paid + Payment.application_price_paid,
+            PaymentMethod.name,
+            Subject.id,
+            Subject.name,
+            Subject.year,
+            Term.name,
+            Module.name,
+        )
+        .select_from(Payment)
+        .join(Subject, Payment.subject_id == Subject.id)
+        .outerjoin(PaymentMethod, Payment.payment_method_id == PaymentMethod.id)
+        .outerjoin(Term, Subject.term_id == Term.id)
+        .outerjoin(Module, Subject.module_id == Module.id)
+        .filter(Payment.customer_id == customer_id, *criteria)
+    )
+    rows, next_cursor = keyset_page(query, [Payment.payment_date, Payment.id], cursor, limit, descending=True)
+    payments = []
+    for payment_date, payment_id, value, method, subject_id, subject, year, term, module in rows:
+        structure, period = structure_path(term, module)
+        payments.append({
+            'id': payment_id,
+            'payment_date': payment_date.strftime('%Y-%m-%d'),
+            'amount': float(value or 0),
+            'payment_method': method,
+            'subject_id': subject_id,
+            'subject': subject,
+            'year': year,
+            'structure': structure,
+            'period': period,
+        })
+    return payments, next_cursor
+
+
+def comm_log_page(
+    customer_id: int,
+    cursor: Optional[str] = None,
+    limit: int = DRILLDOWN_PAGE_SIZE,
+) -> Tuple[List[dict], Optional[str]]:
+    """Return one page of a customer's notes, newest first."""
+
+    query = (
+        db.session.query(CommunicationLog.creation_date, CommunicationLog.id, CommunicationLog.content)
+        .filter(CommunicationLog.customer_id == customer_id)
+    )
+    rows, next_cursor = keyset_page(query, [CommunicationLog.creation_date, CommunicationLog.id], cursor, limit, descending=True)
+    notes = [
+        {'id': note_id, 'creation_date': creation_date.strftime('%Y-%m-%d %H:%M'), 'content': content}
+        for creation_date, note_id, content in rows
+    ]
+    return notes, next_cursor
+
+
+def structure_criteria(college_ids: List[int], year: int, term_ids: List[int], module_ids: List[int]) -> list:
+    """Filters selecting the subjects under one College → Year → Term/Module node.
+
+    With neither term nor module ids the node is the ``General`` group of subjects
+    that have no term or module.
+    """
+
+    criteria = [Subject.college_id.in_(college_ids), Subject.year == year]
+    if term_ids:
+        criteria.append(Subject.term_id.in_(term_ids))
+    elif module_ids:
+        criteria.append(Subject.module_id.in_(module_ids))
+    else:
+        criteria += [Subject.term_id.is_(None), Subject.module_id.is_(None)]
+    return criteria
+
+
+def application_structure_totals(
+    year: Optional[int] = None,
+    university_id: Optional[int] = None,
+    college_id: Optional[int] = None,
+) -> List[dict]:
+    """Group application fees by Year → University → College → Term/Module from ``RevenueSummary``."""
+
+    criteria = [RevenueSummary.application_payment_count > 0]
+    if college_id:
+        criteria.append(RevenueSummary.college_id == college_id)
+    elif university_id:
+        criteria.append(College.university_id == university_id)
+    if year:
+        criteria.append(RevenueSummary.year == year)
+
+    rows = (
+        db.session.query(
+            RevenueSummary.year,
+            University.name,
+            College.id,
+            College.name,
+            Term.id,
+            Term.name,
+            Module.id,
+            Module.name,
+            func.sum(RevenueSummary.application_revenue),
+            func.sum(RevenueSummary.application_payment_count),
+            func.count(func.distinct(RevenueSummary.subject_id)),
+        )
+        .select_from(RevenueSummary)
+        .join(Subject, RevenueSummary.subject_id == Subject.id)
+        .join(College, RevenueSummary.college_id == College.id)
+        .join(University, College.university_id == University.id)
+        .outerjoin(Term, Subject.term_id == Term.id)
+        .outerjoin(Module, Subject.module_id == Module.id)
+        .filter(*criteria)
+        .group_by(RevenueSummary.year, University.name, College.id, College.name, Term.id, Term.name, Module.id, Module.name)
+        .order_by(RevenueSummary.year, University.name, College.name, Term.name, Module.name)
+        .all()
+    )
+    return [
+        {
+            'year': row_year,
+            'university': university,
+            'college_id': row_college_id,
+            'college': college,
+            'term_id': term_id,
+            'term': term,
+            'module_id': module_id,
+            'module': module,
+            'total': float(total),
+            'payment_count': count,
+            'subject_count': subjects,
+        }
+        for row_year, university, row_college_id, college, term_id, term, module_id, module, total, count, subjects in rows
+    ]
+
+
+def application_criteria(year: Optional[int] = None, university_id: Optional[int] = None, college_id: Optional[int] = None) -> list:
+    """Filters shared by the application report page and its drill-down endpoints."""
+
+    criteria = [Payment.application_price_paid > 0]
+    if college_id:
+        criteria.append(Subject.college_id == college_id)
+    elif university_id:
+        criteria.append(Subject.college_id.in_(select(College.id).where(College.university_id == university_id)))
+    if year:
+        criteria.append(Subject.year == year)
+    return criteria
+
+
+def application_unique_students(year: Optional[int] = None, university_id: Optional[int] = None, college_id: Optional[int] = None) -> int:
+    return (
+        db.session.query(func.count(func.distinct(Payment.customer_id)))
+        .join(Subject, Payment.subject_id == Subject.id)
+        .filter(*application_criteria(year, university_id, college_id))
+        .scalar()
+    ) or 0
+
+
+def build_application_tree(structure_rows: List[dict]) -> RollupNode:
+    """Nest application totals as Year → University → College → Term/Module.
+
+    Each Term/Module node keeps its rows as payloads for the ids its subjects are
+    drilled down by, since nodes are keyed by name and may merge rows that share a name.
+    """
+
+    return build_rollup(
+        (
+            (row['year'], row['university'], row['college'], *structure_path(row['term'], row['module'])),
+            row['total'],
+            row,
+        )
+        for row in structure_rows
+    )
+
+
+def _date_range(column, bucket: str, start: date, end: date) -> list:
+    """Filters covering every whole bucket from the one containing ``start`` to the one containing ``end``."""
+
+    return [column >= bucket_start(bucket, start), column < next_bucket_start(bucket, end)]
+
+
+def _monthly_counter_rows(kind: str, bucket: str, start: date, end: date) -> list:
+    """``('YYYY-MM', count)`` rows of a monthly ``DashboardCounter`` kind covering the requested buckets."""
+
+    return (
+        db.session.query(DashboardCounter.key, DashboardCounter.value)
+        .filter(
+            DashboardCounter.kind == kind,
+            DashboardCounter.key >= bucket_start(bucket, start).strftime('%Y-%m'),
+            DashboardCounter.key < next_bucket_start(bucket, end).strftime('%Y-%m'),
+        )
+        .all()
+    )
+
+
+def payment_series(bucket: str, start: date, end: date) -> Tuple[List[str], Dict[str, list]]:
+    """Number of payments per bucket; month and quarter buckets are summed from the monthly counters."""
+
+    if bucket in ('month', 'quarter'):
+        return fill_buckets(_monthly_counter_rows(PAYMENTS_BY_MONTH, bucket, start, end), bucket, ['payments'], start, end)
+
+    label = date_bucket(bucket, Payment.payment_date)
+    rows = (
+        db.session.query(label, func.count(Payment.id))
+        .filter(*_date_range(Payment.payment_date, bucket, start, end))
+        .group_by(label)
+        .all()
+    )
+    return fill_buckets(rows, bucket, ['payments'], start, end)
+
+
+def revenue_series(bucket: str, start: date, end: date) -> Tuple[List[str], Dict[str, list]]:
+    """Course, application and total revenue per bucket.
+
+    Month and quarter buckets are summed from the monthly ``RevenueSummary``; day
+    and week buckets group payments over the indexed date range.
+    """
+
+    if bucket in ('month', 'quarter'):
+        label = RevenueSummary.month + '-01'
+        course = RevenueSummary.course_revenue
+        application = RevenueSummary.application_revenue
+        criteria = [
+            RevenueSummary.month >= bucket_start(bucket, start).strftime('%Y-%m'),
+            RevenueSummary.month < next_bucket_start(bucket, end).strftime('%Y-%m'),
+        ]
+    else:
+        label = date_bucket(bucket, Payment.payment_date)
+        course = Payment.course_price_paid
+        # Only positive application fees count, as in the summary.
+        application = case((Payment.application_price_paid > 0, Payment.application_price_paid), else_=0.0)
+        criteria = _date_range(Payment.payment_date, bucket, start, end)
+
+    rows = (
+        db.session.query(label, func.sum(course), func.sum(application), func.sum(course + application))
+        .filter(*criteria)
+        .group_by(label)
+        .all()
+    )
+    return fill_buckets(rows, bucket, ['course', 'application', 'total'], start, end)
+
+
+def customer_series(bucket: str, start: date, end: date) -> Tuple[List[str], Dict[str, list]]:
+    """Number of new customers per bucket; month and quarter buckets are summed from the monthly counters."""
+
+    if bucket in ('month', 'quarter'):
+        return fill_buckets(_monthly_counter_rows(CUSTOMERS_BY_MONTH, bucket, start, end), bucket, ['customers'], start, end)
+
+    label = date_bucket(bucket, Customer.creation_date)
+    rows = (
+        db.session.query(label, func.count(Customer.id))
+        .filter(*_date_range(Customer.creation_date, bucket, start, end))
+        .group_by(label)
+        .all()
+    )
+    return fill_buckets(rows, bucket, ['customers'], start, end)
@@ -0,0 +1,199 @@
+"""Revenue totals per subject and month, maintained incrementally from Payment writes.
+
+``RevenueSummary`` holds one row per subject and payment month. Session events keep
+it in step with ORM writes: ``before_flush`` reads the stored rows of payments about
+to change or be deleted, ``after_flush`` reads back the inserted and changed ones,
+and the difference is upserted. Rows of a deleted instructor are detached from it
+before the delete is flushed. Bulk inserts that bypass the unit of work call
+``add_payment_rows`` themselves. ``flask rebuild-revenue-summary`` recomputes the
+table from every payment.
+"""
+
+from typing import Dict, Iterable, List, Mapping, Tuple
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import delete, event, inspect, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from .. import db
+from ..models import Instructor, Payment, RevenueSummary, Subject
+from .report_cache import bump_table_versions
+
+REVENUE_FIELDS = ('course_revenue', 'application_revenue', 'payment_count', 'application_payment_count')
+SUBJECT_FIELDS = ('instructor_id', 'college_id', 'year')
+PAYMENT_COLUMNS = (Payment.subject_id, Payment.payment_date, Payment.course_price_paid, Payment.application_price_paid)
+ID_BATCH_SIZE = 500
+REBUILD_BATCH_SIZE = 5_000
+
+# session.info key for the payment ids and deltas collected in before_flush.
+_PENDING_KEY = 'revenue_summary_pending'
+
+Deltas = Dict[Tuple[int, str], List[float]]
+
+
+def summary_month(payment_date) -> str:
+    return payment_date.strftime('%Y-%m')
+
+
+def _accumulate(deltas: Deltas, rows: Iterable[Mapping], sign: int) -> None:
+    """Add (``sign=1``) or remove (``sign=-1``) payment rows from ``deltas``."""
+
+    for row in rows:
+        if row['subject_id'] is None or row['payment_date'] is None:
+            continue
+        application = row['application_price_paid'] or 0.0
+        paid_application = application > 0
+        delta = deltas.setdefault((row['subject_id'], summary_month(row['payment_date'])), [0.0, 0.0, 0, 0])
+        delta[0] += sign * (row['course_price_paid'] or 0.0)
+        delta[1] += sign * application if paid_application else 0.0
+        delta[2] += sign
+        delta[3] += sign if paid_application else 0
+
+
+def _stored_payments(connection, payment_ids: List[int]):
+    for start in range(0, len(payment_ids), ID_BATCH_SIZE):
+        batch = payment_ids[start:start + ID_BATCH_SIZE]
+        yield from connection.execute(select(*PAYMENT_COLUMNS).where(Payment.id.in_(batch))).mappings()
+
+
+def _upsert(connection, rows: List[dict]) -> None:
+    table = RevenueSummary.__table__
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        statement = insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=['subject_id', 'month'],
+            set_={field: table.c[field] + statement.excluded[field] for field in REVENUE_FIELDS},
+        )
+        connection.execute(statement, rows)
+        return
+
+    for row in rows:
+        result = connection.execute(
+            update(table)
+            .where(table.c.subject_id == row['subject_id'], table.c.month == row['month'])
+            .values({field: table.c[field] + row[field] for field in REVENUE_FIELDS})
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert(), row)
+
+
+def _apply(connection, deltas: Deltas) -> None:
+    """Upsert ``deltas`` into the summary and drop groups left without payments."""
+
+    deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+
+    subject_ids = sorted({subject_id for subject_id, _ in deltas})
+    subjects = {
+        row.id: row
+        for row in connection.execute(
+            select(Subject.id, Subject.instructor_id, Subject.college_id, Subject.year).where(Subject.id.in_(subject_ids))
+        )
+    }
+    rows = [
+        {
+            'subject_id': subject_id,
+            'instructor_id': subjects[subject_id].instructor_id,
+            'college_id': subjects[subject_id].college_id,
+            'year': subjects[subject_id].year,
+            'month': month,
+            **dict(zip(REVENUE_FIELDS, delta)),
+        }
+        for (subject_id, month), delta in deltas.items()
+        if subject_id in subjects
+    ]
+    if rows:
+        _upsert(connection, rows)
+    if any(delta[2] < 0 for delta in deltas.values()):
+        connection.execute(
+            delete(RevenueSummary).where(RevenueSummary.subject_id.in_(subject_ids), RevenueSummary.payment_count <= 0)
+        )
+
+
+def add_payment_rows(rows: Iterable[Mapping]) -> None:
+    """Add payments inserted outside the ORM unit of work (bulk inserts) to the summary."""
+
+    deltas: Deltas = {}
+    _accumulate(deltas, rows, 1)
+    _apply(db.session.connection(), deltas)
+
+
+def rebuild_revenue_summary() -> int:
+    """Recompute the summary from every payment, commit, and return the number of groups."""
+
+    deltas: Deltas = {}
+    result = db.session.execute(select(*PAYMENT_COLUMNS).execution_options(yield_per=REBUILD_BATCH_SIZE))
+    _accumulate(deltas, result.mappings(), 1)
+
+    connection = db.session.connection()
+    connection.execute(delete(RevenueSummary))
+    _apply(connection, deltas)
+    # Reports cached from the old summary are keyed by the payment table's version.
+    bump_table_versions(connection, ['payment'])
+    db.session.commit()
+    return len(deltas)
+
+
+def _persistent_id(obj):
+    identity = inspect(obj).identity
+    return identity[0] if identity else None
+
+
+@event.listens_for(Session, 'before_flush')
+def _snapshot_changed_payments(session, flush_context, instances):
+    changed_ids = [
+        _persistent_id(obj) for obj in session.dirty
+        if isinstance(obj, Payment) and session.is_modified(obj, include_collections=False)
+    ]
+    deleted_ids = [_persistent_id(obj) for obj in session.deleted if isinstance(obj, Payment)]
+    changed_ids = [payment_id for payment_id in changed_ids if payment_id is not None]
+
+    deltas: Deltas = {}
+    stored_ids = changed_ids + [payment_id for payment_id in deleted_ids if payment_id is not None]
+    if stored_ids:
+        _accumulate(deltas, _stored_payments(session.connection(), stored_ids), -1)
+    session.info[_PENDING_KEY] = (deltas, changed_ids)
+
+
+@event.listens_for(Session, 'before_flush')
+def _detach_deleted_instructors(session, flush_context, instances):
+    # Summary rows reference the instructor, so they are cleared before the flush
+    # deletes it; databases that enforce foreign keys would reject the delete otherwise.
+    instructor_ids = [_persistent_id(obj) for obj in session.deleted if isinstance(obj, Instructor)]
+    instructor_ids = [instructor_id for instructor_id in instructor_ids if instructor_id is not None]
+    if instructor_ids:
+        session.connection().execute(
+            update(RevenueSummary).where(RevenueSummary.instructor_id.in_(instructor_ids)).values(instructor_id=None)
+        )
+
+
+@event.listens_for(Session, 'after_flush')
+def _apply_payment_changes(session, flush_context):
+    deltas, changed_ids = session.info.pop(_PENDING_KEY, ({}, []))
+    current_ids = changed_ids + [obj.id for obj in session.new if isinstance(obj, Payment)]
+    if current_ids:
+        _accumulate(deltas, _stored_payments(session.connection(), current_ids), 1)
+    if deltas:
+        _apply(session.connection(), deltas)
+
+    for subject in session.dirty:
+        if isinstance(subject, Subject) and session.is_modified(subject, include_collections=False):
+            session.connection().execute(
+                update(RevenueSummary)
+                .where(RevenueSummary.subject_id == subject.id)
+                .values({field: getattr(subject, field) for field in SUBJECT_FIELDS})
+            )
+
+
+@click.command('rebuild-revenue-summary')
+@with_appcontext
+def rebuild_revenue_summary_command():
+    """Recompute the revenue summary table from every payment."""
+
+    groups = rebuild_revenue_summary()
+    click.echo(f"Revenue summary rebuilt: {groups} subject/month groups.")
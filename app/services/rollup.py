@@ -0,0 +1,107 @@
+"""Single-pass hierarchical rollups shared by the report views.
+
+Reports describe each fact as a ``(path, amount, payload)`` record, where ``path``
+is a tuple of keys from the top level down. ``build_rollup`` nests the records
+into ``RollupNode`` trees, adding ``amount`` to every node on the path as it goes.
+"""
+
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+GENERAL_STRUCTURE = 'General'
+
+Record = Tuple[Sequence[Hashable], float, Any]
+
+
+class RollupNode:
+    """One level of a rollup: its total, the number of records under it and its children.
+
+    Nodes use ``__slots__`` and create their child dict and payload list only when
+    needed, so leaves of large trees stay small. ``len(node)`` is the number of
+    children, which lets templates test ``{% if node %}`` for an empty tree.
+    """
+
+    __slots__ = ('total', 'count', 'children', 'payloads')
+
+    def __init__(self) -> None:
+        self.total = 0
+        self.count = 0
+        self.children: Optional[Dict[Hashable, 'RollupNode']] = None
+        self.payloads: Optional[List[Any]] = None
+
+    def __len__(self) -> int:
+        return len(self.children) if self.children else 0
+
+    def items(self):
+        return self.children.items() if self.children else ()
+
+    def child(self, key: Hashable) -> Optional['RollupNode']:
+        return self.children.get(key) if self.children else None
+
+    def sum(self, field: str):
+        """Sum ``field`` over this node's payloads (dicts or objects)."""
+        return sum(_field(payload, field) for payload in self.payloads or ())
+
+    def distinct(self, field: str) -> list:
+        """Distinct non-null values of ``field`` over this node's payloads, in first-seen order."""
+        seen = {}
+        for payload in self.payloads or ():
+            value = _field(payload, field)
+            if value is not None:
+                seen.setdefault(value, None)
+        return list(seen)
+
+    @property
+    def truncated(self) -> bool:
+        """True when ``payload_limit`` dropped some of this node's payloads."""
+        return self.payloads is not None and len(self.payloads) < self.count
+
+
+def _field(payload, field: str):
+    return payload[field] if isinstance(payload, dict) else getattr(payload, field)
+
+
+def build_rollup(records: Iterable[Record], keep_payloads: bool = True, payload_limit: Optional[int] = None) -> RollupNode:
+    """Nest ``records`` into a tree of ``RollupNode`` in one pass and return its root.
+
+    Each record's payload is attached to the node at the end of its path. Pass
+    ``keep_payloads=False`` to keep totals and counts only, or ``payload_limit`` to
+    cap how many payloads any one node holds; ``count`` always covers every record.
+    Children keep the order in which their keys first appear.
+    """
+
+    root = RollupNode()
+    for path, amount, payload in records:
+        node = root
+        node.total += amount
+        node.count += 1
+        for key in path:
+            children = node.children
+            if children is None:
+                children = node.children = {}
+            child = children.get(key)
+            if child is None:
+                child = children[key] = RollupNode()
+            child.total += amount
+            child.count += 1
+            node = child
+
+        if keep_payloads:
+            if node.payloads is None:
+                node.payloads = []
+            if payload_limit is None or len(node.payloads) < payload_limit:
+                node.payloads.append(payload)
+    return root
+
+
+def structure_path(term_name: Optional[str], module_name: Optional[str]) -> Tuple[str, str]:
+    """Return the ``(kind, name)`` path segment for a subject's term or module.
+
+    ``kind`` is ``'terms'`` or ``'modules'``; subjects with neither are grouped under
+    a ``General`` term.
+    """
+
+    if term_name:
+        return 'terms', term_name
+    if module_name:
+        return 'modules', module_name
+    return 'terms', GENERAL_STRUCTURE
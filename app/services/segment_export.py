@@ -0,0 +1,108 @@
+"""Streaming export of a student segment.
+
+The segment is read as flat rows of the exported columns through joins, with
+``yield_per`` so the driver hands rows over in batches (a server-side cursor on
+Postgres) and memory stays flat however large the segment is. ``csv_chunks``
+turns any row iterator into CSV text a response can stream.
+"""
+
+import csv
+import io
+from typing import Iterable, Iterator, Mapping, Sequence
+
+from sqlalchemy import Select, exists, select
+
+from .. import db
+from ..models import College, Country, Customer, Payment, Subject, University
+
+SEGMENT_HEADER = ['ID', 'Full Name', 'WhatsApp Number', 'Email', 'Year', 'College', 'University', 'Country']
+STREAM_BATCH_SIZE = 1_000
+CSV_CHUNK_BYTES = 64 * 1024
+
+
+def _paid_for(*criteria):
+    return exists().where(Payment.customer_id == Customer.id, *criteria)
+
+
+def segment_criteria(filters: Mapping) -> list:
+    """Filters on ``Customer``/``College``/``University`` for the segmentation form's fields."""
+
+    criteria = []
+    if filters.get('college_id'):
+        criteria.append(Customer.college_id == filters['college_id'])
+    elif filters.get('university_id'):
+        criteria.append(College.university_id == filters['university_id'])
+    elif filters.get('country_id'):
+        criteria.append(University.country_id == filters['country_id'])
+
+    if filters.get('year'):
+        criteria.append(Customer.year == filters['year'])
+
+    # A subject overrides its term or module, as on the segmentation page.
+    if filters.get('subject_id'):
+        criteria.append(_paid_for(Payment.subject_id == filters['subject_id']))
+    elif filters.get('term_id'):
+        criteria.append(_paid_for(Payment.subject_id == Subject.id, Subject.term_id == filters['term_id']))
+    elif filters.get('module_id'):
+        criteria.append(_paid_for(Payment.subject_id == Subject.id, Subject.module_id == filters['module_id']))
+
+    if filters.get('instructor_id'):
+        criteria.append(_paid_for(Payment.subject_id == Subject.id, Subject.instructor_id == filters['instructor_id']))
+
+    if filters.get('payment_status') == 'has_paid':
+        criteria.append(_paid_for())
+    elif filters.get('payment_status') == 'no_payment':
+        criteria.append(~_paid_for())
+    return criteria
+
+
+def segment_query(filters: Mapping) -> Select:
+    """``SEGMENT_HEADER`` columns of the segment's students in id order."""
+
+    return (
+        select(
+            Customer.id,
+            Customer.full_name,
+            Customer.whatsapp_number,
+            Customer.email,
+            Customer.year,
+            College.name,
+            University.name,
+            Country.name,
+        )
+        .join(College, Customer.college_id == College.id)
+        .join(University, College.university_id == University.id)
+        .join(Country, University.country_id == Country.id)
+        .where(*segment_criteria(filters))
+        .order_by(Customer.id)
+    )
+
+
+def iter_segment_rows(filters: Mapping, batch_size: int = STREAM_BATCH_SIZE) -> Iterator[tuple]:
+    """Yield the rows of ``segment_query``, fetching ``batch_size`` at a time."""
+
+    yield from db.session.execute(segment_query(filters).execution_options(yield_per=batch_size))
+
+
+def csv_chunks(header: Sequence[str], rows: Iterable[Sequence], chunk_bytes: int = CSV_CHUNK_BYTES) -> Iterator[str]:
+    """CSV text for ``header`` and ``rows`` in chunks of about ``chunk_bytes``.
+
+    The BOM and header go out before ``rows`` is first advanced, so a response
+    starts before its query has run.
+    """
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')  # BOM hint for Excel
+    writer.writerow(header)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() > chunk_bytes:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
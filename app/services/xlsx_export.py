@@ -0,0 +1,181 @@
+"""Spreadsheet exports written with openpyxl's write-only mode.
+
+An export is a header and a query of flat rows. Rows are read with ``yield_per``
+and appended to a write-only worksheet, which serialises each row as it arrives,
+so memory stays bounded however long the sheet is. ``estimated_cells`` sizes an
+export before it runs; routes hand exports over ``XLSX_BACKGROUND_CELLS`` to
+``export_jobs`` instead of building them within the request.
+"""
+
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Callable, Mapping, Sequence, Tuple
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from sqlalchemy import Select, func, select
+
+from .. import db
+from ..models import College, Customer, Module, Payment, PaymentMethod, Subject, Term, University
+from .report_service import application_criteria
+from .segment_export import SEGMENT_HEADER, STREAM_BATCH_SIZE, segment_query
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+PAYMENT_HEADER = [
+    'Payment ID', 'Payment Date', 'Customer', 'WhatsApp Number', 'Subject', 'Year', 'Term', 'Module',
+    'College', 'University', 'Course Price', 'Application Price', 'Total Paid', 'Method',
+]
+
+
+def _iso_date(value: str) -> str:
+    return date.fromisoformat(value).isoformat()
+
+
+@dataclass(frozen=True)
+class XlsxExport:
+    """One sheet: its title, header, typed query string parameters and the query of its rows."""
+
+    title: str
+    header: Sequence[str]
+    params: Mapping[str, Callable]
+    query: Callable[[Mapping], Select]
+    required: Tuple[str, ...] = ()
+
+    def filename(self) -> str:
+        return f"{self.title.lower().replace(' ', '_')}_{date.today().isoformat()}.xlsx"
+
+
+def payment_export_query(*criteria) -> Select:
+    """``PAYMENT_HEADER`` columns of the payments matching ``criteria``, newest first."""
+
+    return (
+        select(
+            Payment.id,
+            Payment.payment_date,
+            Customer.full_name,
+            Customer.whatsapp_number,
+            Subject.name,
+            Subject.year,
+            Term.name,
+            Module.name,
+            College.name,
+            University.name,
+            Payment.course_price_paid,
+            Payment.application_price_paid,
+            Payment.course_price_paid + Payment.application_price_paid,
+            PaymentMethod.name,
+        )
+        .select_from(Payment)
+        .join(Customer, Payment.customer_id == Customer.id)
+        .join(Subject, Payment.subject_id == Subject.id)
+        .join(College, Subject.college_id == College.id)
+        .outerjoin(University, College.university_id == University.id)
+        .outerjoin(Term, Subject.term_id == Term.id)
+        .outerjoin(Module, Subject.module_id == Module.id)
+        .outerjoin(PaymentMethod, Payment.payment_method_id == PaymentMethod.id)
+        .where(*criteria)
+        .order_by(Payment.payment_date.desc(), Payment.id.desc())
+    )
+
+
+def _payment_history_criteria(params: Mapping) -> list:
+    """The payment history page's filters; ``date_to`` is inclusive."""
+
+    criteria = []
+    if params.get('customer_id'):
+        criteria.append(Payment.customer_id == params['customer_id'])
+    if params.get('subject_id'):
+        criteria.append(Payment.subject_id == params['subject_id'])
+    if params.get('method_id'):
+        criteria.append(Payment.payment_method_id == params['method_id'])
+    if params.get('date_from'):
+        criteria.append(Payment.payment_date >= datetime.fromisoformat(params['date_from']))
+    if params.get('date_to'):
+        criteria.append(Payment.payment_date < datetime.fromisoformat(params['date_to']) + timedelta(days=1))
+    return criteria
+
+
+EXPORTS = {
+    'segment': XlsxExport(
+        'Student Segment',
+        SEGMENT_HEADER,
+        {
+            'country_id': int, 'university_id': int, 'college_id': int, 'year': int, 'term_id': int,
+            'module_id': int, 'subject_id': int, 'instructor_id': int, 'payment_status': str,
+        },
+        segment_query,
+    ),
+    'payments': XlsxExport(
+        'Payments',
+        PAYMENT_HEADER,
+        {'customer_id': int, 'subject_id': int, 'method_id': int, 'date_from': _iso_date, 'date_to': _iso_date},
+        lambda params: payment_export_query(*_payment_history_criteria(params)),
+    ),
+    'instructor_report': XlsxExport(
+        'Instructor Payments',
+        PAYMENT_HEADER,
+        {'instructor_id': int},
+        lambda params: payment_export_query(Subject.instructor_id == params['instructor_id']),
+        required=('instructor_id',),
+    ),
+    'application_report': XlsxExport(
+        'Application Payments',
+        PAYMENT_HEADER,
+        {'year': int, 'university_id': int, 'college_id': int},
+        lambda params: payment_export_query(
+            *application_criteria(params.get('year'), params.get('university_id'), params.get('college_id'))
+        ),
+    ),
+}
+
+
+def export_params(export: XlsxExport, args) -> dict:
+    """Typed parameters of ``export`` from a query string ``MultiDict``; malformed values are dropped.
+
+    Raises ``ValueError`` when a required parameter is missing.
+    """
+
+    params = {}
+    for name, convert in export.params.items():
+        value = args.get(name, type=convert)
+        if value not in (None, ''):
+            params[name] = value
+    missing = [name for name in export.required if name not in params]
+    if missing:
+        raise ValueError(f"Missing {', '.join(missing)}.")
+    return params
+
+
+def estimated_cells(export: XlsxExport, params: Mapping, limit: int) -> int:
+    """Cells the export would write, counting rows only as far as needed to pass ``limit``."""
+
+    columns = len(export.header)
+    probe = export.query(params).order_by(None).limit(limit // columns + 1).subquery()
+    return db.session.execute(select(func.count()).select_from(probe)).scalar() * columns
+
+
+def _cell(sheet, value):
+    if not isinstance(value, str):
+        return value
+    value = ILLEGAL_CHARACTERS_RE.sub('', value)
+    if not value.startswith('='):
+        return value
+    # Keep names like '=Ali' as text rather than letting openpyxl store a formula.
+    cell = WriteOnlyCell(sheet, value)
+    cell.data_type = 's'
+    return cell
+
+
+def write_xlsx(export: XlsxExport, params: Mapping, target, batch_size: int = STREAM_BATCH_SIZE) -> int:
+    """Write ``export`` to ``target`` (a path or binary file) and return the number of data rows."""
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(export.title)
+    sheet.append(list(export.header))
+    rows = 0
+    for row in db.session.execute(export.query(params).execution_options(yield_per=batch_size)):
+        sheet.append([_cell(sheet, value) for value in row])
+        rows += 1
+    workbook.save(target)
+    return rows
@@ -1,19 +1,31 @@
 """Utilities for securely validating and parsing customer import uploads."""
 
+import codecs
+import hashlib
 import io
+import mmap
 import os
+import tempfile
+import uuid
 import zipfile
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import Tuple
+from typing import Callable, Iterator, Tuple
+from xml.parsers.expat import ExpatError
 
 import pandas as pd
+from flask import current_app, has_app_context
 from openpyxl import load_workbook
 from werkzeug.datastructures import FileStorage
 from werkzeug.utils import secure_filename
 
-MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10 MB hard cap to prevent resource exhaustion.
-MAX_ROWS = 100_000  # Prevent excessively large imports that could choke the database.
+from .xlsx_reader import UnsupportedWorkbook, count_sheet_rows, iter_sheet_rows, open_active_sheet
+
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # Default cap; override with the IMPORT_MAX_UPLOAD_SIZE config value.
+MAX_ROWS = 100_000  # Default row cap; override with IMPORT_MAX_ROWS.
 CHUNK_SIZE = 5_000  # Stream CSV parsing to avoid loading huge files in memory.
+SPOOL_BLOCK_SIZE = 1024 * 1024  # Uploads are copied to disk in blocks of this size.
+SNIFF_BYTES = 4096  # Content checks only look at this much of the mapped file.
 ALLOWED_EXTENSIONS = {".csv", ".xlsx"}
 
 
@@ -25,6 +37,38 @@ class ParsedUpload:
     row_count: int
 
 
+@dataclass
+class StreamedUpload:
+    """A validated upload whose rows are produced lazily, one DataFrame chunk at a time.
+
+    Call ``close`` once done so a spooled temp file is removed even if the chunks
+    were never fully consumed. ``content_hash`` is the SHA-256 hex digest of the
+    upload, taken while it was spooled.
+    """
+
+    chunks: Iterator[pd.DataFrame]
+    filename: str
+    file_size: int
+    cleanup: Callable[[], None] = lambda: None
+    content_hash: str = ""
+
+    def close(self) -> None:
+        close_chunks = getattr(self.chunks, "close", None)
+        if close_chunks is not None:
+            close_chunks()
+        self.cleanup()
+
+
+@dataclass
+class StagedUpload:
+    """A validated upload written to disk so it can be parsed outside the request."""
+
+    path: str
+    filename: str
+    file_size: int
+    content_hash: str
+
+
 class UploadError(Exception):
     """Raised when an uploaded file fails validation."""
 
@@ -46,6 +90,94 @@ class UploadTooLargeError(UploadError):
 def parse_import_file(file_storage: FileStorage) -> ParsedUpload:
     """Validate and parse an uploaded CSV or XLSX file into a DataFrame."""
 
+    upload = stream_import_file(file_storage)
+    try:
+        frames = list(upload.chunks)
+    finally:
+        upload.close()
+    dataframe = pd.concat(frames) if frames else pd.DataFrame()
+
+    return ParsedUpload(
+        dataframe=dataframe,
+        filename=upload.filename,
+        file_size=upload.file_size,
+        row_count=len(dataframe),
+    )
+
+
+def stream_import_file(file_storage: FileStorage) -> StreamedUpload:
+    """Validate an uploaded CSV or XLSX file and return an iterator over its row chunks.
+
+    The upload is spooled to a temp file and parsed through a memory map, so a worker
+    never holds the whole file in memory. Each chunk holds at most ``CHUNK_SIZE`` rows
+    and its index is the zero-based data row position, so ``index + 2`` is the row
+    number shown in a spreadsheet. A quick pass checks the row cap, the encoding
+    and the file's structure before the first chunk is produced, so those errors
+    surface as ``UploadError`` on the first ``next`` rather than midway through an
+    import.
+    """
+
+    filename, ext = _check_filename(file_storage)
+    descriptor, path = tempfile.mkstemp(suffix=ext, prefix="import-")
+    os.close(descriptor)
+    try:
+        file_size, content_hash = _spool_upload(file_storage, path, filename)
+        chunks = _open_chunks(path, ext, filename)
+    except Exception:
+        _remove_quietly(path)
+        raise
+
+    return StreamedUpload(
+        chunks=chunks,
+        filename=filename,
+        file_size=file_size,
+        cleanup=lambda: _remove_quietly(path),
+        content_hash=content_hash,
+    )
+
+
+def stage_import_file(file_storage: FileStorage, folder: str) -> StagedUpload:
+    """Validate an upload, run the content checks and save it under ``folder``.
+
+    The upload is spooled straight to its final place under a random name; the
+    sanitised original name is returned with it.
+    """
+
+    filename, ext = _check_filename(file_storage)
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{uuid.uuid4().hex}{ext}")
+    try:
+        file_size, content_hash = _spool_upload(file_storage, path, filename)
+        _check_content(ext, path)
+    except Exception:
+        _remove_quietly(path)
+        raise
+
+    return StagedUpload(path=path, filename=filename, file_size=file_size, content_hash=content_hash)
+
+
+def stream_staged_file(path: str, filename: str) -> StreamedUpload:
+    """Return the row chunks of a file previously saved by ``stage_import_file``."""
+
+    _, ext = os.path.splitext(path)
+    return StreamedUpload(chunks=_open_chunks(path, ext.lower(), filename), filename=filename, file_size=os.path.getsize(path))
+
+
+def upload_limits() -> Tuple[int, int]:
+    """Return the (byte, row) caps for imports, taken from the app config when there is one."""
+
+    if has_app_context():
+        config = current_app.config
+        return config.get("IMPORT_MAX_UPLOAD_SIZE", MAX_UPLOAD_SIZE), config.get("IMPORT_MAX_ROWS", MAX_ROWS)
+    return MAX_UPLOAD_SIZE, MAX_ROWS
+
+
+def _format_size(size: int) -> str:
+    megabytes = size / (1024 * 1024)
+    return f"{megabytes:g} MB" if megabytes >= 1 else f"{size // 1024} KB"
+
+
+def _check_filename(file_storage: FileStorage) -> Tuple[str, str]:
     original_filename = file_storage.filename or ""
     filename = secure_filename(original_filename)
     if not filename:
@@ -56,35 +188,86 @@ def parse_import_file(file_storage: FileStorage) -> ParsedUpload:
     if ext not in ALLOWED_EXTENSIONS:
         raise UploadError("Invalid file type. Please upload a .csv or .xlsx file.", 415, filename=filename)
 
+    return filename, ext
+
+
+def _spool_upload(file_storage: FileStorage, path: str, filename: str) -> Tuple[int, str]:
+    """Copy the upload to ``path`` block by block, stopping as soon as it passes the size cap.
+
+    Returns the size and the SHA-256 hex digest, which is updated with each block
+    as it is written so hashing needs no second read of the file.
+    """
+
+    max_size, _ = upload_limits()
     file_storage.stream.seek(0)
-    data = file_storage.stream.read(MAX_UPLOAD_SIZE + 1)
-    if not data:
+    digest = hashlib.sha256()
+    written = 0
+    with open(path, "wb") as handle:
+        while True:
+            block = file_storage.stream.read(SPOOL_BLOCK_SIZE)
+            if not block:
+                break
+            written += len(block)
+            if written > max_size:
+                raise UploadTooLargeError(f"File exceeds the {_format_size(max_size)} upload limit.", filename=filename)
+            digest.update(block)
+            handle.write(block)
+
+    if not written:
         raise UploadError("Uploaded file is empty.", 400, filename=filename)
+    return written, digest.hexdigest()
+
+
+@contextmanager
+def _mapped(path: str) -> Iterator[mmap.mmap]:
+    """Map a spooled upload read-only; slices of the map are read straight from the page cache."""
+
+    with open(path, "rb") as handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        yield view
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _check_content(ext: str, path: str):
+    """Run the content checks against the spooled file; returns the CSV encoding.
 
-    if len(data) > MAX_UPLOAD_SIZE:
-        raise UploadTooLargeError("File exceeds the 10 MB upload limit.", filename=filename)
+    CSV checks only need a prefix, read from a memory map. An XLSX check reads the
+    zip central directory, which ``zipfile`` seeks to directly in the file.
+    """
 
     if ext == ".csv":
-        dataframe, row_count = _parse_csv_bytes(data)
-    else:
-        dataframe, row_count = _parse_xlsx_bytes(data)
+        with _mapped(path) as view:
+            return _sniff_csv(view[:SNIFF_BYTES])
+    with open(path, "rb") as handle:
+        _check_xlsx_archive(handle)
+    return None
 
-    return ParsedUpload(
-        dataframe=dataframe,
-        filename=filename,
-        file_size=len(data),
-        row_count=row_count,
-    )
+
+def _open_chunks(path: str, ext: str, filename: str) -> Iterator[pd.DataFrame]:
+    """Run the content checks now and return a generator that parses the file lazily."""
+
+    encoding = _check_content(ext, path)
+    if ext == ".csv":
+        return _read_csv_chunks(path, encoding)
+    return _read_xlsx_file_chunks(path)
 
 
-def _parse_csv_bytes(data: bytes) -> Tuple[pd.DataFrame, int]:
-    snippet = data[:4096]
+def _sniff_csv(data: bytes) -> str:
+    """Reject binary or delimiter-less CSV content and return the detected encoding."""
+
+    snippet = data[:SNIFF_BYTES]
     if b"\x00" in snippet:
         raise UploadError("Uploaded CSV appears to contain binary data and was rejected.", 415)
 
-    encoding = "utf-8"
+    encoding = "utf-8-sig" if snippet.startswith(codecs.BOM_UTF8) else "utf-8"
     try:
-        snippet_text = snippet.decode("utf-8")
+        # The prefix may end inside a multi-byte character, so decode it incrementally.
+        snippet_text = codecs.getincrementaldecoder(encoding)().decode(snippet, final=False)
     except UnicodeDecodeError:
         snippet_text = snippet.decode("latin-1")
         encoding = "latin-1"
@@ -92,30 +275,95 @@ def _parse_csv_bytes(data: bytes) -> Tuple[pd.DataFrame, int]:
     if not any(sep in snippet_text for sep in (",", ";", "\t")):
         raise UploadError("Uploaded CSV does not contain a recognised delimiter (comma, semicolon, or tab).", 400)
 
-    buffer = io.BytesIO(data)
-    text_wrapper = io.TextIOWrapper(buffer, encoding=encoding, newline="")
-    frames = []
+    return encoding
+
+
+def _precheck_csv(path: str, encoding: str, max_rows: int) -> None:
+    """Check a CSV's encoding, row count and quoting before its first chunk is parsed.
+
+    One pass over the raw bytes decodes them and counts line breaks and quotes. A
+    file with no more line breaks than the row cap and balanced quotes can neither
+    exceed the cap nor end inside a quoted field, so the common case needs nothing
+    else. Otherwise pandas counts the records, converting only the first column.
+    """
+
+    decoder = codecs.getincrementaldecoder(encoding)()
+    line_breaks = quotes = 0
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(SPOOL_BLOCK_SIZE), b""):
+            decoder.decode(block)
+            line_breaks += block.count(b"\n") + block.count(b"\r") - block.count(b"\r\n")
+            quotes += block.count(b'"')
+    decoder.decode(b"", final=True)
+    if line_breaks <= max_rows and quotes % 2 == 0:
+        return
+
     total_rows = 0
-    try:
-        for chunk in pd.read_csv(text_wrapper, dtype=str, chunksize=CHUNK_SIZE):
+    with pd.read_csv(path, dtype=str, usecols=[0], chunksize=CHUNK_SIZE, encoding=encoding, memory_map=True) as reader:
+        for chunk in reader:
             total_rows += len(chunk)
-            if total_rows > MAX_ROWS:
-                raise UploadTooLargeError("CSV contains more than 100000 rows and was rejected.")
-            frames.append(chunk)
+            if total_rows > max_rows:
+                raise UploadTooLargeError(f"CSV contains more than {max_rows} rows and was rejected.")
+
+
+def _read_csv_chunks(path: str, encoding: str) -> Iterator[pd.DataFrame]:
+    _, max_rows = upload_limits()
+    total_rows = 0
+    try:
+        # Imports commit chunk by chunk, so a file that will be rejected must be
+        # caught before its first chunk is handed out.
+        _precheck_csv(path, encoding, max_rows)
+        reader = pd.read_csv(path, dtype=str, chunksize=CHUNK_SIZE, encoding=encoding, memory_map=True)
+        with reader:
+            for chunk in reader:
+                total_rows += len(chunk)
+                if total_rows > max_rows:
+                    raise UploadTooLargeError(f"CSV contains more than {max_rows} rows and was rejected.")
+                yield _strip_formula_injection(chunk)
     except UploadError:
         raise
     except Exception as exc:
         raise UploadError(f"Failed to parse CSV: {exc}", 400) from exc
-    finally:
-        text_wrapper.detach()
 
-    dataframe = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
-    dataframe = _strip_formula_injection(dataframe)
-    return dataframe, total_rows
 
+def _read_xlsx_file_chunks(path: str) -> Iterator[pd.DataFrame]:
+    # Zip members are read on demand, so the package is never loaded whole.
+    with open(path, "rb") as handle:
+        yield from _iter_xlsx_chunks(handle)
+
+
+def _iter_xlsx_chunks(source) -> Iterator[pd.DataFrame]:
+    """Parse XLSX ``source``, given as bytes or a seekable binary file."""
+
+    buffer = io.BytesIO(source) if isinstance(source, bytes) else source
+    _check_xlsx_archive(buffer)
+
+    # Stream the sheet XML directly when the package layout is a familiar one;
+    # openpyxl handles anything else.
+    buffer.seek(0)
+    archive = zipfile.ZipFile(buffer, "r")  # Opens as it just did in _check_xlsx_archive
+    try:
+        sheet = open_active_sheet(archive)
+    except (zipfile.BadZipFile, UnsupportedWorkbook):
+        archive.close()
+        buffer.seek(0)
+    except (ValueError, KeyError, ExpatError) as exc:
+        archive.close()
+        raise UploadError(f"Failed to parse XLSX: {exc}", 400) from exc
+    else:
+        return _read_xlsx_stream_chunks(archive, sheet)
+
+    try:
+        workbook = load_workbook(buffer, read_only=True, data_only=True)
+    except Exception as exc:
+        raise UploadError(f"Failed to open XLSX file: {exc}", 400) from exc
+
+    return _read_xlsx_chunks(workbook)
+
+
+def _check_xlsx_archive(buffer) -> None:
+    """Reject files that are not zip packages, lack content types or carry macros."""
 
-def _parse_xlsx_bytes(data: bytes) -> Tuple[pd.DataFrame, int]:
-    buffer = io.BytesIO(data)
     if not zipfile.is_zipfile(buffer):
         raise UploadError("Uploaded XLSX is not a valid Excel file.", 415)
 
@@ -127,18 +375,73 @@ def _parse_xlsx_bytes(data: bytes) -> Tuple[pd.DataFrame, int]:
         if any(name.lower().endswith("vbaproject.bin") for name in names):
             raise UploadError("Excel macros are not allowed in uploaded files.", 415)
 
-    buffer.seek(0)
+
+def _read_xlsx_stream_chunks(archive: zipfile.ZipFile, sheet) -> Iterator[pd.DataFrame]:
+    """Build chunks straight from column lists; mirrors ``_read_xlsx_chunks`` row for row."""
+
+    _, max_rows = upload_limits()
+    rows = []
+    positions = []
+    row_count = 0
     try:
-        workbook = load_workbook(buffer, read_only=True, data_only=True)
+        # Imports commit chunk by chunk, so the size and XML are checked by a quick
+        # count before the first chunk; the header is the first counted row.
+        if count_sheet_rows(archive, sheet, max_rows + 1) > max_rows + 1:
+            raise UploadTooLargeError(f"XLSX contains more than {max_rows} rows and was rejected.")
+        sheet_rows = iter_sheet_rows(archive, sheet)
+        first = next(sheet_rows, None)
+        if first is None:
+            return
+
+        # A repeated header keeps its first position but takes the later column's values.
+        header_columns = {}
+        for column, cell in sorted(first[1].items()):
+            header = _normalise_header(cell)
+            if header:
+                header_columns[header] = column
+        headers = list(header_columns)
+        columns = list(header_columns.values())
+
+        for row_number, cells in sheet_rows:
+            if not cells:
+                continue
+
+            row_count += 1
+            if row_count > max_rows:
+                raise UploadTooLargeError(f"XLSX contains more than {max_rows} rows and was rejected.")
+
+            rows.append([cells.get(column) for column in columns])
+            positions.append(row_number - 2)
+
+            if len(rows) >= CHUNK_SIZE:
+                yield _xlsx_chunk(headers, rows, positions)
+                rows, positions = [], []
+
+        if rows:
+            yield _xlsx_chunk(headers, rows, positions)
+    except UploadError:
+        raise
     except Exception as exc:
-        raise UploadError(f"Failed to open XLSX file: {exc}", 400) from exc
+        raise UploadError(f"Failed to parse XLSX: {exc}", 400) from exc
+    finally:
+        archive.close()
+
+
+def _xlsx_chunk(headers, rows, positions) -> pd.DataFrame:
+    # Transposing with zip(*) hands pandas one list per column instead of a dict per row.
+    data = dict(zip(headers, map(list, zip(*rows)))) if headers else {}
+    return _strip_formula_injection(pd.DataFrame(data, index=positions, columns=headers))
+
 
+def _read_xlsx_chunks(workbook) -> Iterator[pd.DataFrame]:
+    _, max_rows = upload_limits()
     rows = []
+    positions = []
     row_count = 0
     try:
         sheet = workbook.active
         headers = None
-        for row in sheet.iter_rows(values_only=True):
+        for position, row in enumerate(sheet.iter_rows(values_only=True)):
             if headers is None:
                 headers = [_normalise_header(cell) for cell in row]
                 continue
@@ -147,8 +450,8 @@ def _parse_xlsx_bytes(data: bytes) -> Tuple[pd.DataFrame, int]:
                 continue
 
             row_count += 1
-            if row_count > MAX_ROWS:
-                raise UploadTooLargeError("XLSX contains more than 100000 rows and was rejected.")
+            if row_count > max_rows:
+                raise UploadTooLargeError(f"XLSX contains more than {max_rows} rows and was rejected.")
 
             record = {}
             for header, cell in zip(headers, row):
@@ -157,6 +460,15 @@ def _parse_xlsx_bytes(data: bytes) -> Tuple[pd.DataFrame, int]:
                 value = _strip_leading_equals(cell) if isinstance(cell, str) else cell
                 record[header] = value
             rows.append(record)
+            # Keep the sheet position so error messages point at the real spreadsheet row.
+            positions.append(position - 1)
+
+            if len(rows) >= CHUNK_SIZE:
+                yield _strip_formula_injection(pd.DataFrame(rows, index=positions))
+                rows, positions = [], []
+
+        if rows:
+            yield _strip_formula_injection(pd.DataFrame(rows, index=positions))
     except UploadError:
         raise
     except Exception as exc:
@@ -164,10 +476,6 @@ def _parse_xlsx_bytes(data: bytes) -> Tuple[pd.DataFrame, int]:
     finally:
         workbook.close()
 
-    dataframe = pd.DataFrame(rows)
-    dataframe = _strip_formula_injection(dataframe)
-    return dataframe, row_count
-
 
 def _normalise_header(cell) -> str:
     if cell is None:
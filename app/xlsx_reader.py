@@ -0,0 +1,318 @@
+"""Streaming reader for the active worksheet of an .xlsx package.
+
+openpyxl builds a cell object for every value, which dominates import time on
+large sheets. This reader parses the worksheet XML incrementally, resolves shared
+strings and date styles itself, and yields each row as a plain ``{column: value}``
+dict. Values match what openpyxl returns with ``data_only=True``.
+
+``open_active_sheet`` raises ``UnsupportedWorkbook`` for any package layout it does
+not understand (strict OOXML, chart sheets, missing parts, ...). Callers fall
+back to openpyxl in that case, before any row has been produced.
+"""
+
+import posixpath
+import pyexpat
+import xml.etree.ElementTree as ET
+import zipfile
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+from openpyxl.utils.cell import column_index_from_string
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel, from_ISO8601
+
+MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+DOC_REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+PKG_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+WORKSHEET_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet'
+SHARED_STRINGS_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings'
+STYLES_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles'
+
+WORKBOOK_PATH = 'xl/workbook.xml'
+WORKBOOK_RELS_PATH = 'xl/_rels/workbook.xml.rels'
+
+READ_BLOCK_SIZE = 64 * 1024
+
+# expat (namespace-aware) reports element names as "<namespace> <local name>".
+_EXPAT_NS = MAIN_NS.strip('{}') + ' '
+ROW = _EXPAT_NS + 'row'
+CELL = _EXPAT_NS + 'c'
+VALUE = _EXPAT_NS + 'v'
+INLINE_STRING = _EXPAT_NS + 'is'
+TEXT = _EXPAT_NS + 't'
+PHONETIC_RUN = _EXPAT_NS + 'rPh'
+
+DATE_STYLE = 'date'
+TIMEDELTA_STYLE = 'timedelta'
+
+
+class UnsupportedWorkbook(Exception):
+    """The package uses a layout the streaming reader does not handle."""
+
+
+@dataclass
+class SheetSource:
+    """Everything needed to decode one worksheet part."""
+
+    path: str
+    shared_strings: List[str]
+    cell_styles: List[Optional[str]]  # Per cellXfs index: DATE_STYLE, TIMEDELTA_STYLE or None
+    epoch: object
+
+
+def open_active_sheet(archive: zipfile.ZipFile) -> SheetSource:
+    """Locate the sheet openpyxl would report as ``workbook.active`` and load its lookups."""
+
+    names = set(archive.namelist())
+    try:
+        workbook = ET.fromstring(archive.read(WORKBOOK_PATH))
+        relationships = _read_relationships(archive, WORKBOOK_RELS_PATH)
+    except (KeyError, ET.ParseError) as exc:
+        raise UnsupportedWorkbook(f"unreadable workbook part: {exc}") from exc
+    if workbook.tag != MAIN_NS + 'workbook':
+        raise UnsupportedWorkbook(f"unexpected workbook namespace: {workbook.tag}")
+
+    sheets = workbook.findall(f'{MAIN_NS}sheets/{MAIN_NS}sheet')
+    view = workbook.find(f'{MAIN_NS}bookViews/{MAIN_NS}workbookView')
+    active = int(view.get('activeTab', 0)) if view is not None else 0
+    if not sheets or active >= len(sheets):
+        raise UnsupportedWorkbook("workbook lists no usable sheets")
+
+    rel_type, path = relationships.get(sheets[active].get(DOC_REL_NS + 'id'), (None, None))
+    if rel_type != WORKSHEET_REL or path not in names:
+        raise UnsupportedWorkbook("active sheet is not a worksheet part")
+
+    by_type = {rel_type: target for rel_type, target in relationships.values()}
+    properties = workbook.find(MAIN_NS + 'workbookPr')
+    date1904 = properties is not None and properties.get('date1904', '').lower() in ('1', 'true')
+
+    try:
+        shared_strings = _read_shared_strings(archive, by_type.get(SHARED_STRINGS_REL))
+        cell_styles = _read_cell_styles(archive, by_type.get(STYLES_REL))
+    except (KeyError, ET.ParseError, ValueError) as exc:
+        raise UnsupportedWorkbook(f"unreadable shared strings or styles: {exc}") from exc
+
+    return SheetSource(
+        path=path,
+        shared_strings=shared_strings,
+        cell_styles=cell_styles,
+        epoch=CALENDAR_MAC_1904 if date1904 else CALENDAR_WINDOWS_1900,
+    )
+
+
+def iter_sheet_rows(archive: zipfile.ZipFile, sheet: SheetSource) -> Iterator[Tuple[int, Dict[int, object]]]:
+    """Yield ``(row number, {column number: value})`` for each row element, both 1-based.
+
+    Empty cells are left out of the dict. The part is fed to expat in blocks and no
+    element tree is built, so memory stays flat however long the sheet is.
+    """
+
+    rows = _SheetRowParser(sheet)
+    with archive.open(sheet.path) as handle:
+        while True:
+            block = handle.read(READ_BLOCK_SIZE)
+            rows.feed(block, final=not block)
+            yield from rows.completed
+            rows.completed.clear()
+            if not block:
+                break
+
+
+def count_sheet_rows(archive: zipfile.ZipFile, sheet: SheetSource, limit: int) -> int:
+    """Count the row elements holding at least one value, stopping once ``limit`` is passed.
+
+    Only start tags reach Python and no value is decoded, so this is a quick pass
+    for checking a sheet's size and XML before any row is imported. Rows whose
+    only values are empty count too, so the result never undercounts
+    ``iter_sheet_rows``.
+    """
+
+    rows = 0
+    pending = False
+
+    def start(name, attrs):
+        nonlocal rows, pending
+        if name == ROW:
+            pending = True
+        elif pending and (name == VALUE or name == INLINE_STRING):
+            rows += 1
+            pending = False
+
+    parser = pyexpat.ParserCreate(namespace_separator=' ')
+    parser.StartElementHandler = start
+    with archive.open(sheet.path) as handle:
+        while rows <= limit:
+            block = handle.read(READ_BLOCK_SIZE)
+            parser.Parse(block, not block)
+            if not block:
+                break
+    return rows
+
+
+class _SheetRowParser:
+    """expat callbacks that turn ``<row>``/``<c>`` elements into value dicts."""
+
+    def __init__(self, sheet: SheetSource) -> None:
+        self.strings = sheet.shared_strings
+        self.styles = sheet.cell_styles
+        self.epoch = sheet.epoch
+        self.completed: List[Tuple[int, Dict[int, object]]] = []
+
+        self.row_number = 0
+        self.values: Dict[int, object] = {}
+        self.column = 0
+        self.cell_type = 'n'
+        self.cell_style = None
+        self.raw = None
+        self.text: Optional[List[str]] = None  # Collects character data while inside <v> or <t>
+        self.inline: Optional[List[str]] = None
+        self.in_phonetic = False
+
+        self.parser = pyexpat.ParserCreate(namespace_separator=' ')
+        self.parser.buffer_text = True
+        self.parser.StartElementHandler = self.start
+        self.parser.EndElementHandler = self.end
+        self.parser.CharacterDataHandler = self.characters
+
+    def feed(self, block: bytes, final: bool) -> None:
+        self.parser.Parse(block, final)
+
+    def start(self, name, attrs) -> None:
+        if name == CELL:
+            ref = attrs.get('r')
+            self.column = _column_index(ref) if ref else self.column + 1
+            self.cell_type = attrs.get('t', 'n')
+            self.cell_style = attrs.get('s')
+            self.raw = None
+            self.inline = None
+        elif name == VALUE:
+            self.text = []
+        elif name == TEXT:
+            if not self.in_phonetic and self.inline is not None:
+                self.text = []
+        elif name == ROW:
+            self.row_number = int(attrs.get('r') or self.row_number + 1)
+            self.values = {}
+            self.column = 0
+        elif name == INLINE_STRING:
+            self.inline = []
+        elif name == PHONETIC_RUN:
+            self.in_phonetic = True
+
+    def end(self, name) -> None:
+        if name == CELL:
+            value = self.cell_value()
+            if value is not None:
+                self.values[self.column] = value
+        elif name == VALUE:
+            # An empty <v/> (a formula saved without its result) reads as None, like openpyxl.
+            self.raw = ''.join(self.text) or None
+            self.text = None
+        elif name == TEXT:
+            if self.text is not None:
+                self.inline.extend(self.text)
+                self.text = None
+        elif name == ROW:
+            self.completed.append((self.row_number, self.values))
+        elif name == PHONETIC_RUN:
+            self.in_phonetic = False
+
+    def characters(self, data: str) -> None:
+        if self.text is not None:
+            self.text.append(data)
+
+    def cell_value(self):
+        data_type = self.cell_type
+        if data_type == 'inlineStr':
+            return ''.join(self.inline) if self.inline is not None else None
+
+        raw = self.raw
+        if raw is None:
+            return None
+        if data_type == 's':
+            return self.strings[int(raw)]
+        if data_type == 'n':
+            number = float(raw) if ('.' in raw or 'E' in raw or 'e' in raw) else int(raw)
+            style = self.cell_style
+            kind = self.styles[int(style)] if style and int(style) < len(self.styles) else None
+            if kind == DATE_STYLE:
+                return from_excel(number, self.epoch)
+            if kind == TIMEDELTA_STYLE:
+                return from_excel(number, self.epoch, timedelta=True)
+            return number
+        if data_type == 'b':
+            return raw == '1'
+        if data_type == 'd':
+            return from_ISO8601(raw)
+        return raw  # 'str' formula results and 'e' error codes read as text
+
+
+@lru_cache(maxsize=None)
+def _column_letters_index(letters: str) -> int:
+    return column_index_from_string(letters)
+
+
+def _column_index(ref: str) -> int:
+    return _column_letters_index(ref.rstrip('0123456789'))
+
+
+def _rich_text(element) -> str:
+    """Concatenate plain and rich-text runs, skipping phonetic hints like openpyxl does."""
+
+    plain = element.find(MAIN_NS + 't')
+    if plain is not None:
+        return plain.text or ''
+    parts = []
+    for child in element:
+        if child.tag == MAIN_NS + 'rPh':
+            continue
+        parts.extend(text.text or '' for text in child.iter(MAIN_NS + 't'))
+    return ''.join(parts)
+
+
+def _read_relationships(archive: zipfile.ZipFile, path: str) -> Dict[str, Tuple[str, str]]:
+    base = posixpath.dirname(posixpath.dirname(path))
+    relationships = {}
+    for rel in ET.fromstring(archive.read(path)).iter(PKG_REL_NS + 'Relationship'):
+        target = rel.get('Target', '')
+        if target.startswith('/'):
+            target = target.lstrip('/')
+        else:
+            target = posixpath.normpath(posixpath.join(base, target))
+        relationships[rel.get('Id')] = (rel.get('Type'), target)
+    return relationships
+
+
+def _read_shared_strings(archive: zipfile.ZipFile, path: Optional[str]) -> List[str]:
+    if not path:
+        return []
+    strings = []
+    with archive.open(path) as handle:
+        for _, element in ET.iterparse(handle):
+            if element.tag == MAIN_NS + 'si':
+                strings.append(_rich_text(element))
+                element.clear()
+    return strings
+
+
+def _read_cell_styles(archive: zipfile.ZipFile, path: Optional[str]) -> List[Optional[str]]:
+    if not path:
+        return []
+    root = ET.fromstring(archive.read(path))
+    custom_formats = {
+        int(fmt.get('numFmtId')): fmt.get('formatCode', '')
+        for fmt in root.iterfind(f'{MAIN_NS}numFmts/{MAIN_NS}numFmt')
+    }
+
+    styles = []
+    for xf in root.iterfind(f'{MAIN_NS}cellXfs/{MAIN_NS}xf'):
+        format_id = int(xf.get('numFmtId', 0))
+        code = custom_formats.get(format_id, BUILTIN_FORMATS.get(format_id, 'General'))
+        if is_timedelta_format(code):
+            styles.append(TIMEDELTA_STYLE)
+        elif is_date_format(code):
+            styles.append(DATE_STYLE)
+        else:
+            styles.append(None)
+    return styles
@@ -0,0 +1,133 @@
+"""Compare the old iterrows import validation with the vectorized chunk validator.
+
+Run from the repository root:
+
+    python benchmarks/bench_import_validation.py [rows]
+
+No database is needed; the college lookup frame is built in memory.
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.models import Customer  # noqa: E402
+from app.services.import_service import validate_customer_chunk  # noqa: E402
+from app.upload_utils import CHUNK_SIZE  # noqa: E402
+
+COLLEGES = [('Egypt', f'University {u}', f'College {c}') for u in range(20) for c in range(10)]
+
+
+def build_rows(count: int) -> pd.DataFrame:
+    records = []
+    for i in range(count):
+        country, university, college = COLLEGES[i % len(COLLEGES)]
+        if i % 50 == 0:
+            college = 'Unknown College'
+        records.append({
+            'full_name': f'  Student {i} ' if i % 97 else '',
+            'email': f'student{i}@example.com' if i % 3 else None,
+            'whatsapp_number': f'0100{i:07d}',
+            'year': str(1 + i % 5),
+            'country': country,
+            'university': university.upper() if i % 7 == 0 else university,
+            'college': college,
+        })
+    return pd.DataFrame(records, dtype=str)
+
+
+def legacy_validate(df: pd.DataFrame, college_map: dict):
+    """The pre-vectorization loop from import_customers, kept here as the baseline."""
+
+    def normalise_text(value):
+        if value is None:
+            return ''
+        if isinstance(value, str):
+            return value.strip()
+        if pd.isna(value):
+            return ''
+        return str(value).strip()
+
+    def optional_value(value):
+        if value is None:
+            return None
+        if isinstance(value, str):
+            text = value.strip()
+            return text or None
+        if pd.isna(value):
+            return None
+        return value
+
+    new_customers = []
+    errors = []
+    for index, row in df.iterrows():
+        country_name = normalise_text(row.get('country')).lower()
+        university_name = normalise_text(row.get('university')).lower()
+        college_name = normalise_text(row.get('college')).lower()
+        full_name = normalise_text(row.get('full_name'))
+
+        if not full_name:
+            errors.append(f"Row {index + 2}: Missing required full_name value.")
+            continue
+
+        college_id = college_map.get((country_name, university_name, college_name))
+        if not college_id:
+            errors.append(f"Row {index + 2}: Could not find College '{row.get('college')}'.")
+            continue
+
+        new_customers.append(Customer(
+            full_name=full_name,
+            email=optional_value(row.get('email')),
+            whatsapp_number=optional_value(row.get('whatsapp_number')),
+            year=optional_value(row.get('year')),
+            college_id=college_id,
+        ))
+    return new_customers, errors
+
+
+def vectorized_validate(df: pd.DataFrame, colleges: pd.DataFrame):
+    records, errors = [], []
+    for start in range(0, len(df), CHUNK_SIZE):
+        chunk_records, chunk_errors = validate_customer_chunk(df.iloc[start:start + CHUNK_SIZE], colleges)
+        records.extend(chunk_records)
+        errors.extend(chunk_errors)
+    return records, errors
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    df = build_rows(count)
+
+    college_map = {
+        (country.lower(), university.lower(), college.lower()): college_id
+        for college_id, (country, university, college) in enumerate(COLLEGES, start=1)
+    }
+    colleges = pd.DataFrame(
+        [(*key, college_id) for key, college_id in college_map.items()],
+        columns=['country_key', 'university_key', 'college_key', 'college_id'],
+    )
+
+    legacy_seconds, (legacy_rows, legacy_errors) = timed(legacy_validate, df, college_map)
+    fast_seconds, (fast_rows, fast_errors) = timed(vectorized_validate, df, colleges)
+
+    assert len(legacy_rows) == len(fast_rows), (len(legacy_rows), len(fast_rows))
+    assert len(legacy_errors) == len(fast_errors), (len(legacy_errors), len(fast_errors))
+
+    print(f"rows={count} valid={len(fast_rows)} errors={len(fast_errors)}")
+    print(f"iterrows + Customer(): {legacy_seconds:8.3f}s")
+    print(f"vectorized chunks:     {fast_seconds:8.3f}s")
+    print(f"speed-up:              {legacy_seconds / fast_seconds:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Compare the openpyxl XLSX chunk reader with the streaming XML reader.
+
+Run from the repository root:
+
+    python benchmarks/bench_xlsx_reader.py [rows]
+
+The workbook is generated in memory; no database is needed.
+"""
+
+import io
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import upload_utils  # noqa: E402
+
+
+def build_workbook(count: int) -> bytes:
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(["full_name", "email", "whatsapp_number", "year", "country", "university", "college"])
+    for i in range(count):
+        sheet.append([
+            f"Student {i}",
+            f"student{i}@example.com",
+            f"0100{i:07d}",
+            1 + i % 5,
+            "Egypt",
+            f"University {i % 20}",
+            f"College {i % 10}",
+        ])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def read_openpyxl(data: bytes):
+    workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    return list(upload_utils._read_xlsx_chunks(workbook))
+
+
+def read_streaming(data: bytes):
+    return list(upload_utils._iter_xlsx_chunks(data))
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    data = build_workbook(count)
+
+    openpyxl_seconds, openpyxl_chunks = timed(read_openpyxl, data)
+    stream_seconds, stream_chunks = timed(read_streaming, data)
+
+    pd.testing.assert_frame_equal(pd.concat(openpyxl_chunks), pd.concat(stream_chunks))
+
+    print(f"rows={count} size={len(data) / 1024 / 1024:.1f} MB")
+    print(f"openpyxl read_only: {openpyxl_seconds:8.3f}s")
+    print(f"streaming XML:      {stream_seconds:8.3f}s")
+    print(f"speed-up:           {openpyxl_seconds / stream_seconds:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+// Lazy drill-down for report trees.
+//
+// A container with data-drilldown-url loads its children the first time it is
+// expanded (Bootstrap collapse), when a [data-drilldown-load] button inside it is
+// clicked, or when it receives a 'drilldown:load' event. Items are appended to its
+// [data-drilldown-items] element with the renderer named by data-drilldown-render,
+// one keyset page at a time; data-drilldown-empty replaces the empty message.
+$(document).ready(function() {
+    var nodeCounter = 0;
+
+    function money(value) {
+        return Number(value || 0).toFixed(2) + ' EGP';
+    }
+
+    var renderers = {
+        'payment-rows': function(payment) {
+            return $('<tr>')
+                .append($('<td>').append($('<a>').attr('href', payment.customer_url).text(payment.customer_name)))
+                .append($('<td>').text(payment.payment_date))
+                .append($('<td class="text-right">').text(money(payment.amount)));
+        },
+        'payment-items': function(payment) {
+            return $('<div class="payment-item">')
+                .append($('<div class="payment-date">').append('<i class="tim-icons icon-calendar-60"></i> ').append(document.createTextNode(payment.payment_date)))
+                .append($('<div class="payment-method">').append('<i class="tim-icons icon-credit-card"></i> ').append(document.createTextNode(payment.payment_method || '')))
+                .append($('<div class="payment-amount">').text(money(payment.amount)));
+        },
+        'payment-table-rows': function(payment) {
+            return $('<tr>').attr('data-searchable', (payment.period + ' ' + payment.subject).toLowerCase())
+                .append($('<td>').text(payment.payment_date))
+                .append($('<td>').append($('<span class="badge badge-dark">').text(payment.year)))
+                .append($('<td>').append($('<span class="badge">').addClass(payment.structure === 'modules' ? 'badge-primary' : 'badge-info').text(payment.period)))
+                .append($('<td>').text(payment.subject))
+                .append($('<td>').append('<i class="tim-icons icon-credit-card"></i> ').append(document.createTextNode(payment.payment_method || '')))
+                .append($('<td class="text-right">').append($('<strong>').text(money(payment.amount))));
+        },
+        'note-items': function(note, container) {
+            var remove = $('<form method="POST">').attr('action', note.delete_url)
+                .on('submit', function() { return confirm('Are you sure you want to delete this note?'); })
+                .append($('<input type="hidden" name="csrf_token">').val(container.data('csrf-token')))
+                .append('<button type="submit" class="btn btn-link text-danger p-0"><i class="tim-icons icon-trash-simple"></i> Delete</button>');
+            return $('<li>')
+                .append('<div class="timeline-badge"><i class="tim-icons icon-chat-33"></i></div>')
+                .append($('<div class="timeline-panel">')
+                    .append($('<div class="timeline-heading">').append($('<span class="badge badge-pill badge-info">').text(note.creation_date)))
+                    .append($('<div class="timeline-body">').append($('<p>').text(note.content)))
+                    .append($('<div class="timeline-footer">').append(remove)));
+        },
+        'subject-cards': function(subject) {
+            var id = 'drilldown-node-' + (++nodeCounter);
+            var header = $('<div class="accordion-header">').append(
+                $('<button class="accordion-button" type="button" data-toggle="collapse">').attr('data-target', '#' + id)
+                    .append($('<span class="accordion-title">').append('<i class="tim-icons icon-book-bookmark"></i> ').append(document.createTextNode(subject.name)))
+                    .append($('<span class="accordion-badge badge-default">').text(money(subject.total)))
+            );
+            var body = $('<div class="collapse" data-drilldown-render="payment-rows">').attr('id', id).attr('data-drilldown-url', subject.payments_url)
+                .append($('<div class="accordion-body">').append(
+                    $('<table class="table report-table">')
+                        .append('<thead><tr><th>Student</th><th>Date</th><th class="text-right">Amount</th></tr></thead>')
+                        .append($('<tbody data-drilldown-items>').append(
+                            $('<tr class="drilldown-placeholder">').append($('<td colspan="3" class="text-center">').text('Loading ' + subject.payment_count + ' payments...'))
+                        ))
+                ));
+            return $('<div class="accordion-card">').append(header).append(body);
+        }
+    };
+
+    // Messages go in a table cell spanning the table when the items are table rows.
+    function note(items, text) {
+        if (items.is('tbody')) {
+            var columns = items.closest('table').find('thead th').length || 3;
+            return $('<tr class="drilldown-note">').append($('<td class="text-center">').attr('colspan', columns).text(text));
+        }
+        return $(items.is('ul') ? '<li>' : '<div>').addClass('text-center text-muted py-2 drilldown-note').text(text);
+    }
+
+    function load(container) {
+        if (container.data('drilldown-busy')) return;
+        var cursor = container.data('drilldown-cursor');
+        if (container.data('drilldown-loaded') && !cursor) return;
+
+        var items = container.find('[data-drilldown-items]').first();
+        var render = renderers[container.data('drilldown-render')];
+        var url = new URL(container.data('drilldown-url'), window.location.origin);
+        if (cursor) url.searchParams.set('cursor', cursor);
+
+        container.data('drilldown-busy', true);
+        fetch(url)
+            .then(function(response) { return response.json(); })
+            .then(function(body) {
+                items.children('.drilldown-placeholder').remove();
+                (body.items || []).forEach(function(item) { items.append(render(item, container)); });
+                if (!items.children().length) {
+                    items.append(note(items, container.data('drilldown-empty') || 'Nothing to show.'));
+                }
+                container.data('drilldown-loaded', true);
+                container.data('drilldown-cursor', body.next_cursor || null);
+
+                var more = container.children('.drilldown-more');
+                if (!more.length) {
+                    more = $('<button type="button" class="btn btn-sm btn-link drilldown-more">Load more</button>');
+                    container.append(more);
+                }
+                more.toggle(!!body.next_cursor);
+            })
+            .catch(function() {
+                items.children('.drilldown-placeholder').replaceWith(note(items, 'Could not load the details.'));
+            })
+            .finally(function() {
+                container.data('drilldown-busy', false);
+            });
+    }
+
+    $(document).on('show.bs.collapse', '[data-drilldown-url]', function(event) {
+        if (event.target === this && !$(this).data('drilldown-loaded')) load($(this));
+    });
+
+    $(document).on('drilldown:load', '[data-drilldown-url]', function(event) {
+        if (event.target === this && !$(this).data('drilldown-loaded')) load($(this));
+    });
+
+    $(document).on('click', '[data-drilldown-load]', function() {
+        var container = $(this).closest('[data-drilldown-url]');
+        $(this).remove();
+        load(container);
+    });
+
+    $(document).on('click', '.drilldown-more', function() {
+        load($(this).closest('[data-drilldown-url]'));
+    });
+});
@@ -24,6 +24,49 @@ $(document).ready(function() {
         }
     });
 
+    $('#pivot-form').on('submit', function(e) {
+        e.preventDefault();
+        var groupBy = [$('#pivot-rows').val(), $('#pivot-then').val()].filter(function(name, index, names) {
+            return name && names.indexOf(name) === index;
+        });
+        var measure = $('#pivot-measure').val();
+        var params = { group_by: groupBy.join(','), measures: measure };
+        if ($('#pivot-start').val()) { params.start = $('#pivot-start').val(); }
+        if ($('#pivot-end').val()) { params.end = $('#pivot-end').val(); }
+
+        $.getJSON(window.reportsUrls.analyticsPivot, params)
+            .done(function(data) {
+                var labels = {
+                    total: 'Total Revenue', course: 'Course Revenue', application: 'Application Revenue',
+                    payments: 'Payments', customers: 'Customers'
+                };
+                var $head = $('<tr>');
+                groupBy.forEach(function(name) {
+                    $head.append($('<th>').text($('#pivot-rows option[value="' + name + '"]').text()));
+                });
+                $head.append($('<th class="text-right">').text(labels[measure]));
+
+                var $body = $('#pivot-results tbody').empty();
+                data.rows.forEach(function(row) {
+                    var $row = $('<tr>');
+                    groupBy.forEach(function(name) { $row.append($('<td>').text(row[name])); });
+                    var value = row[measure];
+                    $row.append($('<td class="text-right">').text(value.toLocaleString(undefined, { maximumFractionDigits: 2 })));
+                    $body.append($row);
+                });
+                $('#pivot-results thead').empty().append($head);
+                $('#pivot-results').show();
+                $('#pivot-summary').text(
+                    'Showing ' + data.rows.length + ' of ' + data.groups + ' groups from ' +
+                    data.payments.toLocaleString() + ' matching payments.'
+                );
+            })
+            .fail(function(xhr) {
+                var message = xhr.responseJSON && xhr.responseJSON.error ? xhr.responseJSON.error : 'Could not run the pivot';
+                showNotification(message, 'warning');
+            });
+    });
+
     var style = document.createElement('style');
     style.innerHTML = `
         @keyframes spin { 
@@ -1,6 +1,7 @@
 import os
 import sys
 import types
+from datetime import datetime
 from pathlib import Path
 
 import pytest
@@ -52,6 +53,7 @@ dotenv_stub.load_dotenv = _load_dotenv
 sys.modules.setdefault("dotenv", dotenv_stub)
 
 from app import create_app, db
+from app.models import Payment, PaymentMethod
 
 
 @pytest.fixture
@@ -74,4 +76,32 @@ def app(tmp_path):
 
 @pytest.fixture
 def client(app):
-    return app.test_client()
\ No newline at end of file
+    return app.test_client()
+
+
+@pytest.fixture
+def admin_client(client):
+    """The test client, signed in as the seeded admin."""
+
+    client.post("/signin", data={"username": "admin", "password": "password"})
+    return client
+
+
+@pytest.fixture
+def add_payment(app):
+    """Commit a payment through the ORM and return it; call it inside an app context."""
+
+    def add(subject_id, customer_id, course=0, application=0, when=datetime(2024, 9, 1)):
+        payment = Payment(
+            subject_id=subject_id,
+            customer_id=customer_id,
+            payment_method=PaymentMethod.query.first(),
+            course_price_paid=course,
+            application_price_paid=application,
+            payment_date=when,
+        )
+        db.session.add(payment)
+        db.session.commit()
+        return payment
+
+    return add
@@ -0,0 +1,75 @@
+from datetime import datetime
+
+import pytest
+
+from app import db
+from app.models import College, Country, Currency, Customer, Instructor, Payment, Subject, University
+
+
+@pytest.fixture
+def catalogue(app):
+    with app.app_context():
+        cairo = College(name="Engineering", university=University(name="Cairo University", country=Country(name="Egypt")))
+        khartoum = College(name="Medicine", university=University(name="Khartoum University", country=Country(name="Sudan")))
+        currency = Currency.query.first()
+        statics = Subject(name="Statics", year=1, college=cairo, instructor=Instructor(name="Dr. Sums"), currency=currency)
+        anatomy = Subject(name="Anatomy", year=2, college=khartoum, currency=currency)
+        ann = Customer(full_name="Ann", college=cairo)
+        bob = Customer(full_name="Bob", college=khartoum)
+        db.session.add_all([statics, anatomy, ann, bob])
+        db.session.commit()
+        return {"statics": statics.id, "anatomy": anatomy.id, "ann": ann.id, "bob": bob.id}
+
+
+def pivot(client, **params):
+    response = client.get("/api/analytics/pivot", query_string=params)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def test_pivot_groups_filters_and_appends_new_payments(app, admin_client, catalogue, add_payment):
+    with app.app_context():
+        add_payment(catalogue["statics"], catalogue["ann"], 100, 20)
+        add_payment(catalogue["statics"], catalogue["ann"], 50, when=datetime(2024, 10, 3))
+        add_payment(catalogue["anatomy"], catalogue["bob"], 300)
+
+    data = pivot(admin_client, group_by="country", measures="total,payments,customers")
+    assert data["rows"] == [
+        {"country": "Sudan", "total": 300.0, "payments": 1, "customers": 1},
+        {"country": "Egypt", "total": 170.0, "payments": 2, "customers": 1},
+    ]
+
+    data = pivot(admin_client, group_by="payment_month,instructor", measures="course", country="Egypt", start="2024-10-01")
+    assert data["rows"] == [{"payment_month": "2024-10", "instructor": "Dr. Sums", "course": 50.0}]
+    assert pivot(admin_client, measures="payments", instructor="(none)")["rows"] == [{"payments": 1}]
+
+    snapshot = app.extensions["analytics_snapshot"]
+    with app.app_context():
+        add_payment(catalogue["anatomy"], catalogue["ann"], 25)
+    data = pivot(admin_client, group_by="college", measures="customers")
+    assert data["rows"][0] == {"college": "Medicine", "customers": 2}
+    assert snapshot.full_loads == 1  # The new payment was appended, not reloaded
+
+
+def test_pivot_reloads_after_edits_and_renames(app, admin_client, catalogue, add_payment):
+    with app.app_context():
+        payment_id = add_payment(catalogue["statics"], catalogue["ann"], 100).id
+    assert pivot(admin_client, group_by="subject")["rows"] == [{"subject": "Statics", "total": 100.0}]
+
+    with app.app_context():
+        db.session.get(Payment, payment_id).course_price_paid = 40
+        db.session.get(Subject, catalogue["statics"]).name = "Dynamics"
+        db.session.commit()
+    assert pivot(admin_client, group_by="subject")["rows"] == [{"subject": "Dynamics", "total": 40.0}]
+
+    with app.app_context():
+        db.session.delete(db.session.get(Payment, payment_id))
+        db.session.commit()
+    assert pivot(admin_client, group_by="subject")["rows"] == []
+
+
+def test_pivot_rejects_unknown_names(app, admin_client, catalogue):
+    assert admin_client.get("/api/analytics/pivot?group_by=planet").status_code == 400
+    assert admin_client.get("/api/analytics/pivot?measures=profit").status_code == 400
+    assert admin_client.get("/api/analytics/pivot?group_by=country,country").status_code == 400
+    assert admin_client.get("/api/analytics/pivot?start=yesterday").status_code == 400
@@ -0,0 +1,142 @@
+import pandas as pd
+from sqlalchemy import update
+
+from app import db
+from app.models import College, Country, Customer, University
+from app.services.customer_search import FTS5, rebuild_search_index, search_backend
+from app.services.import_service import import_customer_chunks
+
+
+def seed_customers(app):
+    with app.app_context():
+        cairo = College(name="Engineering", university=University(name="Cairo University", country=Country(name="Egypt")))
+        amman = College(name="Medicine", university=University(name="Jordan University", country=Country(name="Jordan")))
+        db.session.add_all([
+            Customer(full_name=name, email=email, year=year, college=college, whatsapp_number=phone)
+            for name, email, year, college, phone in (
+                ("Dina", "dina@example.com", 2, cairo, "01001"),
+                ("Ali", None, None, cairo, "01002"),
+                ("Omar", "omar@example.com", 1, amman, "07003"),
+                ("Ali", "ali2@example.com", 3, amman, None),
+                ("Salma", "salma@example.com", 2, cairo, "01005"),
+            )
+        ])
+        db.session.commit()
+        return cairo.university.country_id
+
+
+def read_all(client, query):
+    rows, cursor = [], None
+    while True:
+        body = client.get(f"/api/filter_customers?{query}&limit=2" + (f"&cursor={cursor}" if cursor else "")).get_json()
+        rows += body["customers"]
+        cursor = body["next_cursor"]
+        if not cursor:
+            return rows
+
+
+def test_customer_list_pages_in_sort_order(app, admin_client):
+    seed_customers(app)
+
+    by_name = read_all(admin_client, "sort=name")
+    assert [c["full_name"] for c in by_name] == ["Ali", "Ali", "Dina", "Omar", "Salma"]
+    assert len({c["id"] for c in by_name}) == 5
+
+    by_year = read_all(admin_client, "sort=year&order=desc")
+    assert [c["year"] for c in by_year] == [3, 2, 2, 1, None]
+    by_email = read_all(admin_client, "sort=email")
+    assert by_email[0]["email"] is None and by_email[1]["email"] == "ali2@example.com"
+
+    first = admin_client.get("/api/filter_customers?sort=university&limit=2").get_json()
+    assert first["total"] == 5 and first["next_cursor"]
+    uncounted = admin_client.get(
+        f"/api/filter_customers?sort=university&limit=2&count=0&cursor={first['next_cursor']}"
+    ).get_json()
+    assert uncounted["total"] is None
+    universities = [c["university_name"] for c in first["customers"] + uncounted["customers"]]
+    assert universities == ["Cairo University"] * 3 + ["Jordan University"]
+
+
+def test_customer_list_filters_and_rejects_bad_arguments(app, admin_client):
+    country_id = seed_customers(app)
+
+    egypt = admin_client.get(f"/api/filter_customers?country_id={country_id}&sort=created&order=desc").get_json()
+    assert egypt["total"] == 3 and {c["full_name"] for c in egypt["customers"]} == {"Dina", "Ali", "Salma"}
+    assert admin_client.get("/api/filter_customers?name=al&phone=010").get_json()["total"] == 2
+
+    assert admin_client.get("/api/filter_customers?sort=password").status_code == 400
+    assert admin_client.get("/api/filter_customers?order=sideways").status_code == 400
+    assert admin_client.get("/api/filter_customers?sort=name&cursor=nonsense").status_code == 400
+
+    page = admin_client.get("/view?limit=2&sort=nonsense").get_data(as_text=True)
+    assert page.count('href="/customer/') == 2
+    assert 'id="total-count">5<' in page
+
+
+def search(client, **params):
+    query = "&".join(f"{key}={value}" for key, value in params.items())
+    return client.get(f"/api/filter_customers?{query}").get_json()
+
+
+def test_customer_search_uses_the_index_and_ranks_matches(app, admin_client):
+    seed_customers(app)
+    with app.app_context():
+        assert search_backend() == FTS5
+
+    assert search(admin_client, email="EXAMPLE.com", phone="010")["total"] == 2
+    assert search(admin_client, name='a"li')["total"] == 0
+
+    # Session events keep the index in step with edits and deletes.
+    with app.app_context():
+        Customer.query.filter_by(full_name="Dina").one().full_name = "Dina Khalil"
+        db.session.delete(Customer.query.filter_by(full_name="Salma").one())
+        db.session.commit()
+    assert search(admin_client, name="salma")["total"] == 0
+
+    body = search(admin_client, name="ali")
+    assert body["sort"] == "relevance" and body["total"] == 3
+    # bm25 favours the shorter names, where the term weighs more.
+    assert [c["full_name"] for c in body["customers"]] == ["Ali", "Ali", "Dina Khalil"]
+    by_name = search(admin_client, name="ali", sort="name", order="desc")
+    assert [c["full_name"] for c in by_name["customers"]] == ["Dina Khalil", "Ali", "Ali"]
+
+
+def test_customer_search_falls_back_for_short_and_common_terms(app, admin_client, monkeypatch):
+    seed_customers(app)
+
+    short = search(admin_client, name="om")
+    assert short["sort"] == "name" and [c["full_name"] for c in short["customers"]] == ["Omar"]
+
+    monkeypatch.setattr("app.services.customer_list.RANKED_MATCH_LIMIT", 2)
+    common = search(admin_client, email="example", limit=2)
+    assert common["sort"] == "name" and common["total"] == 4
+    rest = search(admin_client, email="example", limit=2, count=0, cursor=common["next_cursor"])
+    names = [c["full_name"] for c in common["customers"] + rest["customers"]]
+    assert names == ["Ali", "Dina", "Omar", "Salma"] and rest["next_cursor"] is None
+
+
+def test_rebuild_search_index_reindexes_bulk_writes(app, admin_client):
+    seed_customers(app)
+    with app.app_context():
+        db.session.execute(update(Customer).where(Customer.full_name == "Omar").values(full_name="Omar Zaki"))
+        db.session.commit()
+    # A bulk UPDATE bypasses the session events until the index is rebuilt.
+    assert search(admin_client, name="zaki")["total"] == 0
+    with app.app_context():
+        assert rebuild_search_index() == 5
+    assert [c["full_name"] for c in search(admin_client, name="zaki")["customers"]] == ["Omar Zaki"]
+
+
+def test_customer_import_indexes_inserted_and_updated_rows(app, admin_client):
+    seed_customers(app)
+    rows = pd.DataFrame([
+        {"full_name": "Yara Mansour", "email": "yara@example.com", "whatsapp_number": "01009", "year": "1",
+         "country": "Egypt", "university": "Cairo University", "college": "Engineering"},
+    ])
+    with app.app_context():
+        import_customer_chunks([rows])
+    assert [c["full_name"] for c in search(admin_client, name="mansour")["customers"]] == ["Yara Mansour"]
+
+    with app.app_context():
+        import_customer_chunks([rows.assign(email="yara@mansour.org")], mode="update_existing")
+    assert search(admin_client, email="mansour.org")["total"] == 1
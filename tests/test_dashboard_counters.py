@@ -0,0 +1,92 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from app import db
+from app.models import College, Country, Currency, Customer, DashboardCounter, Payment, PaymentMethod, Subject, University
+from app.services.dashboard_counters import current_counts, reconcile_counters
+from app.services.import_service import import_customer_chunks
+
+
+@pytest.fixture
+def colleges(app):
+    with app.app_context():
+        egypt = Country(name="Egypt")
+        engineering = College(name="Engineering", university=University(name="Cairo University", country=egypt))
+        medicine = College(name="Medicine", university=University(name="Khartoum University", country=Country(name="Sudan")))
+        db.session.add_all([engineering, medicine])
+        db.session.commit()
+        return {"engineering": engineering.id, "medicine": medicine.id, "egypt": egypt.id}
+
+
+def stored_counts():
+    return {(counter.kind, counter.key): counter.value for counter in DashboardCounter.query if counter.value}
+
+
+def expected_counts():
+    return {counter: value for counter, value in current_counts().items() if value}
+
+
+def test_counters_follow_orm_inserts_edits_and_deletes(app, colleges):
+    with app.app_context():
+        ann = Customer(full_name="Ann", year=1, college_id=colleges["engineering"], creation_date=datetime(2024, 9, 1))
+        bob = Customer(full_name="Bob", college_id=colleges["engineering"], creation_date=datetime(2024, 10, 1))
+        db.session.add_all([ann, bob])
+        db.session.commit()
+        subject = Subject(name="Statics", year=1, college_id=colleges["engineering"], currency=Currency.query.first())
+        payment = Payment(customer=ann, subject=subject, payment_method=PaymentMethod.query.first(), payment_date=datetime(2024, 9, 5))
+        db.session.add(payment)
+        db.session.commit()
+        assert stored_counts() == expected_counts()
+        assert stored_counts()[("customers_by_country", str(colleges["egypt"]))] == 2
+
+        ann.year = 2
+        bob.college_id = colleges["medicine"]
+        payment.payment_date = datetime(2024, 11, 5)
+        db.session.commit()
+        assert stored_counts() == expected_counts()
+
+        # Moving a college moves its customers between universities and countries.
+        engineering = db.session.get(College, colleges["engineering"])
+        engineering.university_id = db.session.get(College, colleges["medicine"]).university_id
+        db.session.commit()
+        assert stored_counts() == expected_counts()
+        assert ("customers_by_country", str(colleges["egypt"])) not in stored_counts()
+
+        db.session.delete(payment)
+        db.session.delete(ann)
+        db.session.commit()
+        assert stored_counts() == expected_counts()
+        assert stored_counts()[("total", "customer")] == 1
+
+
+def test_counters_follow_bulk_customer_imports(app, colleges):
+    rows = pd.DataFrame([
+        {"full_name": "Ann", "email": "ann@example.com", "whatsapp_number": "0100", "year": "1",
+         "country": "Egypt", "university": "Cairo University", "college": "Engineering"},
+        {"full_name": "Bob", "email": "bob@example.com", "whatsapp_number": "0101", "year": "2",
+         "country": "Sudan", "university": "Khartoum University", "college": "Medicine"},
+    ])
+    with app.app_context():
+        import_customer_chunks([rows])
+        import_customer_chunks([rows.assign(year="3")], mode="update_existing")
+        assert stored_counts() == expected_counts()
+        assert stored_counts()[("customers_by_year", "3")] == 2
+
+
+def test_reconcile_repairs_drift(app, admin_client, colleges):
+    with app.app_context():
+        db.session.add(Customer(full_name="Ann", college_id=colleges["engineering"]))
+        db.session.commit()
+        db.session.get(DashboardCounter, ("total", "customer")).value = 40
+        db.session.add(DashboardCounter(kind="customers_by_year", key="7", value=3))
+        db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=["reconcile-counters"])
+
+    assert "2 repaired" in result.output
+    with app.app_context():
+        assert stored_counts() == expected_counts()
+        assert reconcile_counters() == 0
+    assert admin_client.get("/").status_code == 200
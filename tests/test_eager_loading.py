@@ -7,9 +7,11 @@ from sqlalchemy import event
 from app import db
 from app.models import (
     College,
+    CommunicationLog,
     Country,
     Currency,
     Customer,
+    Instructor,
     Module,
     Payment,
     PaymentMethod,
@@ -17,6 +19,7 @@ from app.models import (
     Term,
     University,
 )
+from app.services.report_service import build_customer_history, customer_payment_kpis, customer_subject_totals
 
 
 class QueryCounter:
@@ -164,4 +167,122 @@ def test_import_customers_college_map_single_query(app, client, seeded_data):
                 follow_redirects=False,
             )
             assert response.status_code in (302, 303)
-        assert counter.selects <= 3
\ No newline at end of file
+        assert counter.selects <= 3
+
+def test_instructor_report_aggregates_in_sql(app, client, seeded_data):
+    with app.app_context():
+        instructor = Instructor(name="Dr. Sums", email="sums@example.com")
+        subject = Subject.query.filter_by(name=seeded_data["subject_name"]).one()
+        subject.instructor = instructor
+        db.session.add(Payment(
+            customer_id=seeded_data["customer_id"],
+            subject=subject,
+            payment_method=PaymentMethod.query.first(),
+            course_price_paid=500,
+        ))
+        db.session.commit()
+        instructor_id, subject_id = instructor.id, subject.id
+
+        with QueryCounter(db.engine) as counter:
+            login_admin(client)
+            counter.reset()
+            response = client.get(f"/instructor_report/{instructor_id}")
+            assert response.status_code == 200
+        # Instructor, grouped totals and distinct students, whatever the payment count.
+        assert counter.selects <= 4
+
+    page = response.get_data(as_text=True)
+    assert "1500.00 EGP" in page
+    assert "Loading 2 payments" in page
+    assert "Customer 0" not in page
+
+    payments = client.get(f"/instructor_report/{instructor_id}/payments?subject_id={subject_id}").get_json()["items"]
+    assert [p["amount"] for p in payments] == [500, 1000]
+    assert payments[0]["customer_name"] == "Customer 0"
+
+
+def test_report_drilldowns_page_with_keyset_cursors(app, client, seeded_data):
+    with app.app_context():
+        subject = Subject.query.filter_by(name=seeded_data["subject_name"]).one()
+        for amount in (10, 20, 30):
+            db.session.add(Payment(
+                customer_id=seeded_data["customer_id"],
+                subject=subject,
+                payment_method=PaymentMethod.query.first(),
+                application_price_paid=amount,
+            ))
+        db.session.commit()
+        subject_id, college_id, term_id = subject.id, subject.college_id, subject.term_id
+
+    login_admin(client)
+    report = client.get("/application_report").get_data(as_text=True)
+    assert "Loading 1 subjects" in report
+    assert "Customer 0" not in report
+
+    subjects = client.get(
+        f"/application_report/subjects?college_id={college_id}&year=1&term_id={term_id}"
+    ).get_json()
+    assert [(s["name"], s["total"], s["payment_count"]) for s in subjects["items"]] == [("Advanced Math", 260.0, 4)]
+    assert subjects["next_cursor"] is None
+
+    amounts, cursor = [], None
+    while True:
+        url = subjects["items"][0]["payments_url"] + "&limit=3" + (f"&cursor={cursor}" if cursor else "")
+        page = client.get(url).get_json()
+        amounts += [p["amount"] for p in page["items"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert sorted(amounts) == [10, 20, 30, 200]
+    assert len(amounts) == 4
+
+    assert client.get(subjects["items"][0]["payments_url"] + "&cursor=nonsense").status_code == 400
+    history = client.get(f"/customer/{seeded_data['customer_id']}/payments?subject_id={subject_id}&limit=2").get_json()
+    assert len(history["items"]) == 2 and history["next_cursor"]
+
+
+def test_customer_profile_aggregates_and_pages_sections(app, client, seeded_data):
+    customer_id = seeded_data["customer_id"]
+    with app.app_context():
+        subject = Subject.query.filter_by(name=seeded_data["subject_name"]).one()
+        for amount in (10, 20):
+            db.session.add(Payment(
+                customer_id=customer_id,
+                subject=subject,
+                payment_method=PaymentMethod.query.first(),
+                course_price_paid=amount,
+            ))
+        for i in range(3):
+            db.session.add(CommunicationLog(content=f"Call {i}", customer_id=customer_id))
+        db.session.commit()
+
+        kpis = customer_payment_kpis(customer_id)
+        assert (kpis["total_paid"], kpis["total_payments_count"], kpis["total_subjects_enrolled"]) == (1230.0, 3, 1)
+        history = build_customer_history(customer_subject_totals(customer_id))
+        math = history.child(1).child("terms").child("Term 1").child(subject.id)
+        assert (math.total, math.sum("payment_count")) == (1230.0, 3)
+        assert customer_payment_kpis(seeded_data["customer_id"] + 1)["total_payments_count"] == 0
+
+    login_admin(client)
+    page = client.get(f"/customer/{customer_id}").get_data(as_text=True)
+    assert "1230.00" in page
+    assert "Call 0" not in page
+
+    amounts, cursor = [], None
+    while True:
+        url = f"/customer/{customer_id}/payments?limit=2" + (f"&cursor={cursor}" if cursor else "")
+        body = client.get(url).get_json()
+        amounts += [p["amount"] for p in body["items"]]
+        cursor = body["next_cursor"]
+        if not cursor:
+            break
+    assert sorted(amounts) == [10, 20, 1200]
+    assert all(p["period"] == "Term 1" for p in client.get(f"/customer/{customer_id}/payments").get_json()["items"])
+
+    notes = client.get(f"/customer/{customer_id}/notes?limit=2").get_json()
+    assert len(notes["items"]) == 2 and notes["next_cursor"]
+    rest = client.get(f"/customer/{customer_id}/notes?limit=2&cursor={notes['next_cursor']}").get_json()
+    contents = [n["content"] for n in notes["items"] + rest["items"]]
+    assert sorted(contents) == ["Call 0", "Call 1", "Call 2"] and rest["next_cursor"] is None
+    assert notes["items"][0]["delete_url"].endswith(f"/{notes['items'][0]['id']}")
+    assert client.get(f"/customer/{customer_id}/notes?cursor=nonsense").status_code == 400
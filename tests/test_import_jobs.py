@@ -0,0 +1,266 @@
+import hashlib
+import io
+import time
+from datetime import datetime, timedelta, UTC
+
+import pytest
+
+from app import create_app, db
+from app.models import College, CollegeYear, Country, Currency, Customer, ImportJob, Module, Payment, RevenueSummary, Subject, Term, University, User
+
+
+@pytest.fixture(autouse=True)
+def reset_env(monkeypatch):
+    for key in ("FLASK_ENV", "DEBUG", "SECRET_KEY", "DATABASE_URL"):
+        monkeypatch.delenv(key, raising=False)
+    yield
+    for key in ("FLASK_ENV", "DEBUG", "SECRET_KEY", "DATABASE_URL"):
+        monkeypatch.delenv(key, raising=False)
+
+
+@pytest.fixture
+def app(monkeypatch, tmp_path):
+    db_path = tmp_path / "jobs.db"
+    monkeypatch.setenv("FLASK_ENV", "development")
+    monkeypatch.setenv("DEBUG", "True")
+    monkeypatch.setenv("SECRET_KEY", "test-secret")
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{db_path}")
+
+    app = create_app()
+    app.config.update(
+        TESTING=True,
+        WTF_CSRF_ENABLED=False,
+        IMPORT_UPLOAD_FOLDER=str(tmp_path / "staged"),
+    )
+
+    with app.app_context():
+        country = Country(name="Egypt")
+        university = University(name="Cairo University", country=country)
+        college = College(name="Engineering", university=university)
+        db.session.add_all([country, university, college])
+        db.session.commit()
+
+    yield app
+
+    with app.app_context():
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    client.post("/signin", data={"username": "admin", "password": "password"})
+    return client
+
+
+def wait_for_job(client, status_url, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(status_url).get_json()
+        if job["status"] in ("completed", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError("import job did not finish in time")
+
+
+def test_import_job_runs_in_background_and_reports_progress(client, app, tmp_path):
+    payload = (
+        "full_name,email,whatsapp_number,year,country,university,college\n"
+        "Bob Example,bob@example.com,555,2,Egypt,Cairo University,Engineering\n"
+        "Lost Row,lost@example.com,556,2,Egypt,Cairo University,Medicine\n"
+    )
+    response = client.post(
+        "/imports/customers",
+        data={"import_file": (io.BytesIO(payload.encode()), "customers.csv")},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 202
+    body = response.get_json()
+
+    job = wait_for_job(client, body["status_url"])
+
+    assert job["status"] == "completed"
+    assert (job["rows_processed"], job["inserted"], job["skipped"]) == (2, 1, 1)
+    assert list((tmp_path / "staged").iterdir()) == []
+    with app.app_context():
+        assert Customer.query.filter_by(full_name="Bob Example").count() == 1
+        assert db.session.get(ImportJob, body["job_id"]).stored_path is None
+
+
+def test_import_job_rejects_invalid_upload_synchronously(client):
+    response = client.post(
+        "/imports/customers",
+        data={"import_file": (io.BytesIO(b"bad"), "malware.exe")},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 415
+    assert "Invalid file type" in response.get_json()["error"]
+
+
+def test_reuploading_the_same_file_returns_the_earlier_job(client, app, tmp_path):
+    payload = (
+        "full_name,email,whatsapp_number,year,country,university,college\n"
+        "Bob Example,bob@example.com,555,2,Egypt,Cairo University,Engineering\n"
+    ).encode()
+
+    def upload(**form):
+        return client.post(
+            "/imports/customers",
+            data={"import_file": (io.BytesIO(payload), "customers.csv"), **form},
+            content_type="multipart/form-data",
+        )
+
+    first = upload()
+    assert first.status_code == 202
+    wait_for_job(client, first.get_json()["status_url"])
+
+    again = upload()
+    assert again.status_code == 200
+    assert again.get_json()["duplicate"] is True
+    assert again.get_json()["job_id"] == first.get_json()["job_id"]
+    assert list((tmp_path / "staged").iterdir()) == []
+
+    confirmed = upload(confirm_duplicate="1")
+    assert confirmed.status_code == 202
+    wait_for_job(client, confirmed.get_json()["status_url"])
+
+    with app.app_context():
+        assert Customer.query.filter_by(full_name="Bob Example").count() == 2
+        jobs = ImportJob.query.order_by(ImportJob.id).all()
+        assert len(jobs) == 2
+        assert jobs[0].content_hash == jobs[1].content_hash
+        assert len(jobs[0].content_hash) == 64
+
+
+def test_jobs_orphaned_by_a_restart_do_not_block_reuploads(client, app):
+    payload = (
+        "full_name,email,whatsapp_number,year,country,university,college\n"
+        "Bob Example,bob@example.com,555,2,Egypt,Cairo University,Engineering\n"
+    ).encode()
+    content_hash = hashlib.sha256(payload).hexdigest()
+    now = datetime.now(UTC)
+    with app.app_context():
+        user_id = User.query.filter_by(username="admin").one().id
+        # Queued and running when the worker died, and a live job of another file.
+        db.session.add_all([
+            ImportJob(filename="customers.csv", content_hash=content_hash, user_id=user_id, status="queued",
+                      created_at=now - timedelta(hours=2)),
+            ImportJob(filename="customers.csv", content_hash=content_hash, user_id=user_id, status="running",
+                      created_at=now - timedelta(hours=2), started_at=now - timedelta(hours=2),
+                      progress_at=now - timedelta(hours=1)),
+            ImportJob(filename="other.csv", content_hash="0" * 64, user_id=user_id, status="running",
+                      created_at=now - timedelta(hours=2), progress_at=now - timedelta(minutes=1)),
+        ])
+        db.session.commit()
+
+    response = client.post(
+        "/imports/customers",
+        data={"import_file": (io.BytesIO(payload), "customers.csv")},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 202 and response.get_json()["duplicate"] is False
+    assert wait_for_job(client, response.get_json()["status_url"])["status"] == "completed"
+
+    with app.app_context():
+        statuses = [job.status for job in ImportJob.query.order_by(ImportJob.id)]
+        assert statuses == ["failed", "failed", "running", "completed"]
+        assert ImportJob.query.first().message == "The import was interrupted before it finished."
+
+
+def test_payment_import_resolves_customers_subjects_and_methods(client, app):
+    with app.app_context():
+        college = College.query.one()
+        currency = Currency.query.filter_by(code="EGP").one()  # Seeded with the default payment methods
+        term = Term(name="Term 1", year=2, college=college)
+        db.session.add_all([
+            term,
+            Subject(name="Statics", year=2, college=college, term_info=term, currency=currency),
+            Customer(full_name="Ann", whatsapp_number="0100", college_id=college.id),
+            Customer(full_name="Ben", whatsapp_number="0200", college_id=college.id),
+            Customer(full_name="Ben Twin", whatsapp_number="0200", college_id=college.id),
+        ])
+        db.session.commit()
+        ann_id = Customer.query.filter_by(full_name="Ann").one().id
+
+    payload = (
+        "customer_id,whatsapp_number,country,university,college,year,term,subject,payment_method,"
+        "course_price_paid,application_price_paid,payment_date,notes\n"
+        f"{ann_id},,Egypt,Cairo University,Engineering,2,term 1,statics,cash,500,50,2024-09-01,first\n"
+        ",0100,Egypt,Cairo University,Engineering,2,Term 1,Statics,Cash,250,,2024-09-02 18:30,\n"
+        ",0200,Egypt,Cairo University,Engineering,2,Term 1,Statics,Cash,100,0,,\n"
+        ",0100,Egypt,Cairo University,Engineering,2,Term 1,Dynamics,Cash,100,0,,\n"
+        ",0100,Egypt,Cairo University,Engineering,2,Term 1,Statics,Cheque,100,0,,\n"
+        ",0100,Egypt,Cairo University,Engineering,2,Term 1,Statics,Cash,100,0,,\n"
+        ",0100,Egypt,Cairo University,Engineering,2,Term 1,Statics,Cash,100,0,03/09/2024,\n"
+    )
+    response = client.post(
+        "/imports/payments",
+        data={"import_file": (io.BytesIO(payload.encode()), "payments.csv")},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 202
+
+    job = wait_for_job(client, response.get_json()["status_url"])
+
+    assert job["status"] == "completed"
+    assert job["message"] == "Successfully imported 2 payments. Skipped 5 rows with validation errors."
+    errors = client.get(f"/imports/{job['id']}/errors.csv").get_data(as_text=True).lstrip("\ufeff").splitlines()
+    assert errors[1] == "4,WhatsApp number '0200' matches more than one customer; use customer_id."
+    assert errors[2].startswith("5,Could not find Subject 'Dynamics'")
+    assert errors[3] == "6,Could not find payment method 'Cheque'."
+    assert errors[4:] == ["7,Missing payment_date value.", "8,Invalid payment_date '03/09/2024'; use YYYY-MM-DD."]
+    with app.app_context():
+        payments = Payment.query.order_by(Payment.id).all()
+        assert [(p.customer_id, p.course_price_paid, p.application_price_paid, p.notes) for p in payments] == [
+            (ann_id, 500.0, 50.0, "first"),
+            (ann_id, 250.0, 0.0, None),
+        ]
+        assert [p.payment_date.isoformat(" ") for p in payments] == ["2024-09-01 00:00:00", "2024-09-02 18:30:00"]
+        summary = RevenueSummary.query.all()
+        assert sum(row.course_revenue for row in summary) == 750.0
+        assert sum(row.application_payment_count for row in summary) == 1
+
+
+def test_catalogue_import_creates_missing_levels_once(client, app):
+    with app.app_context():
+        college = College.query.one()
+        db.session.add(Term(name="Term 1", year=1, college=college))
+        db.session.commit()
+
+    payload = (
+        "country,university,college,structure_type,year,term,module,subject,course_price,application_price,currency\n"
+        "egypt,cairo university,engineering,,1,term 1,,Maths,100,10,\n"
+        "Egypt,Cairo University,Engineering,,1,Term 1,,Physics,100,10,EGP\n"
+        "Egypt,Ain Shams,Medicine,module,2,,Anatomy,Bones,200,20,egp\n"
+        "Egypt,Ain Shams,Medicine,module,2,,anatomy,Bones,200,20,EGP\n"
+        "Jordan,,,,,,,,,,\n"
+        "Egypt,Ain Shams,,,3,,,,,,\n"
+        "Egypt,Ain Shams,Medicine,,3,Term 1,,Cells,x,0,\n"
+    )
+    job_ids = []
+    for _ in range(2):
+        response = client.post(
+            "/imports/catalogue",
+            # The second run re-imports the same file on purpose, so confirm it.
+            data={"import_file": (io.BytesIO(payload.encode()), "catalogue.csv"), "confirm_duplicate": "1"},
+            content_type="multipart/form-data",
+        )
+        assert response.status_code == 202
+        job_ids.append(wait_for_job(client, response.get_json()["status_url"]))
+
+    first, second = job_ids
+    assert first["message"] == (
+        "Catalogue import created 1 countries, 1 universities, 1 colleges, 2 years, 1 modules, 3 subjects. "
+        "Skipped 2 rows with validation errors."
+    )
+    assert second["message"] == "Catalogue import found nothing new to create. Skipped 2 rows with validation errors."
+    assert second["existing"] == 4
+    with app.app_context():
+        assert Country.query.count() == 2
+        assert Term.query.count() == 1
+        medicine = College.query.filter_by(name="Medicine").one()
+        assert medicine.structure_type == "module"
+        assert {y.year_number for y in CollegeYear.query.all()} == {1, 2}
+        bones = Subject.query.filter_by(name="Bones").one()
+        assert (bones.year, bones.module_info.name, bones.default_course_price) == (2, "Anatomy", 200.0)
+        assert Module.query.count() == 1
@@ -0,0 +1,51 @@
+import pandas as pd
+
+from app.services.import_service import validate_customer_chunk
+
+
+COLLEGES = pd.DataFrame(
+    [("egypt", "cairo university", "engineering", 7)],
+    columns=["country_key", "university_key", "college_key", "college_id"],
+)
+
+
+def test_validate_customer_chunk_resolves_colleges_case_insensitively():
+    chunk = pd.DataFrame(
+        [
+            {"full_name": " Alice ", "email": "", "whatsapp_number": "0100", "year": "2",
+             "country": "EGYPT", "university": "Cairo University ", "college": "engineering"},
+        ],
+        index=[40],
+    )
+
+    records, errors = validate_customer_chunk(chunk, COLLEGES)
+
+    assert errors == []
+    assert records == [{
+        "full_name": "Alice",
+        "email": None,
+        "whatsapp_number": "0100",
+        "phone_key": "+20100",
+        "year": 2,
+        "college_id": 7,
+    }]
+
+
+def test_validate_customer_chunk_reports_errors_in_row_order():
+    chunk = pd.DataFrame(
+        [
+            {"full_name": "Bob", "year": "1", "country": "Egypt", "university": "Cairo University", "college": "Law"},
+            {"full_name": None, "year": "1", "country": "Egypt", "university": "Cairo University", "college": "Engineering"},
+            {"full_name": "Carol", "year": "first", "country": "Egypt", "university": "Cairo University", "college": "Engineering"},
+        ],
+        index=[0, 1, 2],
+    )
+
+    records, errors = validate_customer_chunk(chunk, COLLEGES)
+
+    assert records == []
+    assert errors == [
+        (2, "Could not find College 'Law' in University 'Cairo University' / Country 'Egypt'."),
+        (3, "Missing required full_name value."),
+        (4, "Invalid year 'first'."),
+    ]
@@ -0,0 +1,78 @@
+import pandas as pd
+import pytest
+from sqlalchemy import select, text, update
+
+from app import db
+from app.models import College, Country, Customer, University
+from app.services.import_service import import_customer_chunks
+from app.services.phone_keys import backfill_phone_keys, phone_key, phone_prefix, phone_prefix_criteria
+
+
+@pytest.mark.parametrize("number", [
+    "+20 100 123 4567", "00201001234567", "0100-123-4567", "201001234567", "1001234567",
+])
+def test_phone_key_normalises_the_ways_a_number_is_typed(number):
+    assert phone_key(number, "20") == "+201001234567"
+
+
+def test_phone_key_and_prefix_edge_cases():
+    assert phone_key("", "20") is None
+    assert phone_key("N/A", "20") is None
+    assert phone_key("+44 20 7946 0958", "20") == "+442079460958"
+    assert [phone_prefix(term) for term in ("010", "2010", "+44", "10", "-")] == ["+2010", "+2010", "+44", "+2010", None]
+
+
+@pytest.fixture
+def college_id(app):
+    with app.app_context():
+        college = College(name="Engineering", university=University(name="Cairo University", country=Country(name="Egypt")))
+        db.session.add(college)
+        db.session.commit()
+        return college.id
+
+
+def test_orm_writes_and_backfill_fill_the_key(app, college_id):
+    with app.app_context():
+        customer = Customer(full_name="Ann", whatsapp_number="0100 123 4567", college_id=college_id)
+        db.session.add(customer)
+        db.session.commit()
+        assert customer.phone_key == "+201001234567"
+        customer.whatsapp_number = "+44 7700 900123"
+        db.session.commit()
+        assert customer.phone_key == "+447700900123"
+
+        db.session.add_all([Customer(full_name=f"C{i}", whatsapp_number=f"0111{i}", college_id=college_id) for i in range(3)])
+        db.session.add(Customer(full_name="No number", whatsapp_number="N/A", college_id=college_id))
+        db.session.commit()
+        db.session.execute(update(Customer).values(phone_key=None))
+        db.session.commit()
+        assert backfill_phone_keys(batch_size=2) == 4
+        assert backfill_phone_keys(batch_size=2) == 0
+        keys = db.session.scalars(select(Customer.phone_key).order_by(Customer.id)).all()
+        assert keys == ["+447700900123", "+201110", "+201111", "+201112", None]
+
+
+def test_imports_and_the_phone_filter_use_the_key(app, admin_client, college_id):
+    with app.app_context():
+        db.session.add(Customer(full_name="Ann", whatsapp_number="01001234567", college_id=college_id))
+        db.session.add(Customer(full_name="Bob", whatsapp_number="+44 7700 900123", college_id=college_id))
+        db.session.commit()
+
+        rows = pd.DataFrame([{
+            "full_name": "Ann Again", "whatsapp_number": "+20 100 123 4567",
+            "country": "Egypt", "university": "Cairo University", "college": "Engineering",
+        }])
+        assert import_customer_chunks([rows], mode="skip_existing").existing == 1
+
+        lookup = select(Customer.id).where(*phone_prefix_criteria("0100")).compile(
+            db.engine, compile_kwargs={"literal_binds": True}
+        )
+        plan = db.session.execute(text(f"EXPLAIN QUERY PLAN {lookup}")).all()
+        assert "USING COVERING INDEX ix_customer_phone_key" in str(plan)
+
+    for phone, name in (("0100", "Ann"), ("%2B447", "Bob")):
+        customers = admin_client.get(f"/api/filter_customers?phone={phone}").get_json()["customers"]
+        assert [c["full_name"] for c in customers] == [name]
+    admin_client.post("/add_customer", data={"full_name": "Cat", "whatsapp_number": "", "college_id": college_id})
+    with app.app_context():
+        assert db.session.scalars(select(Customer.whatsapp_number).where(Customer.full_name == "Cat")).one() is None
@@ -0,0 +1,42 @@
+import threading
+
+import pytest
+
+from app import db
+from app.models import Country, University
+from app.services.query_fanout import gather
+
+
+def test_gather_runs_queries_on_worker_threads(app):
+    with app.app_context():
+        db.session.add(University(name="Cairo University", country=Country(name="Egypt")))
+        db.session.commit()
+
+        caller = threading.get_ident()
+        results = gather({
+            "universities": lambda: (threading.get_ident(), University.query.count()),
+            "countries": lambda: (threading.get_ident(), [country.name for country in Country.query]),
+        })
+
+    assert results["universities"][1] == 1
+    assert results["countries"][1] == ["Egypt"]
+    assert caller not in {results["universities"][0], results["countries"][0]}
+
+
+def test_gather_reraises_query_errors(app):
+    with app.app_context():
+        with pytest.raises(ZeroDivisionError):
+            gather({"ok": lambda: 1, "broken": lambda: 1 / 0})
+
+
+def test_gather_runs_inline_with_a_single_worker(app):
+    app.config["REPORT_QUERY_WORKERS"] = 1
+    with app.app_context():
+        caller = threading.get_ident()
+        results = gather({"a": threading.get_ident, "b": threading.get_ident})
+    assert results == {"a": caller, "b": caller}
+
+
+def test_dashboard_and_reports_hub_render_with_concurrent_queries(app, admin_client):
+    assert admin_client.get("/").status_code == 200
+    assert admin_client.get("/reports").status_code == 200
@@ -0,0 +1,53 @@
+from app import db
+from app.models import College, Country, Currency, Customer, Subject, TableVersion, University
+from app.services.report_cache import ReportCache
+
+
+def test_lru_is_bounded_by_entries_and_bytes():
+    cache = ReportCache(max_entries=2, max_bytes=10_000)
+    cache.put(("a",), [1])
+    cache.put(("b",), [2])
+    assert cache.get(("a",)) == [1]  # "a" is now the most recently used
+    cache.put(("c",), [3])
+    assert cache.get(("b",)) is None
+    assert len(cache) == 2
+
+    cache.put(("big",), "x" * 9_000)
+    cache.put(("d",), "y" * 2_000)  # Over the byte budget, so the least recently used go first
+    assert [cache.get(("c",)), cache.get(("big",))] == [None, None]
+    assert cache.get(("d",)) == "y" * 2_000
+    assert cache.size_bytes <= 10_000
+
+    cache.put(("huge",), "x" * 20_000)
+    assert cache.get(("huge",)) is None
+
+    cache.put(("list",), [1, 2])
+    copy = cache.get(("list",))
+    copy.append(3)
+    assert cache.get(("list",)) == [1, 2]
+
+
+def test_report_results_are_reused_until_a_write_commits(app, admin_client, add_payment):
+    with app.app_context():
+        college = College(name="Engineering", university=University(name="Cairo University", country=Country(name="Egypt")))
+        subject = Subject(name="Statics", year=1, college=college, currency=Currency.query.first())
+        customer = Customer(full_name="Ann", college=college)
+        db.session.add_all([subject, customer])
+        db.session.commit()
+        subject_id, customer_id = subject.id, customer.id
+        add_payment(subject_id, customer_id, application=40)
+        payment_version = db.session.get(TableVersion, "payment").version
+
+    cache = app.extensions["report_cache"]
+    assert "40.00" in admin_client.get("/application_report").get_data(as_text=True)
+    assert "40.00" in admin_client.get("/application_report").get_data(as_text=True)
+    assert cache.hits == 1
+    admin_client.get("/application_report?year=1")
+    assert cache.misses == 2  # Filters are part of the key
+
+    with app.app_context():
+        add_payment(subject_id, customer_id, application=60)
+        assert db.session.get(TableVersion, "payment").version == payment_version + 1
+
+    assert "100.00" in admin_client.get("/application_report").get_data(as_text=True)
+    assert cache.hits == 1
@@ -0,0 +1,81 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event, text
+
+from app import db
+from app.models import College, Country, Currency, Customer, Instructor, RevenueSummary, Subject, University
+
+
+@pytest.fixture
+def catalogue(app):
+    with app.app_context():
+        college = College(name="Engineering", university=University(name="Cairo University", country=Country(name="Egypt")))
+        instructor = Instructor(name="Dr. Sums")
+        subject = Subject(name="Statics", year=1, college=college, instructor=instructor, currency=Currency.query.first())
+        customer = Customer(full_name="Ann", college=college)
+        db.session.add_all([subject, customer])
+        db.session.commit()
+        return {"subject_id": subject.id, "customer_id": customer.id, "instructor_id": instructor.id}
+
+
+def summary_rows():
+    return [
+        (row.subject_id, row.instructor_id, row.month, row.course_revenue, row.application_revenue,
+         row.payment_count, row.application_payment_count)
+        for row in RevenueSummary.query.order_by(RevenueSummary.month).all()
+    ]
+
+
+def test_summary_follows_payment_inserts_edits_and_deletes(app, catalogue, add_payment):
+    subject_id, instructor_id = catalogue["subject_id"], catalogue["instructor_id"]
+    with app.app_context():
+        first = add_payment(catalogue["subject_id"], catalogue["customer_id"], 100, 20, datetime(2024, 9, 1))
+        second = add_payment(catalogue["subject_id"], catalogue["customer_id"], 50, 0, datetime(2024, 9, 15))
+        assert summary_rows() == [(subject_id, instructor_id, "2024-09", 150.0, 20.0, 2, 1)]
+
+        second.payment_date = datetime(2024, 10, 2)
+        second.course_price_paid = 70
+        db.session.commit()
+        assert summary_rows() == [
+            (subject_id, instructor_id, "2024-09", 100.0, 20.0, 1, 1),
+            (subject_id, instructor_id, "2024-10", 70.0, 0.0, 1, 0),
+        ]
+
+        db.session.delete(first)
+        db.session.get(Subject, subject_id).instructor_id = None
+        db.session.commit()
+        assert summary_rows() == [(subject_id, None, "2024-10", 70.0, 0.0, 1, 0)]
+
+
+def test_rebuild_command_recomputes_summary(app, catalogue, add_payment):
+    with app.app_context():
+        add_payment(catalogue["subject_id"], catalogue["customer_id"], 100, 20, datetime(2024, 9, 1))
+        expected = summary_rows()
+        db.session.query(RevenueSummary).delete()
+        db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=["rebuild-revenue-summary"])
+
+    assert "1 subject/month groups" in result.output
+    with app.app_context():
+        assert summary_rows() == expected
+
+
+def test_deleting_an_instructor_with_payments_keeps_foreign_keys_intact(app, admin_client, catalogue, add_payment):
+    with app.app_context():
+        @event.listens_for(db.engine, "connect")
+        def enforce_foreign_keys(connection, record):
+            connection.execute("PRAGMA foreign_keys=ON")
+
+        db.session.remove()
+        db.engine.dispose()
+        add_payment(catalogue["subject_id"], catalogue["customer_id"], 100, 0, datetime(2024, 9, 1))
+
+    assert admin_client.post(f"/delete_instructor/{catalogue['instructor_id']}").status_code == 302
+
+    with app.app_context():
+        assert db.session.execute(text("PRAGMA foreign_keys")).scalar() == 1
+        assert db.session.get(Instructor, catalogue["instructor_id"]) is None
+        assert summary_rows() == [(catalogue["subject_id"], None, "2024-09", 100.0, 0.0, 1, 0)]
+        event.remove(db.engine, "connect", enforce_foreign_keys)
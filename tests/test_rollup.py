@@ -0,0 +1,32 @@
+from app.services.rollup import build_rollup, structure_path
+
+
+RECORDS = [
+    (("2024", *structure_path("Term 1", None), "Math"), 100, {"id": 1}),
+    (("2024", *structure_path(None, "Module A"), "Physics"), 50, {"id": 2}),
+    (("2024", *structure_path("Term 1", None), "Math"), 25, {"id": 3}),
+    (("2023", *structure_path(None, None), "Chemistry"), 10, {"id": 4}),
+]
+
+
+def test_rollup_totals_every_level_in_one_pass():
+    root = build_rollup(RECORDS)
+
+    assert (root.total, root.count) == (185, 4)
+    assert list(root.children) == ["2024", "2023"]
+    year = root.child("2024")
+    assert (year.total, len(year)) == (175, 2)
+    math = year.child("terms").child("Term 1").child("Math")
+    assert (math.total, math.count, math.distinct("id")) == (125, 2, [1, 3])
+    assert root.child("2023").child("terms").child("General").total == 10
+    assert year.child("modules").child("Module A").child("Physics").sum("id") == 2
+
+
+def test_rollup_can_drop_or_cap_payloads():
+    totals_only = build_rollup(RECORDS, keep_payloads=False)
+    math = totals_only.child("2024").child("terms").child("Term 1").child("Math")
+    assert (math.total, math.payloads) == (125, None)
+
+    capped = build_rollup(RECORDS, payload_limit=1)
+    math = capped.child("2024").child("terms").child("Term 1").child("Math")
+    assert (math.count, math.payloads, math.truncated) == (2, [{"id": 1}], True)
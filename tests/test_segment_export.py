@@ -0,0 +1,77 @@
+import csv
+import io
+
+import pytest
+from sqlalchemy import event
+
+from app import db
+from app.models import College, Country, Currency, Customer, Instructor, Payment, PaymentMethod, Subject, Term, University
+from app.services.segment_export import SEGMENT_HEADER, csv_chunks, iter_segment_rows
+
+
+@pytest.fixture
+def segment(app):
+    with app.app_context():
+        college = College(name="Engineering", university=University(name="Cairo University", country=Country(name="Egypt")))
+        customers = [
+            Customer(full_name=f"Customer {i}", whatsapp_number=f"0100{i}", year=1 + i % 2, college=college)
+            for i in range(3)
+        ]
+        term = Term(name="Term 1", college=college, year=1)
+        subject = Subject(
+            name="Statics", year=1, college=college, term_info=term,
+            instructor=Instructor(name="Dr. Sums"), currency=Currency.query.first(),
+        )
+        db.session.add_all([*customers, subject, Instructor(name="Dr. Idle")])
+        db.session.add(Payment(customer=customers[1], subject=subject, payment_method=PaymentMethod.query.first()))
+        db.session.commit()
+        return {
+            "term_id": term.id,
+            "instructor_id": subject.instructor_id,
+            "idle_instructor_id": Instructor.query.filter_by(name="Dr. Idle").one().id,
+        }
+
+
+def export(client, query=""):
+    response = client.get(f"/api/export_segment_csv?{query}")
+    assert response.is_streamed and response.mimetype == "text/csv"
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True).lstrip("\ufeff"))))
+    assert rows[0] == SEGMENT_HEADER
+    return rows[1:]
+
+
+def test_segment_export_streams_joined_rows(app, admin_client, segment):
+    rows = export(admin_client)
+    assert [row[1] for row in rows] == ["Customer 0", "Customer 1", "Customer 2"]
+    assert rows[0][4:] == ["1", "Engineering", "Cairo University", "Egypt"]
+
+    assert [row[1] for row in export(admin_client, "payment_status=has_paid")] == ["Customer 1"]
+    assert [row[1] for row in export(admin_client, "payment_status=no_payment&year=1")] == ["Customer 0", "Customer 2"]
+    assert [row[1] for row in export(admin_client, f"term_id={segment['term_id']}")] == ["Customer 1"]
+    assert [row[1] for row in export(admin_client, f"instructor_id={segment['instructor_id']}")] == ["Customer 1"]
+    assert export(admin_client, f"instructor_id={segment['idle_instructor_id']}") == []
+
+
+def test_segment_rows_come_from_one_query(app, segment):
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", record)
+        rows = list(iter_segment_rows({}, batch_size=2))
+        event.remove(db.engine, "before_cursor_execute", record)
+    assert len(rows) == 3 and len(statements) == 1
+
+
+def test_csv_chunks_send_the_header_before_reading_rows():
+    def rows():
+        raise AssertionError("rows read before the header was sent")
+        yield
+
+    chunks = csv_chunks(["A", "B"], rows())
+    assert next(chunks) == "\ufeffA,B\r\n"
+
+    chunks = list(csv_chunks(["A"], ([i] for i in range(100)), chunk_bytes=50))
+    assert len(chunks) > 3 and "".join(chunks).count("\r\n") == 101
@@ -0,0 +1,62 @@
+from datetime import datetime
+
+from sqlalchemy import column, select, table
+from sqlalchemy.dialects import postgresql
+
+from app import db
+from app.models import College, Country, Currency, Customer, Payment, PaymentMethod, Subject, University
+from app.services.date_buckets import date_bucket
+
+
+def seed_payments(app):
+    with app.app_context():
+        college = College(name="Engineering", university=University(name="Cairo University", country=Country(name="Egypt")))
+        subject = Subject(name="Statics", year=1, college=college, currency=Currency.query.first())
+        customer = Customer(full_name="Ann", college=college, creation_date=datetime(2024, 8, 20))
+        method = PaymentMethod.query.first()
+        db.session.add_all([
+            Payment(customer=customer, subject=subject, payment_method=method, course_price_paid=course,
+                    application_price_paid=application, payment_date=paid_on)
+            for course, application, paid_on in (
+                (100, 10, datetime(2024, 9, 2, 9)),   # Monday
+                (50, 0, datetime(2024, 9, 8, 18)),    # Sunday of the same ISO week
+                (30, 5, datetime(2024, 11, 15)),
+            )
+        ])
+        db.session.commit()
+
+
+def test_revenue_series_fills_empty_buckets(app, admin_client):
+    seed_payments(app)
+
+    monthly = admin_client.get("/api/timeseries/revenue?bucket=month&start=2024-08-10&end=2024-11-01").get_json()
+    assert monthly["labels"] == ["2024-08-01", "2024-09-01", "2024-10-01", "2024-11-01"]
+    assert monthly["series"] == {
+        "course": [0, 150.0, 0, 30.0],
+        "application": [0, 10.0, 0, 5.0],
+        "total": [0, 160.0, 0, 35.0],
+    }
+
+    quarterly = admin_client.get("/api/timeseries/revenue?bucket=quarter&start=2024-07-01&end=2024-12-31").get_json()
+    assert quarterly["series"]["total"] == [160.0, 35.0]
+
+    weekly = admin_client.get("/api/timeseries/payments?bucket=week&start=2024-09-01&end=2024-09-10").get_json()
+    assert weekly["labels"] == ["2024-08-26", "2024-09-02", "2024-09-09"]
+    assert weekly["series"]["payments"] == [0, 2, 0]
+
+    customers = admin_client.get("/api/timeseries/customers?bucket=day&start=2024-08-19&end=2024-08-21").get_json()
+    assert customers["series"]["customers"] == [0, 1, 0]
+
+
+def test_timeseries_rejects_bad_arguments(app, admin_client):
+    assert admin_client.get("/api/timeseries/refunds").status_code == 404
+    assert admin_client.get("/api/timeseries/revenue?bucket=year").status_code == 400
+    assert admin_client.get("/api/timeseries/revenue?start=soon").status_code == 400
+    assert admin_client.get("/api/timeseries/revenue?bucket=day&start=2000-01-01&end=2024-01-01").status_code == 400
+    assert len(admin_client.get("/api/timeseries/revenue").get_json()["labels"]) == 12
+
+
+def test_date_bucket_uses_date_trunc_on_postgres():
+    payments = table("payment", column("payment_date"))
+    sql = str(select(date_bucket("quarter", payments.c.payment_date)).compile(dialect=postgresql.dialect()))
+    assert "to_char(date_trunc('quarter', payment.payment_date), 'YYYY-MM-DD')" in sql
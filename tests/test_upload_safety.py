@@ -3,9 +3,10 @@ import zipfile
 
 import pytest
 from openpyxl import Workbook
+from sqlalchemy import event
 
 from app import create_app, db
-from app.models import College, Country, Customer, University
+from app.models import College, Country, Customer, ImportJob, University
 from app.upload_utils import MAX_UPLOAD_SIZE
 
 
@@ -101,6 +102,32 @@ def test_upload_rejects_files_over_size_limit(client):
     assert "10 MB" in response.get_data(as_text=True)
 
 
+def test_upload_limit_comes_from_config_and_spool_is_removed(client, app, monkeypatch, tmp_path):
+    spool_dir = tmp_path / "spool"
+    spool_dir.mkdir()
+    monkeypatch.setattr("tempfile.tempdir", str(spool_dir))
+    app.config["IMPORT_MAX_UPLOAD_SIZE"] = 64 * 1024
+
+    response = client.post(
+        "/import_customers",
+        data={"import_file": (io.BytesIO(b"a," * (40 * 1024)), "too_big.csv")},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 413
+    assert "64 KB" in response.get_data(as_text=True)
+
+    csv_content = "full_name,country,university,college\nSpooled,Egypt,Cairo University,Engineering\n"
+    response = client.post(
+        "/import_customers",
+        data={"import_file": (io.BytesIO(csv_content.encode("utf-8")), "customers.csv")},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code in (302, 303)
+    assert list(spool_dir.iterdir()) == []
+    with app.app_context():
+        assert Customer.query.filter_by(full_name="Spooled").count() == 1
+
+
 def test_upload_rejects_disallowed_extension(client):
     response = client.post(
         "/import_customers",
@@ -148,4 +175,158 @@ def test_valid_xlsx_upload_creates_customer(client, app):
     assert response.status_code in (302, 303)
     with app.app_context():
         customer = Customer.query.filter_by(full_name="Alice Example").one()
-        assert customer.whatsapp_number == "123456789"
\ No newline at end of file
+        assert customer.whatsapp_number == "123456789"
+
+def test_csv_import_streams_chunks_as_separate_batches(client, app, monkeypatch):
+    monkeypatch.setattr("app.upload_utils.CHUNK_SIZE", 2)
+    rows = [
+        "full_name,email,whatsapp_number,year,country,university,college",
+        "One,one@example.com,1,1,Egypt,Cairo University,Engineering",
+        "Two,two@example.com,2,1,Egypt,Cairo University,Engineering",
+        "Three,three@example.com,3,1,Egypt,Cairo University,Nowhere",
+        "Four,four@example.com,4,1,Egypt,Cairo University,Engineering",
+        "Five,five@example.com,5,1,Egypt,Cairo University,Engineering",
+    ]
+    customer_batches = []
+
+    def count_customer_inserts(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT INTO customer "):
+            customer_batches.append(statement)
+
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", count_customer_inserts)
+        try:
+            response = client.post(
+                "/import_customers",
+                data=build_csv_payload("\n".join(rows) + "\n"),
+                content_type="multipart/form-data",
+                follow_redirects=True,
+            )
+        finally:
+            event.remove(db.engine, "before_cursor_execute", count_customer_inserts)
+
+    assert response.status_code == 200
+    body = response.get_data(as_text=True)
+    assert "Successfully imported 4 customers. Skipped 1 rows with validation errors." in body
+    assert len(customer_batches) == 3
+    with app.app_context():
+        assert Customer.query.count() == 4
+
+
+@pytest.mark.parametrize("extra_row, status", [
+    ("Four,four@example.com,4,1,Egypt,Cairo University,Engineering", 413),
+    ('Four,four@example.com,4,1,Egypt,Cairo University,"Engineering', 400),
+])
+def test_rejected_file_stores_none_of_its_rows(client, app, monkeypatch, extra_row, status):
+    monkeypatch.setattr("app.upload_utils.CHUNK_SIZE", 2)
+    app.config["IMPORT_MAX_ROWS"] = 3
+    rows = [
+        "full_name,email,whatsapp_number,year,country,university,college",
+        "One,one@example.com,1,1,Egypt,Cairo University,Engineering",
+        "Two,two@example.com,2,1,Egypt,Cairo University,Engineering",
+        extra_row,
+    ]
+    if status == 400:
+        app.config["IMPORT_MAX_ROWS"] = 100
+    else:
+        rows.append("Five,five@example.com,5,1,Egypt,Cairo University,Engineering")
+
+    response = client.post(
+        "/import_customers",
+        data=build_csv_payload("\n".join(rows) + "\n"),
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == status
+    with app.app_context():
+        assert Customer.query.count() == 0
+        assert ImportJob.query.one().status == "failed"
+
+
+def test_import_errors_are_kept_server_side(client, app):
+    payload = (
+        "full_name,email,whatsapp_number,year,country,university,college\n"
+        "Good Row,good@example.com,1,1,Egypt,Cairo University,Engineering\n"
+        ",nameless@example.com,2,1,Egypt,Cairo University,Engineering\n"
+        "Lost Row,lost@example.com,3,1,Egypt,Cairo University,Medicine\n"
+    )
+    response = client.post(
+        "/import_customers",
+        data=build_csv_payload(payload),
+        content_type="multipart/form-data",
+        follow_redirects=False,
+    )
+    assert response.status_code in (302, 303)
+    with client.session_transaction() as session:
+        assert len(session["_flashes"]) == 1
+
+    with app.app_context():
+        job = ImportJob.query.one()
+    assert f"job_id={job.id}" in response.headers["Location"]
+
+    report = client.get(f"/imports/{job.id}/report")
+    assert report.status_code == 200
+    assert "Missing required full_name value." in report.get_data(as_text=True)
+
+    export = client.get(f"/imports/{job.id}/errors.csv")
+    lines = export.get_data(as_text=True).lstrip("\ufeff").splitlines()
+    assert lines[0] == "Row,Error"
+    assert lines[1] == "3,Missing required full_name value."
+    assert lines[2].startswith("4,Could not find College 'Medicine'")
+
+
+@pytest.mark.parametrize(
+    "mode, expected_names, summary",
+    [
+        ("skip_existing", {"Old Name", "Fresh"}, "Successfully imported 1 customers. Skipped 2 customers that already exist."),
+        ("update_existing", {"Renamed", "Fresh Again"}, "Successfully imported 1 customers. Updated 1 existing customers. Skipped 1 customers that already exist."),
+    ],
+)
+def test_import_modes_match_existing_customers(client, app, mode, expected_names, summary):
+    with app.app_context():
+        college = College.query.one()
+        db.session.add(Customer(full_name="Old Name", email="Old@Example.com", whatsapp_number="010 123", year=1, college_id=college.id))
+        db.session.commit()
+
+    payload = (
+        "full_name,email,whatsapp_number,year,country,university,college\n"
+        "Renamed,old@example.com,,3,Egypt,Cairo University,Engineering\n"
+        "Fresh,fresh@example.com,020,1,Egypt,Cairo University,Engineering\n"
+        "Fresh Again,FRESH@example.com,,1,Egypt,Cairo University,Engineering\n"
+    )
+    data = build_csv_payload(payload)
+    data["import_mode"] = mode
+    response = client.post("/import_customers", data=data, content_type="multipart/form-data", follow_redirects=True)
+
+    assert response.status_code == 200
+    assert summary in response.get_data(as_text=True)
+    with app.app_context():
+        customers = Customer.query.all()
+        assert {customer.full_name for customer in customers} == expected_names
+        # Matched on the case-insensitive email; blank cells never clear stored values.
+        old = next(c for c in customers if c.whatsapp_number == "010 123")
+        assert old.year == (3 if mode == "update_existing" else 1)
+
+
+def test_same_file_uploaded_twice_is_not_imported_again(client, app):
+    payload = (
+        "full_name,email,whatsapp_number,year,country,university,college\n"
+        "Once Only,once@example.com,777,1,Egypt,Cairo University,Engineering\n"
+    )
+    first = client.post("/import_customers", data=build_csv_payload(payload), content_type="multipart/form-data")
+    assert first.status_code in (302, 303)
+
+    again = client.post(
+        "/import_customers", data=build_csv_payload(payload), content_type="multipart/form-data", follow_redirects=True
+    )
+    assert again.status_code == 200
+    assert "was already imported" in again.get_data(as_text=True)
+    with app.app_context():
+        assert Customer.query.filter_by(full_name="Once Only").count() == 1
+        assert ImportJob.query.count() == 1
+
+    data = build_csv_payload(payload)
+    data["confirm_duplicate"] = "1"
+    confirmed = client.post("/import_customers", data=data, content_type="multipart/form-data")
+    assert confirmed.status_code in (302, 303)
+    with app.app_context():
+        assert Customer.query.filter_by(full_name="Once Only").count() == 2
@@ -0,0 +1,107 @@
+import io
+import os
+import time
+from datetime import datetime, timedelta, UTC
+
+import pytest
+from openpyxl import load_workbook
+
+from app import db
+from app.models import (
+    College, Country, Currency, Customer, ExportJob, Instructor, Payment, PaymentMethod, Subject, University,
+)
+from app.services.xlsx_export import PAYMENT_HEADER, XLSX_MIMETYPE
+
+
+@pytest.fixture
+def seeded(app, tmp_path):
+    app.config.update(EXPORT_FOLDER=str(tmp_path / "exports"))
+    with app.app_context():
+        college = College(name="Engineering", university=University(name="Cairo University", country=Country(name="Egypt")))
+        instructor = Instructor(name="Dr. Sums")
+        subject = Subject(name="Statics", year=1, college=college, instructor=instructor, currency=Currency.query.first())
+        cash, visa = PaymentMethod.query.filter(PaymentMethod.name.in_(["Cash", "Visa"])).order_by(PaymentMethod.name).all()
+        ann = Customer(full_name="=Ann", whatsapp_number="0100", year=1, college=college)
+        bob = Customer(full_name="Bob", whatsapp_number="0101", year=1, college=college)
+        db.session.add_all([
+            Payment(customer=ann, subject=subject, payment_method=cash, course_price_paid=100,
+                    application_price_paid=20, payment_date=datetime(2024, 9, 1, 10)),
+            Payment(customer=bob, subject=subject, payment_method=visa, course_price_paid=150,
+                    payment_date=datetime(2024, 9, 2, 18)),
+        ])
+        db.session.commit()
+        return {"instructor_id": instructor.id, "cash_id": cash.id}
+
+
+def sheet_rows(data):
+    sheet = load_workbook(io.BytesIO(data), read_only=True).active
+    return [list(row) for row in sheet.iter_rows(values_only=True)]
+
+
+def download(client, url):
+    response = client.get(url)
+    assert response.status_code == 200 and response.mimetype == XLSX_MIMETYPE
+    return sheet_rows(response.get_data())
+
+
+def test_reports_and_segments_export_as_xlsx(admin_client, seeded):
+    response = admin_client.get(f"/exports/instructor_report.xlsx?instructor_id={seeded['instructor_id']}")
+    rows = sheet_rows(response.get_data())
+    assert rows[0] == PAYMENT_HEADER
+    assert [row[2] for row in rows[1:]] == ["Bob", "=Ann"]  # newest first
+    assert load_workbook(io.BytesIO(response.get_data())).active["C3"].data_type == "s"  # not a formula
+    assert rows[2][1] == datetime(2024, 9, 1, 10) and rows[2][10:] == [100, 20, 120, "Cash"]
+
+    applications = download(admin_client, "/exports/application_report.xlsx?year=1")
+    assert [row[2] for row in applications[1:]] == ["=Ann"]
+
+    payments = download(admin_client, f"/exports/payments.xlsx?date_from=2024-09-01&date_to=2024-09-01&method_id={seeded['cash_id']}")
+    assert len(payments) == 2
+    assert len(download(admin_client, "/exports/payments.xlsx?date_from=2024-09-02&date_to=not-a-date")) == 2
+
+    segment = download(admin_client, "/exports/segment.xlsx?payment_status=has_paid")
+    assert [row[1] for row in segment[1:]] == ["=Ann", "Bob"]
+
+    assert admin_client.get("/exports/instructor_report.xlsx").status_code == 400
+    assert admin_client.get("/exports/passwords.xlsx").status_code == 404
+
+
+def wait_for_job(client, status_url, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(status_url).get_json()
+        if job["status"] in ("completed", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError("export job did not finish in time")
+
+
+def test_large_exports_are_written_in_the_background(app, admin_client, seeded):
+    app.config.update(XLSX_BACKGROUND_CELLS=len(PAYMENT_HEADER))
+
+    response = admin_client.get("/exports/payments.xlsx")
+    assert response.status_code == 302
+    page = admin_client.get(response.headers["Location"])
+    assert page.status_code == 200 and "payments_" in page.get_data(as_text=True)
+
+    job_id = int(response.headers["Location"].rstrip("/").rsplit("/", 1)[1])
+    job = wait_for_job(admin_client, f"/exports/jobs/{job_id}")
+    assert job["status"] == "completed" and job["rows_written"] == 2
+
+    download_response = admin_client.get(job["download_url"])
+    assert download_response.mimetype == XLSX_MIMETYPE
+    assert [row[2] for row in sheet_rows(download_response.get_data())[1:]] == ["Bob", "=Ann"]
+
+    # A single row still fits under the threshold and downloads directly.
+    assert len(download(admin_client, f"/exports/payments.xlsx?method_id={seeded['cash_id']}")) == 2
+
+    # Files past their retention are removed when the next large export is queued.
+    with app.app_context():
+        finished = db.session.get(ExportJob, job_id)
+        stored_path = finished.stored_path
+        finished.finished_at = datetime.now(UTC) - timedelta(seconds=app.config["EXPORT_RETENTION_SECONDS"] + 60)
+        db.session.commit()
+    assert admin_client.get("/exports/payments.xlsx").status_code == 302
+    assert not os.path.exists(stored_path)
+    assert admin_client.get(f"/exports/jobs/{job_id}").get_json()["download_url"] is None
+    assert admin_client.get(job["download_url"]).status_code == 404
@@ -0,0 +1,162 @@
+import io
+import zipfile
+from datetime import datetime
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell.rich_text import CellRichText, TextBlock
+from openpyxl.cell.text import InlineFont
+
+from app import upload_utils
+from app.xlsx_reader import UnsupportedWorkbook
+
+
+def build_workbook_bytes() -> bytes:
+    workbook = Workbook()
+    sheet = workbook.active
+    workbook.create_sheet("Notes", 0).append(["ignored"])
+    workbook.active = sheet  # Not the first sheet, so the reader must follow activeTab
+    sheet.append(["full_name", "year", "score", "joined", "active", "note", None, "full_name"])
+    sheet.append(["Alice", 1, 2.5, datetime(2024, 9, 1, 8, 30), True, "=cmd|calc", "x", "Alice B"])
+    sheet.append([None] * 8)
+    sheet.append([CellRichText(["Bo", TextBlock(InlineFont(b=True), "b")]), 2, None, None, False, None, None, None])
+    sheet.append([None, None, None, None, None, None, "only unnamed", None])
+    sheet["C5"] = "=1+1"
+    sheet.append(["  Carol ", "3", 4, datetime(2023, 1, 2), None, "", None, None])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def build_shared_strings_package() -> bytes:
+    """A minimal package laid out the way Excel saves it: shared strings and a custom date style."""
+
+    main = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+    rels = 'xmlns="http://schemas.openxmlformats.org/package/2006/relationships"'
+    doc_rel = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+    parts = {
+        "[Content_Types].xml": (
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/worksheets/data.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            '<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+            '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+            "</Types>"
+        ),
+        "_rels/.rels": (
+            f'<Relationships {rels}><Relationship Id="rId1" Type="{doc_rel}/officeDocument" Target="xl/workbook.xml"/></Relationships>'
+        ),
+        "xl/workbook.xml": (
+            f'<workbook {main} xmlns:r="{doc_rel}"><sheets><sheet name="Data" sheetId="1" r:id="rId1"/></sheets></workbook>'
+        ),
+        "xl/_rels/workbook.xml.rels": (
+            f'<Relationships {rels}>'
+            f'<Relationship Id="rId1" Type="{doc_rel}/worksheet" Target="/xl/worksheets/data.xml"/>'
+            f'<Relationship Id="rId2" Type="{doc_rel}/sharedStrings" Target="sharedStrings.xml"/>'
+            f'<Relationship Id="rId3" Type="{doc_rel}/styles" Target="styles.xml"/>'
+            "</Relationships>"
+        ),
+        "xl/sharedStrings.xml": (
+            f'<sst {main}><si><t>full_name</t></si><si><t>paid_on</t></si><si><t>amount</t></si>'
+            '<si><r><t>Dina </t></r><r><t>Ali</t></r><rPh sb="0" eb="1"><t>x</t></rPh></si></sst>'
+        ),
+        "xl/styles.xml": (
+            f'<styleSheet {main}><numFmts count="1"><numFmt numFmtId="164" formatCode="dd/mm/yyyy"/></numFmts>'
+            '<cellXfs count="2"><xf numFmtId="0"/><xf numFmtId="164"/></cellXfs></styleSheet>'
+        ),
+        "xl/worksheets/data.xml": (
+            f'<worksheet {main}><sheetData>'
+            '<row r="1"><c r="A1" t="s"><v>0</v></c><c r="B1" t="s"><v>1</v></c><c r="C1" t="s"><v>2</v></c></row>'
+            '<row r="2"><c r="A2" t="s"><v>3</v></c><c r="B2" s="1"><v>45536</v></c><c r="C2"><v>1.5E3</v></c></row>'
+            '<row r="4"><c r="A4" t="str"><v>Eve</v></c><c r="C4" t="e"><v>#N/A</v></c></row>'
+            "</sheetData></worksheet>"
+        ),
+    }
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, content in parts.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+def read_with_openpyxl(data: bytes):
+    workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    return list(upload_utils._read_xlsx_chunks(workbook))
+
+
+def test_streaming_xlsx_reader_matches_openpyxl(monkeypatch):
+    monkeypatch.setattr(upload_utils, "CHUNK_SIZE", 2)
+    data = build_workbook_bytes()
+
+    fast = list(upload_utils._iter_xlsx_chunks(data))
+    expected = read_with_openpyxl(data)
+
+    assert len(fast) == len(expected) == 2
+    for got, want in zip(fast, expected):
+        pd.testing.assert_frame_equal(got, want)
+    # A repeated header keeps its first position but reads the later column.
+    assert fast[0].loc[0, "full_name"] == "Alice B"
+    assert fast[0].loc[0, "joined"] == pd.Timestamp(2024, 9, 1, 8, 30)
+    assert list(fast[0].index) == [0, 2]
+    assert list(fast[1].index) == [3, 4]
+
+
+@pytest.mark.filterwarnings("ignore:Workbook contains no default style")
+def test_streaming_xlsx_reader_resolves_shared_strings_and_date_styles():
+    data = build_shared_strings_package()
+
+    fast = list(upload_utils._iter_xlsx_chunks(data))
+    expected = read_with_openpyxl(data)
+
+    assert len(fast) == len(expected) == 1
+    pd.testing.assert_frame_equal(fast[0], expected[0])
+    assert fast[0].loc[0].tolist() == ["Dina Ali", pd.Timestamp(2024, 9, 1), 1500.0]
+    assert list(fast[0].index) == [0, 2]
+
+
+def test_unusual_workbooks_fall_back_to_openpyxl(monkeypatch):
+    archives = []
+
+    def unsupported(archive):
+        archives.append(archive)
+        raise UnsupportedWorkbook("strict OOXML")
+
+    monkeypatch.setattr(upload_utils, "open_active_sheet", unsupported)
+    data = build_workbook_bytes()
+
+    frame = pd.concat(list(upload_utils._iter_xlsx_chunks(data)))
+
+    assert archives[0].fp is None  # The streaming reader's archive was closed
+    assert list(frame.index) == [0, 2, 3, 4]
+    assert frame.loc[4, "year"] == "3"
+
+
+def test_sheets_over_the_row_cap_are_rejected_before_the_first_chunk(monkeypatch):
+    monkeypatch.setattr(upload_utils, "CHUNK_SIZE", 1)
+    monkeypatch.setattr(upload_utils, "MAX_ROWS", 3)
+
+    chunks = upload_utils._iter_xlsx_chunks(build_workbook_bytes())
+
+    with pytest.raises(upload_utils.UploadTooLargeError):
+        next(chunks)
+
+
+def test_malformed_workbook_parts_are_rejected_as_parse_errors():
+    source = zipfile.ZipFile(io.BytesIO(build_workbook_bytes()))
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as target:
+        for item in source.infolist():
+            data = source.read(item)
+            if item.filename == "xl/workbook.xml":
+                data = data.replace(b'activeTab="1"', b'activeTab="second"')
+            target.writestr(item, data)
+    assert b"second" in zipfile.ZipFile(buffer).read("xl/workbook.xml")
+
+    with pytest.raises(upload_utils.UploadError) as excinfo:
+        list(upload_utils._iter_xlsx_chunks(buffer.getvalue()))
+
+    assert excinfo.value.status_code == 400
+    assert "Failed to parse XLSX" in str(excinfo.value)
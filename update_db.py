@@ -12,6 +12,57 @@ try:
 except Exception as e:
     print(f"Column might already exist: {e}")
 
+# Indexes used by the skip/update customer import modes
+for statement in (
+    'CREATE INDEX IF NOT EXISTS ix_customer_whatsapp_number ON customer (whatsapp_number)',
+    'CREATE INDEX IF NOT EXISTS ix_customer_email_lower ON customer (lower(email))',
+):
+    cursor.execute(statement)
+print("✅ Customer lookup indexes ready!")
+
+# Content hash used to recognise re-uploaded import files
+try:
+    cursor.execute('ALTER TABLE import_job ADD COLUMN content_hash VARCHAR(64)')
+    print("✅ Added import_job.content_hash column!")
+except Exception as e:
+    print(f"Column might already exist: {e}")
+cursor.execute('CREATE INDEX IF NOT EXISTS ix_import_job_user_hash ON import_job (user_id, content_hash)')
+
+# Progress time used to recognise imports orphaned by a worker restart
+try:
+    cursor.execute('ALTER TABLE import_job ADD COLUMN progress_at DATETIME')
+    print("✅ Added import_job.progress_at column!")
+except Exception as e:
+    print(f"Column might already exist: {e}")
+
+# Date indexes used by the time-series reports
+for statement in (
+    'CREATE INDEX IF NOT EXISTS ix_payment_payment_date ON payment (payment_date)',
+    'CREATE INDEX IF NOT EXISTS ix_customer_creation_date ON customer (creation_date)',
+):
+    cursor.execute(statement)
+print("✅ Time-series date indexes ready!")
+
+# Per-customer indexes used by the paged customer profile sections
+for statement in (
+    'CREATE INDEX IF NOT EXISTS ix_payment_customer_date ON payment (customer_id, payment_date)',
+    'CREATE INDEX IF NOT EXISTS ix_comm_log_customer_date ON communication_log (customer_id, creation_date)',
+):
+    cursor.execute(statement)
+print("✅ Customer profile indexes ready!")
+
+# Default sort of the paged customer list
+cursor.execute('CREATE INDEX IF NOT EXISTS ix_customer_full_name_id ON customer (full_name, id)')
+
+# Normalised phone key; run `flask backfill-phone-keys` once to fill it
+try:
+    cursor.execute('ALTER TABLE customer ADD COLUMN phone_key VARCHAR(24)')
+    print("✅ Added customer.phone_key column!")
+except Exception as e:
+    print(f"Column might already exist: {e}")
+cursor.execute('CREATE INDEX IF NOT EXISTS ix_customer_phone_key ON customer (phone_key, college_id)')
+cursor.execute('DROP INDEX IF EXISTS ix_customer_whatsapp_number')
+
 # Make first user admin
 cursor.execute('UPDATE user SET role = "admin" WHERE id = (SELECT MIN(id) FROM user)')
 conn.commit()